@@ -0,0 +1,14 @@
+#!/usr/bin/python
+# append-overlay.py is kept for existing callers, the tool is buildtools/append_overlay.py
+# and is also run as:
+#   build-tools append-overlay [args ...]
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+import buildtools  # noqa: E402
+
+if __name__ == "__main__":
+    buildtools.run('append-overlay', sys.argv)
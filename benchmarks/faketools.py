@@ -0,0 +1,315 @@
+"""Deterministic local stand-ins for the external tools the build tools run (npm, semver, rsync and git).
+
+install() writes one small executable per tool into a bin directory, putting that directory first on PATH makes the
+build tools run the stand-ins instead of the real tools so packaging can be benchmarked offline on a clean machine.
+Every stand-in reads fake-tools.json from its bin directory (or the file named by $FAKE_TOOLS_CONFIG), a section per
+tool (and "default" for every tool) sets:
+
+    latency   seconds to sleep before doing anything (default 0)
+    stdout    text written to stdout
+    exit      exit code, a non zero code skips the work of the tool (default 0)
+
+and the tool specific settings documented on the run_* functions.  Every invocation is appended to fake-tools.log
+in the bin directory as a json line so a benchmark can check which tools ran and how often.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import time
+
+TOOLS = ['npm', 'semver', 'rsync', 'git']
+CONFIG_FILE = 'fake-tools.json'
+LOG_FILE = 'fake-tools.log'
+
+# the resolved url of a yarn.lock entry, https://registry.yarnpkg.com/<name>/-/<name>-<version>.tgz#<sha1>
+RESOLVED_RE = re.compile(r'resolved\s+"?\S*/-/(.+)-(\d+\.\d+\.\d+)\.tgz#([0-9a-f]{40})"?\s*$')
+
+WRAPPER = '''#!{python}
+# {tool} stand-in written by benchmarks/faketools.py
+import sys
+sys.path.insert(0, {benchmarks_dir!r})
+import faketools  # noqa: E402
+faketools.main({tool!r}, sys.argv)
+'''
+
+
+def install(bin_dir, config=None):
+    """Write the stand-ins and their config into bin_dir, returns bin_dir.
+
+    The stand-ins are run with the current interpreter so they work without a python on PATH.
+    """
+    if not os.path.isdir(bin_dir):
+        os.makedirs(bin_dir)
+    for tool in TOOLS:
+        path = os.path.join(bin_dir, tool)
+        with open(path, 'w') as f:
+            f.write(WRAPPER.format(python=sys.executable, tool=tool,
+                                   benchmarks_dir=os.path.dirname(os.path.realpath(__file__))))
+        os.chmod(path, 0o755)
+    with open(os.path.join(bin_dir, CONFIG_FILE), 'w') as f:
+        json.dump(config or {}, f, indent=2, sort_keys=True, separators=(',', ': '))
+    return bin_dir
+
+
+def environment(bin_dir, env=None):
+    """Return a copy of env (default os.environ) with bin_dir first on PATH."""
+    env = dict(os.environ if env is None else env)
+    env['PATH'] = bin_dir + os.pathsep + env.get('PATH', '')
+    return env
+
+
+def read_log(bin_dir):
+    """Return the logged invocations of the stand-ins in bin_dir."""
+    path = os.path.join(bin_dir, LOG_FILE)
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def call_counts(bin_dir):
+    """Return a dict of tool name to the number of times it ran."""
+    counts = dict((tool, 0) for tool in TOOLS)
+    for entry in read_log(bin_dir):
+        counts[entry['tool']] = counts.get(entry['tool'], 0) + 1
+    return counts
+
+
+def load_config(bin_dir, tool):
+    """Return the settings of tool, the "default" section updated with the section of the tool."""
+    path = os.environ.get('FAKE_TOOLS_CONFIG') or os.path.join(bin_dir, CONFIG_FILE)
+    config = {}
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            config = json.load(f)
+    settings = dict(config.get('default', {}))
+    settings.update(config.get(tool, {}))
+    return settings
+
+
+def deterministic_bytes(seed, size):
+    """Return size bytes derived from seed, the same seed always gives the same bytes."""
+    chunks = []
+    counter = 0
+    while size > 0:
+        chunk = hashlib.sha256('{}:{}'.format(seed, counter)).digest()[:size]
+        chunks.append(chunk)
+        size -= len(chunk)
+        counter += 1
+    return ''.join(chunks)
+
+
+def lock_entries(lockfile):
+    """Return the (name, version, hash) of every resolved package in a yarn.lock."""
+    found = []
+    if not os.path.isfile(lockfile):
+        return found
+    with open(lockfile, 'r') as f:
+        for line in f:
+            match = RESOLVED_RE.search(line.strip())
+            if match is not None:
+                found.append(match.groups())
+    return found
+
+
+def run_npm(args, settings):
+    """npm run <script> [--target_arch=...]
+
+    Every package in yarn.lock is "fetched" into $YARN_CACHE_FOLDER (when set) unless it is already there and
+    installed into node_modules.  "build" also writes dist/bundle.js, the lib/*.js files followed by output_size
+    (default 0) deterministic bytes, like a bundler would.
+    """
+    scripts = [arg for arg in args if not arg.startswith('-')]
+    if len(scripts) != 2 or scripts[0] != 'run':
+        sys.stderr.write('fake npm: only "npm run <script>" is supported\n')
+        return 1
+    script = scripts[1]
+
+    cache_dir = os.environ.get('YARN_CACHE_FOLDER')
+    for name, version, package_hash in lock_entries('yarn.lock'):
+        package_dir = os.path.join('node_modules', name)
+        if cache_dir:
+            entry = os.path.join(cache_dir, 'v6', 'npm-{}-{}-{}-integrity'.format(name, version, package_hash))
+            if not os.path.isdir(entry):
+                os.makedirs(os.path.join(entry, 'node_modules', name))
+                with open(os.path.join(entry, 'node_modules', name, 'index.js'), 'w') as f:
+                    f.write('module.exports = {!r};\n'.format(package_hash))
+            if os.path.isdir(package_dir):
+                shutil.rmtree(package_dir)
+            shutil.copytree(os.path.join(entry, 'node_modules', name), package_dir)
+        elif not os.path.isdir(package_dir):
+            os.makedirs(package_dir)
+            with open(os.path.join(package_dir, 'index.js'), 'w') as f:
+                f.write('module.exports = {!r};\n'.format(package_hash))
+
+    if script == 'build':
+        if not os.path.isdir('dist'):
+            os.makedirs('dist')
+        with open(os.path.join('dist', 'bundle.js'), 'wb') as bundle:
+            if os.path.isdir('lib'):
+                for name in sorted(os.listdir('lib')):
+                    if name.endswith('.js'):
+                        with open(os.path.join('lib', name), 'rb') as f:
+                            shutil.copyfileobj(f, bundle)
+            bundle.write(deterministic_bytes(os.path.basename(os.getcwd()), int(settings.get('output_size', 0))))
+    return 0
+
+
+def parse_version(version):
+    """Return the (major, minor, patch) of a version, None if it is not a version."""
+    match = re.match(r'^v?(\d+)\.(\d+)\.(\d+)(?:[-+].*)?$', version.strip())
+    if match is None:
+        return None
+    return tuple(int(part) for part in match.groups())
+
+
+def comparator_matches(comparator, version):
+    """Check version against one comparator of a range (^1.2.3, ~1.2, >=1.0.0, 1.x, *, ...)."""
+    match = re.match(r'^(\^|~|>=|<=|>|<|=)?v?(\*|x|\d+)(?:\.(\*|x|\d+))?(?:\.(\*|x|\d+))?(?:[-+].*)?$', comparator)
+    if match is None:
+        raise ValueError('Invalid comparator ' + comparator)
+    operator = match.group(1) or '='
+    parts = []
+    for part in match.groups()[1:]:
+        if part is None or part in ['*', 'x']:
+            break
+        parts.append(int(part))
+    if not parts:
+        return operator in ['=', '>=', '<=']
+    lower = tuple(parts + [0] * (3 - len(parts)))
+    if operator == '^':
+        # the first non zero part may not change
+        index = next((i for i, part in enumerate(parts) if part != 0), len(parts) - 1)
+        upper = tuple(parts[:index]) + (parts[index] + 1,) + (0,) * (2 - index)
+        return lower <= version < upper
+    if operator == '~':
+        index = 1 if len(parts) > 1 else 0
+        upper = tuple(parts[:index]) + (parts[index] + 1,) + (0,) * (2 - index)
+        return lower <= version < upper
+    if operator == '=':
+        if len(parts) == 3:
+            return version == lower
+        upper = tuple(parts[:-1]) + (parts[-1] + 1,) + (0,) * (3 - len(parts))
+        return lower <= version < upper
+    return {'>=': version >= lower, '<=': version <= lower, '>': version > lower, '<': version < lower}[operator]
+
+
+def range_matches(version_range, version):
+    """Check version against a range, alternatives are separated by || and the comparators of one by spaces."""
+    for alternative in version_range.split('||'):
+        comparators = alternative.split()
+        if all(comparator_matches(comparator, version) for comparator in comparators):
+            return True
+    return False
+
+
+def run_semver(args, settings):
+    """semver [-r <range>] <version> ...
+
+    Prints the versions that are valid (and satisfy the range), exits 1 when none do like the semver cli.
+    """
+    version_range = None
+    versions = []
+    index = 0
+    while index < len(args):
+        if args[index] in ['-r', '--range']:
+            version_range = args[index + 1]
+            index += 2
+        else:
+            versions.append(args[index])
+            index += 1
+    matching = []
+    for version in versions:
+        parsed = parse_version(version)
+        try:
+            if parsed is not None and (version_range is None or range_matches(version_range, parsed)):
+                matching.append('.'.join(str(part) for part in parsed))
+        except ValueError:
+            # an invalid range matches nothing
+            return 1
+    for version in matching:
+        print version
+    return 0 if matching else 1
+
+
+def copy_into(src, dst):
+    """Copy the contents of directory src into directory dst, keeping existing files in dst that src lacks."""
+    if os.path.realpath(src) == os.path.realpath(dst):
+        return
+    if not os.path.isdir(dst):
+        os.makedirs(dst)
+    for name in os.listdir(src):
+        src_path = os.path.join(src, name)
+        dst_path = os.path.join(dst, name)
+        if os.path.isdir(src_path) and not os.path.islink(src_path):
+            copy_into(src_path, dst_path)
+        else:
+            if os.path.lexists(dst_path):
+                os.remove(dst_path)
+            if os.path.islink(src_path):
+                os.symlink(os.readlink(src_path), dst_path)
+            else:
+                shutil.copy2(src_path, dst_path)
+
+
+def run_rsync(args, settings):
+    """rsync [options] <src> ... <dst>
+
+    Options are ignored (every copy is recursive and keeps modes and times like -a), a source ending in / copies the
+    contents of the directory, without it the directory itself.
+    """
+    paths = [arg for arg in args if not arg.startswith('-')]
+    if len(paths) < 2:
+        sys.stderr.write('fake rsync: need a source and a destination\n')
+        return 1
+    dst = paths[-1]
+    for src in paths[:-1]:
+        if not os.path.exists(src):
+            sys.stderr.write('fake rsync: {} does not exist\n'.format(src))
+            return 23
+        if os.path.isdir(src):
+            copy_into(src, dst if src.endswith('/') else os.path.join(dst, os.path.basename(src)))
+        else:
+            if not os.path.isdir(dst):
+                os.makedirs(dst)
+            shutil.copy2(src, dst)
+    return 0
+
+
+def run_git(args, settings):
+    """git rev-parse [--short|--abbrev-ref] HEAD
+
+    The commit hash is the "hash" setting, by default derived from the name of the current directory so every
+    module gets its own stable hash.  The branch is the "branch" setting (default master).
+    """
+    if len(args) < 2 or args[0] != 'rev-parse' or args[-1] != 'HEAD':
+        sys.stderr.write('fake git: only "git rev-parse [--short|--abbrev-ref] HEAD" is supported\n')
+        return 1
+    commit = settings.get('hash') or hashlib.sha1(os.path.basename(os.getcwd())).hexdigest()
+    if '--abbrev-ref' in args:
+        print settings.get('branch', 'master')
+    elif '--short' in args:
+        print commit[:7]
+    else:
+        print commit
+    return 0
+
+
+def main(tool, argv):
+    bin_dir = os.path.dirname(os.path.abspath(argv[0]))
+    settings = load_config(bin_dir, tool)
+    start = time.time()
+    time.sleep(float(settings.get('latency', 0)))
+    if 'stdout' in settings:
+        sys.stdout.write(settings['stdout'])
+    ret = int(settings.get('exit', 0))
+    if ret == 0:
+        ret = globals()['run_' + tool](argv[1:], settings)
+    sys.stdout.flush()
+    with open(os.path.join(bin_dir, LOG_FILE), 'a') as log:
+        log.write(json.dumps({'tool': tool, 'args': argv[1:], 'cwd': os.getcwd(), 'exit': ret,
+                              'duration': round(time.time() - start, 4)}) + '\n')
+    sys.exit(ret)
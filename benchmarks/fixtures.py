@@ -0,0 +1,248 @@
+"""Generators for synthetic module trees, bases, overlays and RSA keypairs used to benchmark the build tools.
+
+Everything is derived from a seed so the same arguments always produce the same files (and the same keys), this
+keeps benchmark runs comparable and lets a run check its outputs against an earlier one.  File contents are either
+"random" (incompressible, like images and binaries) or "text" (compressible, like javascript sources).
+"""
+import hashlib
+import json
+import os
+import tarfile
+
+BLOCK_SIZE = 1024 * 1024
+MAX_FILES_PER_DIR = 1000
+TEXT_LINE = 'module.exports.value{0} = function value{0}() {{ return {0} * 31 + 7; }};\n'
+
+
+class DeterministicRandom(object):
+    """A stream of bytes derived from a seed, usable as the randfunc of Crypto.PublicKey.RSA.generate."""
+
+    def __init__(self, seed):
+        self.seed = seed
+        self.counter = 0
+        self.buffer = ''
+
+    def __call__(self, size):
+        digests = [self.buffer]
+        missing = size - len(self.buffer)
+        while missing > 0:
+            digests.append(hashlib.sha256('{}:{}'.format(self.seed, self.counter)).digest())
+            self.counter += 1
+            missing -= len(digests[-1])
+        self.buffer = ''.join(digests)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+_blocks = {}
+
+
+def _block(seed, kind):
+    """Return the BLOCK_SIZE bytes every file of a seed and kind is cut from."""
+    if (seed, kind) not in _blocks:
+        if kind == 'random':
+            block = DeterministicRandom(seed)(BLOCK_SIZE)
+        elif kind == 'text':
+            lines = []
+            length = 0
+            while length < BLOCK_SIZE:
+                lines.append(TEXT_LINE.format(len(lines)))
+                length += len(lines[-1])
+            block = ''.join(lines)[:BLOCK_SIZE]
+        else:
+            raise ValueError('Unknown content kind ' + kind)
+        _blocks[(seed, kind)] = block
+    return _blocks[(seed, kind)]
+
+
+def write_file(path, size, seed, kind='random'):
+    """Write size bytes of content to path, the start offset into the seed's block depends on the path."""
+    block = _block(seed, kind)
+    offset = int(hashlib.md5(path).hexdigest()[:8], 16) % BLOCK_SIZE
+    with open(path, 'wb') as f:
+        while size > 0:
+            chunk = block[offset:offset + size]
+            f.write(chunk)
+            size -= len(chunk)
+            offset = 0
+
+
+def _write_json(path, data):
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True, separators=(',', ': '))
+
+
+def write_payload(directory, files, file_size, seed, kind='random', extension='.bin'):
+    """Write files files of file_size bytes under directory, at most MAX_FILES_PER_DIR per sub directory.
+
+    Returns the number of bytes written.
+    """
+    for index in range(files):
+        subdir = os.path.join(directory, 'd{:03d}'.format(index // MAX_FILES_PER_DIR)) \
+            if files > MAX_FILES_PER_DIR else directory
+        if not os.path.isdir(subdir):
+            os.makedirs(subdir)
+        write_file(os.path.join(subdir, 'f{:06d}{}'.format(index, extension)), file_size, seed, kind)
+    return files * file_size
+
+
+def write_scripts(directory, scripts, lines=50):
+    """Write scripts valid python files to directory (the Scripts dir compile-python compiles)."""
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    for index in range(scripts):
+        with open(os.path.join(directory, 'script{:04d}.py'.format(index)), 'w') as f:
+            f.write('"""Generated script {}."""\n\n\n'.format(index))
+            for line in range(lines):
+                f.write('def function{0}(value):\n    return value * {0} + {1}\n\n\n'.format(line, index))
+
+
+def write_yarn_lock(module_dir, packages):
+    """Write a yarn.lock resolving every (name, version) in packages to a stable fake registry url."""
+    with open(os.path.join(module_dir, 'yarn.lock'), 'w') as f:
+        f.write('# THIS IS AN AUTOGENERATED FILE. DO NOT EDIT THIS FILE DIRECTLY.\n# yarn lockfile v1\n\n')
+        for name, version in sorted(packages):
+            package_hash = hashlib.sha1('{}@{}'.format(name, version)).hexdigest()
+            f.write('"{0}@^{1}":\n  version "{1}"\n  resolved "https://registry.yarnpkg.com/{0}/-/{0}-{1}.tgz#{2}"\n\n'
+                    .format(name, version, package_hash))
+
+
+def write_git_dir(module_dir, branch='master'):
+    """Write a minimal .git (HEAD, the branch ref and an empty object store) so gitinfo reads the module's hash.
+
+    The commit hash is derived from the module directory name.
+    """
+    git_dir = os.path.join(module_dir, '.git')
+    for subdir in [os.path.join('refs', 'heads'), os.path.join('objects', 'pack')]:
+        os.makedirs(os.path.join(git_dir, subdir))
+    with open(os.path.join(git_dir, 'HEAD'), 'w') as f:
+        f.write('ref: refs/heads/{}\n'.format(branch))
+    with open(os.path.join(git_dir, 'refs', 'heads', branch), 'w') as f:
+        f.write(hashlib.sha1(os.path.basename(os.path.abspath(module_dir))).hexdigest() + '\n')
+
+
+def make_module(parent_dir, name, version='1.0.0', files=10, file_size=1024, kind='random', scripts=0,
+                dependencies=None, npm_packages=0, build=False, yarn_cache=False, git=True, seed=None):
+    """Write a synthetic module tree to parent_dir/name, returns its path.
+
+    Args:
+        files (int): number of payload files in lib/ (spread over sub directories when there are many)
+        file_size (int): size of every payload file in bytes
+        kind (str): "random" or "text" payload content
+        scripts (int): number of python files in Scripts/ for package-module to compile
+        dependencies (dict): module.json dependencies, module name to version range
+        npm_packages (int): number of npm dependencies, written to package.json and yarn.lock
+        build (bool): add a "build" script so package-module runs npm run build
+        yarn_cache (bool): add a support/yarn-cache with the npm packages like a built module has (not with build,
+            npm run build creates it)
+        git (bool): write a minimal .git, without one package-module falls back to running git
+        seed (str): content seed, defaults to the name
+    """
+    seed = seed or name
+    module_dir = os.path.join(parent_dir, name)
+    os.makedirs(module_dir)
+    _write_json(os.path.join(module_dir, 'module.json'),
+                {'name': name, 'version': version, 'displayName': name.title(), 'dependencies': dependencies or {}})
+    packages = [('{}-dep-{}'.format(seed, index), '1.0.{}'.format(index)) for index in range(npm_packages)]
+    npm_scripts = {'bits:install': 'yarn --prod'}
+    if build:
+        npm_scripts['build'] = 'webpack'
+    _write_json(os.path.join(module_dir, 'package.json'),
+                {'name': name, 'version': version, 'scripts': npm_scripts,
+                 'dependencies': dict((package, '^' + package_version) for package, package_version in packages)})
+    if packages:
+        write_yarn_lock(module_dir, packages)
+    if yarn_cache:
+        for package, package_version in packages:
+            package_hash = hashlib.sha1('{}@{}'.format(package, package_version)).hexdigest()
+            entry = os.path.join(module_dir, 'support', 'yarn-cache', 'v6',
+                                 'npm-{}-{}-{}-integrity'.format(package, package_version, package_hash))
+            os.makedirs(os.path.join(entry, 'node_modules', package))
+            with open(os.path.join(entry, 'node_modules', package, 'index.js'), 'w') as f:
+                f.write('module.exports = {!r};\n'.format(package_hash))
+    os.makedirs(os.path.join(module_dir, 'lib'))
+    with open(os.path.join(module_dir, 'lib', 'index.js'), 'w') as f:
+        f.write('module.exports = require(\'./{}\');\n'.format(name))
+    write_payload(os.path.join(module_dir, 'lib'), files, file_size, seed, kind,
+                  '.js' if kind == 'text' else '.bin')
+    if scripts:
+        write_scripts(os.path.join(module_dir, 'Scripts'), scripts)
+    if git:
+        write_git_dir(module_dir)
+    return module_dir
+
+
+def make_base(parent_dir, name='bits-base', version='1.0.0', **kwargs):
+    """Write a synthetic base tree, a module every other module depends on, returns its path."""
+    kwargs.setdefault('dependencies', {})
+    return make_module(parent_dir, name, version, **kwargs)
+
+
+def make_modules(parent_dir, count, base_name='bits-base', prefix='module', chain=False, **kwargs):
+    """Write count modules depending on the base, with chain every module also depends on the previous one.
+
+    Returns the module paths.
+    """
+    module_dirs = []
+    for index in range(count):
+        dependencies = {base_name: '^1.0.0'}
+        if chain and index > 0:
+            dependencies['{}-{:03d}'.format(prefix, index - 1)] = '^1.0.0'
+        module_dirs.append(make_module(parent_dir, '{}-{:03d}'.format(prefix, index), dependencies=dependencies,
+                                       **kwargs))
+    return module_dirs
+
+
+def make_overlay(parent_dir, name, version='0.1.0', files=10, file_size=1024, kind='random', modules=None, seed=None):
+    """Write a synthetic overlay tree to parent_dir/name, returns its path.
+
+    The overlay adds files to the ROMG root and replaces the lib/index.js of every module in modules.
+    """
+    seed = seed or name
+    overlay_dir = os.path.join(parent_dir, name)
+    os.makedirs(overlay_dir)
+    _write_json(os.path.join(overlay_dir, 'overlay.json'), {'name': name, 'version': version})
+    write_payload(os.path.join(overlay_dir, 'overlay', name), files, file_size, seed, kind)
+    for module in modules or []:
+        lib_dir = os.path.join(overlay_dir, 'data', 'base', 'modules', 'modules', module, 'lib')
+        os.makedirs(lib_dir)
+        with open(os.path.join(lib_dir, 'index.js'), 'w') as f:
+            f.write('module.exports = {!r};\n'.format(name))
+    return overlay_dir
+
+
+def make_tgz(source_dir, output_file):
+    """Write source_dir as a tgz with its contents at the root, the layout of module, base and overlay tgzs."""
+    with tarfile.open(output_file, 'w:gz') as tar:
+        tar.add(source_dir + os.sep, arcname='')
+    return output_file
+
+
+def make_keypair(key_dir, prefix, bits=4096, seed=None):
+    """Write <prefix>_private.pem and <prefix>_public.pem to key_dir, returns (private, public) paths.
+
+    The key is derived from the seed (default the prefix), existing files are kept so a key dir can be reused.
+    """
+    private_file = os.path.join(key_dir, prefix + '_private.pem')
+    public_file = os.path.join(key_dir, prefix + '_public.pem')
+    if not (os.path.exists(private_file) and os.path.exists(public_file)):
+        from Crypto.PublicKey import RSA
+        if not os.path.isdir(key_dir):
+            os.makedirs(key_dir)
+        key = RSA.generate(bits, DeterministicRandom(seed or prefix))
+        with open(private_file, 'w') as f:
+            f.write(key.exportKey('PEM'))
+        with open(public_file, 'w') as f:
+            f.write(key.publickey().exportKey('PEM'))
+    return private_file, public_file
+
+
+def make_keys(key_dir, seed='bench'):
+    """Write an encryption and a signing keypair (the 4096 bit keys the tools expect) to key_dir.
+
+    Returns a dict with the enc_private, enc_public, sig_private and sig_public paths.
+    """
+    keys = {}
+    for prefix in ['enc', 'sig']:
+        keys[prefix + '_private'], keys[prefix + '_public'] = make_keypair(key_dir, prefix, seed=seed + '-' + prefix)
+    return keys
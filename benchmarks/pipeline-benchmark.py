@@ -0,0 +1,226 @@
+#!/usr/bin/python
+# This python script benchmarks a whole packaging run offline: synthetic
+# modules and a base are packaged with package-module, combined with
+# synthetic overlays into a ROMG with package-romg and encrypted with
+# package-omg, then the omg is decrypted again and checked against the ROMG.
+# npm, semver, rsync and git are replaced by the stand-ins of faketools.py
+# (their latency is set with --npm-latency etc.) and the keys are generated
+# from a seed, so the run needs no network and no tools besides python and
+# pycrypto:
+#
+#   benchmarks/pipeline-benchmark.py -m 8 -f 200 --file-size 65536 -n 3
+#   fixtures: 8 modules, 1 overlays, 2137 files, 131.3MB
+#   step                    seconds
+#   package-module           11.864
+#   package-romg              9.351
+#   package-omg               2.342
+#   decrypt-data              2.407
+#   tool calls: git 0, npm 0, rsync 3, semver 3
+#
+# The median of --runs runs is reported, --json writes the results (with the
+# fixture sizes and how often every stand-in ran) as json.  -w keeps the
+# workspace, a workspace that already holds the fixtures is reused.
+
+import sys
+import argparse
+import filecmp
+import glob
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+import faketools
+import fixtures
+
+TOOLS_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+STEPS = ['package-module', 'package-romg', 'package-omg', 'decrypt-data']
+
+
+def make_fixtures(workspace, settings):
+    """Write the base, modules, overlays and keys to workspace unless they are already there."""
+    src_dir = os.path.join(workspace, 'src')
+    overlay_dir = os.path.join(workspace, 'overlays')
+    key_dir = settings.key_dir or os.path.join(workspace, 'keys')
+    keys = fixtures.make_keys(key_dir, settings.seed)
+    if not os.path.isdir(src_dir):
+        os.makedirs(overlay_dir)
+        options = {'files': settings.files, 'file_size': settings.file_size, 'kind': settings.kind,
+                   'scripts': settings.scripts, 'npm_packages': settings.npm_packages,
+                   'build': settings.npm_build, 'git': not settings.run_git,
+                   # npm run build writes the yarn cache of modules with a build script
+                   'yarn_cache': settings.npm_packages > 0 and not settings.npm_build}
+        fixtures.make_base(src_dir, seed=settings.seed + '-base', **options)
+        fixtures.make_modules(src_dir, settings.modules, chain=settings.chain, **options)
+        for index in range(settings.overlays):
+            name = 'overlay-{:03d}'.format(index)
+            fixtures.make_tgz(fixtures.make_overlay(src_dir, name, files=settings.files, file_size=settings.file_size,
+                                                    kind=settings.kind, modules=['module-000'], seed=settings.seed),
+                              os.path.join(overlay_dir, name + '.tgz'))
+    module_dirs = sorted(path for path in glob.glob(os.path.join(src_dir, 'module-*')))
+    return {'base_dir': os.path.join(src_dir, 'bits-base'), 'module_dirs': module_dirs,
+            'overlays': sorted(glob.glob(os.path.join(overlay_dir, '*.tgz'))), 'keys': keys, 'key_dir': key_dir}
+
+
+def directory_size(path):
+    """Return (files, bytes) of the files under path."""
+    files = 0
+    size = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            files += 1
+            size += os.path.getsize(os.path.join(root, name))
+    return files, size
+
+
+def run_tool(bin_dir, args, cwd, log):
+    """Run a build tool through build-tools with the stand-ins on PATH, returns the wall time in seconds."""
+    start = time.time()
+    ret = subprocess.call([sys.executable, os.path.join(TOOLS_DIR, 'build-tools')] + args, cwd=cwd,
+                          env=faketools.environment(bin_dir), stdout=log, stderr=subprocess.STDOUT)
+    if ret != 0:
+        raise Exception('build-tools {} exited with {}, see {}'.format(args[0], ret, log.name))
+    return time.time() - start
+
+
+def run_pipeline(bin_dir, run_dir, data, settings):
+    """Package the fixtures once into run_dir, returns the wall time of every step."""
+    keys = data['keys']
+    timings = {}
+    for path in ['modules', 'romg', 'omg', 'decrypted']:
+        os.makedirs(os.path.join(run_dir, path))
+    with open(os.path.join(run_dir, 'output.log'), 'w') as log:
+        module_dir = os.path.join(run_dir, 'modules')
+        summary_file = os.path.join(run_dir, 'summary.json')
+        args = ['package-module', '-m', data['base_dir']] + data['module_dirs']
+        args += ['--skip-apt-offline-bundles', '--summary', summary_file, '-e', keys['enc_public'],
+                 '-s', keys['sig_private']]
+        timings['package-module'] = run_tool(bin_dir, args, module_dir, log)
+        with open(summary_file, 'r') as f:
+            tgzs = dict((summary['module_dir'], os.path.join(module_dir, summary['outputs'][0]['filename']))
+                        for summary in json.load(f)['modules'])
+
+        romg_dir = os.path.join(run_dir, 'romg')
+        args = ['package-romg', '-b', tgzs[data['base_dir']], '-m'] + [tgzs[path] for path in data['module_dirs']]
+        if data['overlays']:
+            args += ['-o'] + data['overlays']
+        args += ['-n', 'bench', '-V', '1.0.0', '-d', romg_dir]
+        if settings.build_node_modules:
+            args.append('--build-node-modules')
+        timings['package-romg'] = run_tool(bin_dir, args, run_dir, log)
+        romg = glob.glob(os.path.join(romg_dir, '*.romg'))[0]
+
+        omg_dir = os.path.join(run_dir, 'omg')
+        timings['package-omg'] = run_tool(
+            bin_dir, ['package-omg', '-r', romg, '-H', os.path.splitext(romg)[0] + '_header.json',
+                      '-e', keys['enc_public'], '-s', keys['sig_private'], '-d', omg_dir], run_dir, log)
+        omg = glob.glob(os.path.join(omg_dir, '*.omg'))[0]
+
+        decrypted_dir = os.path.join(run_dir, 'decrypted')
+        timings['decrypt-data'] = run_tool(
+            bin_dir, ['decrypt-data', '-t', omg, '-k', data['key_dir'], '-d', decrypted_dir], run_dir, log)
+    decrypted = os.path.join(decrypted_dir, os.path.basename(romg))
+    if not os.path.exists(decrypted) or not filecmp.cmp(decrypted, romg, shallow=False):
+        raise Exception('The decrypted omg does not match the ROMG {}'.format(romg))
+    return timings, {'romg_size': os.path.getsize(romg), 'omg_size': os.path.getsize(omg)}
+
+
+def run_benchmark(workspace, settings):
+    data = make_fixtures(workspace, settings)
+    bin_dir = faketools.install(os.path.join(workspace, 'bin'), {
+        'npm': {'latency': settings.npm_latency, 'output_size': settings.npm_output_size},
+        'semver': {'latency': settings.semver_latency},
+        'rsync': {'latency': settings.rsync_latency},
+        'git': {'latency': settings.git_latency}})
+    if os.path.exists(os.path.join(bin_dir, faketools.LOG_FILE)):
+        os.remove(os.path.join(bin_dir, faketools.LOG_FILE))
+
+    runs = []
+    for index in range(settings.runs):
+        run_dir = os.path.join(workspace, 'run-{}'.format(index))
+        if os.path.exists(run_dir):
+            shutil.rmtree(run_dir)
+        timings, outputs = run_pipeline(bin_dir, run_dir, data, settings)
+        runs.append(timings)
+        if not settings.workspace:
+            shutil.rmtree(run_dir)
+
+    files, size = directory_size(os.path.join(workspace, 'src'))
+    results = {'steps': {}, 'fixtures': {'modules': len(data['module_dirs']), 'overlays': len(data['overlays']),
+                                         'files': files, 'bytes': size},
+               'outputs': outputs, 'tool_calls': faketools.call_counts(bin_dir)}
+    for step in STEPS:
+        timings = sorted(run[step] for run in runs)
+        results['steps'][step] = timings[len(timings) // 2]
+    return results
+
+
+def print_results(results):
+    fixture = results['fixtures']
+    print 'fixtures: {} modules, {} overlays, {} files, {:.1f}MB'.format(
+        fixture['modules'], fixture['overlays'], fixture['files'], fixture['bytes'] / 1e6)
+    print '{:<20} {:>10}'.format('step', 'seconds')
+    for step in STEPS:
+        print '{:<20} {:>10.3f}'.format(step, results['steps'][step])
+    print 'tool calls: ' + ', '.join('{} {}'.format(tool, count)
+                                     for tool, count in sorted(results['tool_calls'].iteritems()))
+
+
+def __make_parser():
+    p = argparse.ArgumentParser(description='This benchmarks package-module, package-romg and package-omg offline on '
+                                            'synthetic modules')
+    p.add_argument('-m', '--modules', type=int, default=4, help='number of modules (besides the base)')
+    p.add_argument('-o', '--overlays', type=int, default=1, help='number of overlays')
+    p.add_argument('-f', '--files', type=int, default=100, help='number of payload files per module')
+    p.add_argument('--file-size', type=int, default=16 * 1024, help='size of every payload file in bytes')
+    p.add_argument('--kind', choices=['random', 'text'], default='random',
+                   help='payload content, random (incompressible) or text (compressible)')
+    p.add_argument('--scripts', type=int, default=10, help='number of python scripts per module to compile')
+    p.add_argument('--npm-packages', type=int, default=0,
+                   help='number of npm packages per module (in yarn.lock and the module yarn cache)')
+    p.add_argument('--npm-build', action='store_true', help='give every module a build script (npm run build)')
+    p.add_argument('--build-node-modules', action='store_true', help='run package-romg with --build-node-modules')
+    p.add_argument('--chain', action='store_true', help='make every module depend on the previous one')
+    p.add_argument('--run-git', action='store_true',
+                   help='do not give the modules a .git so package-module runs (the stand-in) git')
+    p.add_argument('--npm-latency', type=float, default=0.0, help='seconds every npm call takes')
+    p.add_argument('--npm-output-size', type=int, default=0, help='bytes npm run build adds to dist/bundle.js')
+    p.add_argument('--semver-latency', type=float, default=0.0, help='seconds every semver call takes')
+    p.add_argument('--rsync-latency', type=float, default=0.0, help='seconds every rsync call takes')
+    p.add_argument('--git-latency', type=float, default=0.0, help='seconds every git call takes')
+    p.add_argument('--seed', type=str, default='bench', help='seed of the generated files and keys')
+    p.add_argument('-k', '--key-dir', type=str, default=None,
+                   help='directory to keep the generated keys in (default the workspace)')
+    p.add_argument('-w', '--workspace', type=str, default=None,
+                   help='directory for the fixtures and outputs, kept after the run (default a temporary directory)')
+    p.add_argument('-n', '--runs', type=int, default=1, help='number of runs, the median is reported')
+    p.add_argument('--json', type=str, default=None, help='write the results as json to this file')
+    return p
+
+
+def __main(argv):
+    parser = __make_parser()
+    settings = parser.parse_args(argv[1:])
+
+    workspace = settings.workspace or tempfile.mkdtemp(prefix='pipeline-benchmark-')
+    try:
+        results = run_benchmark(os.path.abspath(workspace), settings)
+    except Exception as e:
+        # the workspace is kept for the tool output
+        sys.stderr.write('Error running the pipeline benchmark: {}\n'.format(e))
+        sys.exit(1)
+    if settings.workspace is None:
+        shutil.rmtree(workspace)
+
+    print_results(results)
+    if settings.json is not None:
+        with open(settings.json, 'w') as jsonFile:
+            jsonFile.write(json.dumps(results, indent=2, separators=(',', ': ')))
+
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    __main(sys.argv)
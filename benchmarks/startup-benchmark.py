@@ -0,0 +1,118 @@
+#!/usr/bin/python
+# This python script measures the startup time of the build tools, the time
+# from starting the interpreter until a tool has parsed its arguments
+# (measured with --help).  Every subcommand is timed through build-tools and
+# through its old script name (the shim), with --baseline-ref the scripts of
+# an older revision (e.g. one from before the buildtools package) are timed
+# as well to show the gain:
+#
+#   benchmarks/startup-benchmark.py --baseline-ref 3cef8e0
+#   subcommand          baseline    shim  build-tools  speedup
+#   encrypt-data         99.0ms  37.5ms      40.9ms    2.42x
+#
+# The median of --runs runs is reported, --json writes the results as json.
+
+import sys
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import time
+
+TOOLS_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+DEFAULT_SUBCOMMANDS = ['package-module', 'package-romg', 'package-omg', 'encrypt-data', 'decrypt-data']
+
+
+def time_command(args, runs):
+    """Return the median wall time in seconds of running args."""
+    with open(os.devnull, 'w') as devnull:
+        timings = []
+        for _ in range(runs):
+            start = time.time()
+            ret = subprocess.call(args, stdout=devnull, stderr=devnull)
+            timings.append(time.time() - start)
+            if ret != 0:
+                raise Exception('{} exited with {}'.format(' '.join(args), ret))
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def export_revision(ref, outputDir):
+    """Write the tree of a git revision of the build tools to outputDir."""
+    archive = subprocess.Popen(['git', 'archive', ref], cwd=TOOLS_DIR, stdout=subprocess.PIPE)
+    with tarfile.open(fileobj=archive.stdout, mode='r|') as tar:
+        tar.extractall(outputDir)
+    if archive.wait() != 0:
+        raise Exception('Could not export revision {}'.format(ref))
+
+
+def run_benchmark(subcommands, runs, baselineDir=None):
+    python = sys.executable
+    buildTools = os.path.join(TOOLS_DIR, 'build-tools')
+    results = [{'subcommand': None, 'build-tools': time_command([python, buildTools, '--help'], runs)}]
+    for subcommand in subcommands:
+        result = {'subcommand': subcommand,
+                  'shim': time_command([python, os.path.join(TOOLS_DIR, subcommand + '.py'), '--help'], runs),
+                  'build-tools': time_command([python, buildTools, subcommand, '--help'], runs)}
+        if baselineDir is not None:
+            result['baseline'] = time_command([python, os.path.join(baselineDir, subcommand + '.py'), '--help'], runs)
+            result['speedup'] = result['baseline'] / result['build-tools']
+        results.append(result)
+    return results
+
+
+def print_results(results):
+    rowFormat = '{:<24} {:>10} {:>10} {:>12} {:>8}'
+    print rowFormat.format('subcommand', 'baseline', 'shim', 'build-tools', 'speedup')
+
+    def ms(result, key):
+        return '{:.1f}ms'.format(result[key] * 1000) if key in result else '-'
+
+    for result in results:
+        speedup = '{:.2f}x'.format(result['speedup']) if 'speedup' in result else '-'
+        print rowFormat.format(result['subcommand'] or '(dispatch only)', ms(result, 'baseline'), ms(result, 'shim'),
+                               ms(result, 'build-tools'), speedup)
+
+
+def __make_parser():
+    p = argparse.ArgumentParser(description='This measures the startup time of the build tools')
+    p.add_argument('-s', '--subcommand', type=str, action='append', default=None,
+                   help='subcommand to measure (can be specified multiple times, default: {})'.format(
+                       ', '.join(DEFAULT_SUBCOMMANDS)))
+    p.add_argument('-n', '--runs', type=int, default=10, help='number of runs per command, the median is reported')
+    p.add_argument('--baseline-ref', type=str, default=None,
+                   help='git revision whose scripts are measured as the baseline')
+    p.add_argument('--json', type=str, default=None, help='write the results as json to this file')
+    return p
+
+
+def __main(argv):
+    parser = __make_parser()
+    settings = parser.parse_args(argv[1:])
+
+    baselineDir = None
+    try:
+        if settings.baseline_ref is not None:
+            baselineDir = tempfile.mkdtemp(prefix='startup-baseline-')
+            export_revision(settings.baseline_ref, baselineDir)
+        results = run_benchmark(settings.subcommand or DEFAULT_SUBCOMMANDS, settings.runs, baselineDir)
+    except Exception as e:
+        sys.stderr.write('Error running the startup benchmark: {}\n'.format(e))
+        sys.exit(1)
+    finally:
+        if baselineDir is not None:
+            shutil.rmtree(baselineDir)
+
+    print_results(results)
+    if settings.json is not None:
+        with open(settings.json, 'w') as jsonFile:
+            jsonFile.write(json.dumps(results, indent=2, separators=(',', ': ')))
+
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    __main(sys.argv)
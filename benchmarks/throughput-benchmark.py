@@ -0,0 +1,395 @@
+#!/usr/bin/python
+# This python script measures the throughput of the packaging stages on
+# synthetic payloads, every stage is run in-process on its own so a change
+# to one stage shows up in that stage only:
+#
+#   copy_module_files      copy a module tree (package-module)
+#   compile-python         compile the python scripts of a module
+#   make_tarfile           tar and gzip a module tree
+#   encrypt_file           encrypt a module tgz
+#   sign_module            sign an encrypted module
+#   decrypt_file           verify and decrypt a signed module
+#   find_keys              find the keys of a header in a key dir
+#   romgBuilder.addModule  stage a module tgz into a ROMG
+#   writeRomg              write a staged ROMG
+#
+# A payload is given as name=<files>x<size> (e.g. small-100k=100000x1K for
+# many small files, large-1GB=8x128M for a few large files), --preset quick
+# and --preset full select a set of payloads from 1MB to several GB.  The
+# median of --runs runs is reported as MB/s and files/s of the stage input,
+# --json writes the results.  With --baseline (the json of an earlier run)
+# every stage is compared against the baseline and the script exits with 1
+# when the throughput of a stage dropped by more than --threshold percent:
+#
+#   benchmarks/throughput-benchmark.py --preset quick --json baseline.json
+#   benchmarks/throughput-benchmark.py --preset quick --baseline baseline.json --threshold 15
+
+import sys
+import argparse
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+import fixtures
+
+TOOLS_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, TOOLS_DIR)
+
+from buildtools import compile_python, decrypt_data, encrypt_data, package_module, package_omg, package_romg  # noqa
+
+STAGES = ['copy_module_files', 'compile-python', 'make_tarfile', 'encrypt_file', 'sign_module', 'decrypt_file',
+          'find_keys', 'romgBuilder.addModule', 'writeRomg']
+PRESETS = {
+    'quick': ['large-1MB=1x1M', 'large-64MB=4x16M', 'small-10k=10000x1K'],
+    'full': ['large-1MB=1x1M', 'large-64MB=4x16M', 'large-1GB=8x128M', 'large-4GB=16x256M', 'small-10k=10000x1K',
+             'small-100k=100000x1K'],
+}
+SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+# compiling a single huge python file measures the parser, not the stage, scripts are capped at this size
+MAX_SCRIPT_SIZE = 256 * 1024
+# bytes of one generated function, see fixtures.write_scripts
+SCRIPT_LINE_SIZE = 50
+
+
+def parse_payload(spec):
+    """Parse name=<files>x<size>[K|M|G] into (name, files, file size)."""
+    try:
+        name, shape = spec.split('=')
+        files, size = shape.lower().split('x')
+        unit = size[-1].upper() if size[-1].upper() in SIZE_UNITS else ''
+        return name, int(files), int(size[:len(size) - len(unit)]) * SIZE_UNITS[unit]
+    except ValueError:
+        raise ValueError('Invalid payload {}, expected name=<files>x<size>'.format(spec))
+
+
+def directory_size(path):
+    """Return (files, bytes) of the files under path."""
+    files = 0
+    size = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            files += 1
+            size += os.path.getsize(os.path.join(root, name))
+    return files, size
+
+
+def prepare_payload(payload_dir, files, file_size):
+    """Write the module tree and the python scripts of a payload unless an earlier run already did."""
+    marker = os.path.join(payload_dir, '.complete')
+    if not os.path.exists(marker):
+        if os.path.exists(payload_dir):
+            shutil.rmtree(payload_dir)
+        os.makedirs(payload_dir)
+        fixtures.make_module(payload_dir, 'module', files=files, file_size=file_size, git=False)
+        fixtures.write_scripts(os.path.join(payload_dir, 'scripts'), files,
+                               max(1, min(file_size, MAX_SCRIPT_SIZE) // SCRIPT_LINE_SIZE))
+        open(marker, 'w').close()
+    return os.path.join(payload_dir, 'module'), os.path.join(payload_dir, 'scripts')
+
+
+def prepare_keys(key_dir, decoys):
+    """Write the encryption and signing keys and decoys small keys find_keys has to skip."""
+    keys = fixtures.make_keys(key_dir)
+    for index in range(decoys):
+        fixtures.make_keypair(key_dir, 'decoy-{:03d}'.format(index), bits=1024)
+    return keys
+
+
+def quiet(func):
+    """Run func with stdout discarded, the stages print every file they write."""
+    stdout = sys.stdout
+    with open(os.devnull, 'w') as devnull:
+        sys.stdout = devnull
+        try:
+            return func()
+        finally:
+            sys.stdout = stdout
+
+
+def measure(run, runs, setup=None):
+    """Return the median wall time in seconds of runs calls of run, setup is called (untimed) before every call."""
+    timings = []
+    for _ in range(runs):
+        if setup is not None:
+            setup()
+        start = time.time()
+        quiet(run)
+        timings.append(time.time() - start)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def reset_dir(path):
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.makedirs(path)
+
+
+def new_romg_builder(scratch_dir, base_tgz):
+    logger = logging.Logger('throughput-benchmark')
+    logger.addHandler(logging.NullHandler())
+    romg_dir = os.path.join(scratch_dir, 'romg-staging')
+    if os.path.exists(romg_dir):
+        shutil.rmtree(romg_dir)
+    os.makedirs(romg_dir)
+    romg = package_romg.romgBuilder(logger, romg_dir, 'throughput', '1.0.0')
+    quiet(lambda: romg.addBase(base_tgz))
+    return romg
+
+
+def result(stage, payload, seconds, size, files):
+    return {'stage': stage, 'payload': payload, 'seconds': round(seconds, 6), 'bytes': size, 'files': files,
+            'mb_per_s': round(size / 1e6 / seconds, 3) if seconds else None,
+            'files_per_s': round(files / seconds, 3) if seconds else None}
+
+
+def benchmark_payload(payload, module_dir, scripts_dir, scratch_dir, keys, base_tgz, stages, runs):
+    """Measure every stage in stages on one payload, returns the results."""
+    results = []
+    files, size = directory_size(module_dir)
+    script_files, script_size = directory_size(scripts_dir)
+    copy_dir = os.path.join(scratch_dir, 'copy', 'module')
+    compiled_dir = os.path.join(scratch_dir, 'compiled')
+    tgz = os.path.join(scratch_dir, 'module.tgz')
+    pack = os.path.join(scratch_dir, 'encrypted', 'module.pack')
+    sign_dir = os.path.join(scratch_dir, 'signed')
+    signed = os.path.join(sign_dir, 'module.mod')
+    decrypt_dir = os.path.join(scratch_dir, 'decrypted')
+
+    # later stages use the output of earlier ones, those are produced untimed when the earlier stage is skipped
+    def copy():
+        package_module.copy_module_files(module_dir, copy_dir, package_module.EXCLUDE_FILES,
+                                         package_module.EXCLUDE_DIRS)
+    if 'copy_module_files' in stages:
+        results.append(result('copy_module_files', payload, measure(copy, runs, lambda: reset_dir(copy_dir)), size,
+                              files))
+    else:
+        reset_dir(copy_dir)
+        copy()
+
+    if 'compile-python' in stages:
+        seconds = measure(lambda: compile_python.compile_dir(scripts_dir, compiled_dir), runs,
+                          lambda: reset_dir(compiled_dir))
+        results.append(result('compile-python', payload, seconds, script_size, script_files))
+
+    def tar():
+        package_module.make_tarfile(tgz, copy_dir + os.sep)
+    if 'make_tarfile' in stages:
+        results.append(result('make_tarfile', payload, measure(tar, runs), size, files))
+    else:
+        tar()
+    shutil.rmtree(os.path.dirname(copy_dir))
+
+    reset_dir(os.path.dirname(pack))
+
+    def encrypt():
+        encrypt_data.encrypt_file(tgz, [keys['enc_public']], False, os.path.dirname(pack), False)
+    if 'encrypt_file' in stages:
+        results.append(result('encrypt_file', payload, measure(encrypt, runs), os.path.getsize(tgz), 1))
+    else:
+        quiet(encrypt)
+
+    def sign():
+        encrypt_data.sign_module(os.path.join(sign_dir, 'module.pack'), keys['enc_public'], keys['sig_private'],
+                                 '.mod', sign_dir, False, False)
+
+    def copy_pack():
+        # sign_module removes the file it signs
+        reset_dir(sign_dir)
+        shutil.copy(pack, sign_dir)
+    if 'sign_module' in stages:
+        results.append(result('sign_module', payload, measure(sign, runs, copy_pack), os.path.getsize(pack), 1))
+    else:
+        copy_pack()
+        quiet(sign)
+
+    if 'decrypt_file' in stages:
+        def decrypt():
+            if not decrypt_data.decrypt_file(signed, 0, keys['enc_private'], keys['sig_public'], False, decrypt_dir,
+                                             False):
+                raise Exception('Could not decrypt the signed module')
+        seconds = measure(decrypt, runs, lambda: reset_dir(decrypt_dir))
+        results.append(result('decrypt_file', payload, seconds, os.path.getsize(signed), 1))
+        shutil.rmtree(decrypt_dir)
+    shutil.rmtree(os.path.dirname(pack))
+    shutil.rmtree(sign_dir)
+
+    if 'romgBuilder.addModule' in stages:
+        builders = []
+
+        def new_builder():
+            builders.append(new_romg_builder(scratch_dir, base_tgz))
+        seconds = measure(lambda: builders[-1].addModule(tgz), runs, new_builder)
+        results.append(result('romgBuilder.addModule', payload, seconds, size, files))
+
+    if 'writeRomg' in stages:
+        romg = new_romg_builder(scratch_dir, base_tgz)
+        quiet(lambda: romg.addModule(tgz))
+        output_dir = os.path.join(scratch_dir, 'romg')
+        seconds = measure(lambda: romg.writeRomg(output_dir), runs, lambda: reset_dir(output_dir))
+        staged_files, staged_size = directory_size(romg.tmpDir)
+        results.append(result('writeRomg', payload, seconds, staged_size, staged_files))
+        shutil.rmtree(output_dir)
+    if os.path.exists(os.path.join(scratch_dir, 'romg-staging')):
+        shutil.rmtree(os.path.join(scratch_dir, 'romg-staging'))
+    os.remove(tgz)
+    return results
+
+
+def benchmark_find_keys(key_dir, keys, runs):
+    encryption_key_hashes, signature_key_hash = package_omg.resolve_key_hashes([keys['enc_public']],
+                                                                               keys['sig_private'])
+    header = package_omg.add_key_hashes({}, encryption_key_hashes, signature_key_hash)
+
+    def find():
+        settings = argparse.Namespace(encryption_key=None, signing_key=None)
+        decrypt_data.find_keys(header, key_dir, settings)
+
+    def clear_key_cache():
+        # measure the keys being parsed, not the cache of a long running process
+        encrypt_data._rsa_keys.clear()
+    stderr = sys.stderr
+    with open(os.devnull, 'w') as devnull:
+        sys.stderr = devnull
+        try:
+            seconds = measure(find, runs, clear_key_cache)
+        finally:
+            sys.stderr = stderr
+    files, size = directory_size(key_dir)
+    return result('find_keys', 'keys-{}'.format(files), seconds, size, files)
+
+
+def run_benchmark(workspace, payloads, stages, runs, decoys):
+    key_dir = os.path.join(workspace, 'keys')
+    keys = prepare_keys(key_dir, decoys)
+    base_dir = os.path.join(workspace, 'base')
+    base_tgz = os.path.join(workspace, 'base.tgz')
+    if not os.path.exists(base_tgz):
+        if os.path.exists(base_dir):
+            shutil.rmtree(base_dir)
+        fixtures.make_tgz(fixtures.make_base(base_dir, files=1, git=False), base_tgz)
+
+    results = []
+    if 'find_keys' in stages:
+        results.append(benchmark_find_keys(key_dir, keys, runs))
+    if any(stage != 'find_keys' for stage in stages):
+        for name, files, file_size in payloads:
+            module_dir, scripts_dir = prepare_payload(os.path.join(workspace, 'payloads', name), files, file_size)
+            scratch_dir = tempfile.mkdtemp(prefix='scratch-', dir=workspace)
+            try:
+                results.extend(benchmark_payload(name, module_dir, scripts_dir, scratch_dir, keys, base_tgz, stages,
+                                                 runs))
+            finally:
+                shutil.rmtree(scratch_dir)
+    return results
+
+
+def throughput(entry):
+    return entry['mb_per_s'] if entry['bytes'] else entry['files_per_s']
+
+
+def compare(results, baseline, threshold, stage_thresholds):
+    """Add the change against the baseline to every result, returns the results that regressed."""
+    baseline_results = dict(((entry['stage'], entry['payload']), entry) for entry in baseline['results'])
+    regressions = []
+    for entry in results:
+        base = baseline_results.get((entry['stage'], entry['payload']))
+        if base is None or not throughput(base) or not throughput(entry):
+            continue
+        entry['baseline_mb_per_s'] = base['mb_per_s']
+        entry['baseline_files_per_s'] = base['files_per_s']
+        entry['change'] = round((throughput(entry) / throughput(base) - 1) * 100, 1)
+        if -entry['change'] > stage_thresholds.get(entry['stage'], threshold):
+            regressions.append(entry)
+    return regressions
+
+
+def print_results(results):
+    row_format = '{:<24} {:<14} {:>10} {:>12} {:>12} {:>9}'
+    print row_format.format('stage', 'payload', 'seconds', 'MB/s', 'files/s', 'change')
+    for entry in results:
+        change = '{:+.1f}%'.format(entry['change']) if 'change' in entry else '-'
+        print row_format.format(entry['stage'], entry['payload'], '{:.3f}'.format(entry['seconds']),
+                                '{:.1f}'.format(entry['mb_per_s'] or 0), '{:.1f}'.format(entry['files_per_s'] or 0),
+                                change)
+
+
+def __make_parser():
+    p = argparse.ArgumentParser(description='This measures the throughput of every packaging stage on synthetic '
+                                            'payloads and compares it against a baseline')
+    p.add_argument('-p', '--payload', type=str, action='append', default=None,
+                   help='payload as name=<files>x<size>, e.g. small-100k=100000x1K (can be specified multiple times)')
+    p.add_argument('--preset', choices=sorted(PRESETS), default='quick',
+                   help='set of payloads used when no --payload is given (default: quick)')
+    p.add_argument('-s', '--stage', choices=STAGES, action='append', default=None,
+                   help='stage to measure (can be specified multiple times, default: every stage)')
+    p.add_argument('-n', '--runs', type=int, default=3, help='number of runs per stage, the median is reported')
+    p.add_argument('--decoy-keys', type=int, default=20, help='number of other keys in the key dir for find_keys')
+    p.add_argument('-w', '--workspace', type=str, default=None,
+                   help='directory for the payloads and keys, kept and reused by later runs (default a temporary '
+                        'directory)')
+    p.add_argument('--json', type=str, default=None, help='write the results as json to this file')
+    p.add_argument('--baseline', type=str, default=None, help='json results of an earlier run to compare against')
+    p.add_argument('--threshold', type=float, default=10.0,
+                   help='percent the throughput of a stage may drop below the baseline (default: 10)')
+    p.add_argument('--stage-threshold', type=str, action='append', default=[],
+                   help='stage=percent, the threshold of one stage (can be specified multiple times)')
+    return p
+
+
+def __main(argv):
+    parser = __make_parser()
+    settings = parser.parse_args(argv[1:])
+
+    try:
+        payloads = [parse_payload(spec) for spec in settings.payload or PRESETS[settings.preset]]
+        stage_thresholds = {}
+        for spec in settings.stage_threshold:
+            stage, threshold = spec.rsplit('=', 1)
+            if stage not in STAGES:
+                raise ValueError('Unknown stage {}'.format(stage))
+            stage_thresholds[stage] = float(threshold)
+    except ValueError as e:
+        sys.stderr.write('Error {}\n'.format(e))
+        sys.exit(1)
+
+    baseline = None
+    if settings.baseline is not None:
+        try:
+            with open(settings.baseline, 'r') as baselineFile:
+                baseline = json.load(baselineFile)
+        except (IOError, ValueError) as e:
+            sys.stderr.write('Error could not read baseline {}: {}\n'.format(settings.baseline, e))
+            sys.exit(1)
+
+    workspace = os.path.abspath(settings.workspace or tempfile.mkdtemp(prefix='throughput-benchmark-'))
+    try:
+        results = run_benchmark(workspace, payloads, settings.stage or STAGES, settings.runs, settings.decoy_keys)
+    except Exception as e:
+        sys.stderr.write('Error running the throughput benchmark: {}\n'.format(e))
+        sys.exit(1)
+    finally:
+        if settings.workspace is None:
+            shutil.rmtree(workspace)
+
+    regressions = []
+    if baseline is not None:
+        regressions = compare(results, baseline, settings.threshold, stage_thresholds)
+    print_results(results)
+    if settings.json is not None:
+        with open(settings.json, 'w') as jsonFile:
+            jsonFile.write(json.dumps({'runs': settings.runs, 'results': results}, indent=2, separators=(',', ': ')))
+
+    if regressions:
+        for entry in regressions:
+            sys.stderr.write('Regression: the throughput of {} on {} dropped {:.1f}% below the baseline\n'.format(
+                entry['stage'], entry['payload'], -entry['change']))
+        sys.exit(1)
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    __main(sys.argv)
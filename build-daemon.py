@@ -0,0 +1,14 @@
+#!/usr/bin/python
+# build-daemon.py is kept for existing callers, the tool is buildtools/build_daemon.py
+# and is also run as:
+#   build-tools build-daemon [args ...]
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+import buildtools  # noqa: E402
+
+if __name__ == "__main__":
+    buildtools.run('build-daemon', sys.argv)
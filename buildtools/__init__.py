@@ -0,0 +1,57 @@
+"""The build tools used to package modules and raw omgs for the bits framework.
+
+Every tool is a subcommand of the build-tools script (build-tools package-module ...), the old script names
+(package-module.py, ...) are kept as shims.  Subcommands are only imported when they are run so a tool never pays
+for the imports (pycrypto) of the tools it does not use.
+"""
+import importlib
+import os
+import sys
+
+# the directory holding the build-tools script, the shims and the buildtools package
+TOOLS_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+# subcommand name -> module in this package
+SUBCOMMANDS = {
+    'append-overlay': 'append_overlay',
+    'build-daemon': 'build_daemon',
+    'compile-python': 'compile_python',
+    'decrypt-data': 'decrypt_data',
+    'delta-module': 'delta_module',
+    'encrypt-data': 'encrypt_data',
+    'extract-romg': 'extract_romg',
+    'integratedcheckromgdeps': 'integratedcheckromgdeps',
+    'package-module': 'package_module',
+    'package-omg': 'package_omg',
+    'package-romg': 'package_romg',
+}
+
+
+def load(subcommand):
+    """Import the module of a subcommand."""
+    if subcommand not in SUBCOMMANDS:
+        raise KeyError('Unknown build tool {}'.format(subcommand))
+    return importlib.import_module('buildtools.' + SUBCOMMANDS[subcommand])
+
+
+def run(subcommand, argv):
+    """Run a subcommand with argv (argv[0] is the program name), this exits like the tools always have."""
+    getattr(load(subcommand), '__main')(argv)
+
+
+def usage():
+    return 'usage: build-tools <subcommand> [args ...]\n\nsubcommands:\n' + \
+        ''.join('  {}\n'.format(subcommand) for subcommand in sorted(SUBCOMMANDS)) + \
+        '\nrun build-tools <subcommand> -h for the arguments of a subcommand\n'
+
+
+def main(argv):
+    if len(argv) < 2 or argv[1] in ['-h', '--help']:
+        sys.stdout.write(usage())
+        sys.exit(0 if len(argv) >= 2 else 1)
+    if argv[1] not in SUBCOMMANDS:
+        sys.stderr.write('Error unknown subcommand {}\n\n'.format(argv[1]) + usage())
+        sys.exit(1)
+    # argparse takes the program name from sys.argv
+    sys.argv = [os.path.basename(argv[0]) + ' ' + argv[1]] + argv[2:]
+    run(argv[1], sys.argv)
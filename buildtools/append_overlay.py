@@ -0,0 +1,176 @@
+# This python script appends overlays to an existing uncompressed romg
+# (package-romg.py -X) so late overlays do not need a full rebuild.  The
+# overlay members are appended to the romg tar, later members win when the
+# romg is extracted so the overlay shadows files in the base and modules just
+# like it does when the overlay is passed to package-romg.py.  The overlays
+# section of the romg header json is updated to list the new overlays.
+#
+# Append an overlay:
+#   append-overlay.py -r test_1.0.0.romg -o customer-overlay.tgz
+# Append an overlay and compress the romg in the same pass:
+#   append-overlay.py -r test_1.0.0.romg -o customer-overlay.tgz -c
+#
+# Overlays with prepackage_scripts cannot be appended as the scripts need the
+# full romg tree, build those romgs with package-romg.py instead.
+
+import sys
+import argparse
+import gzip
+import json
+import os
+import tarfile
+
+READ_SIZE = 1024 * 1024
+
+
+class OverlayAppender(object):
+    def __init__(self, header, ownership=None):
+        self.header = header
+        self.ownership = ownership
+
+    def __chown(self, tarinfo):
+        if self.ownership is not None:
+            tarinfo.uid = self.ownership['uid']
+            tarinfo.gid = self.ownership['gid']
+            tarinfo.uname = str(self.ownership['uname'])
+            tarinfo.gname = str(self.ownership['gname'])
+            # no permissions for other
+            tarinfo.mode &= ~0x07
+        return tarinfo
+
+    def __arcname(self, name, overlayInfo):
+        name = os.path.normpath(name)
+        if name == '.' or name == '.gitlab' or name.startswith('.gitlab/'):
+            return None
+        if name == 'overlay.json' and 'uuid' in self.header:
+            # v2 romgs keep every overlay descriptor in overlays/
+            return './' + os.path.join('overlays', overlayInfo['name'] + '_' + overlayInfo['version'] + '.json')
+        return './' + name
+
+    def addOverlay(self, tar, overlayTgzPath):
+        with tarfile.open(overlayTgzPath, 'r') as overlay:
+            members = overlay.getmembers()
+            if any(os.path.normpath(m.name).split('/')[0] == 'prepackage_scripts' for m in members):
+                raise Exception('{} has prepackage_scripts and cannot be appended'.format(overlayTgzPath))
+            overlayJson = json.load(overlay.extractfile('overlay.json'))
+            overlayInfo = {'name': overlayJson['name'], 'version': overlayJson['version']}
+            if 'uuid' in self.header and 'overlays' not in [os.path.normpath(m.name) for m in members]:
+                tarinfo = self.__chown(tarfile.TarInfo('./overlays'))
+                tarinfo.type = tarfile.DIRTYPE
+                tarinfo.mode = 0755
+                tar.addfile(tarinfo)
+            for member in members:
+                arcname = self.__arcname(member.name, overlayInfo)
+                if arcname is None:
+                    continue
+                tarinfo = self.__chown(member)
+                tarinfo.name = arcname
+                if tarinfo.isreg():
+                    tar.addfile(tarinfo, overlay.extractfile(member))
+                else:
+                    tar.addfile(tarinfo)
+        self.header['overlays'][overlayInfo['name']] = {'version': overlayInfo['version']}
+        return overlayInfo
+
+
+def tar_end_offset(romgPath):
+    """Return the offset of the end of archive marker of an uncompressed tar."""
+    with tarfile.open(romgPath, 'r:') as tar:
+        for _member in tar:
+            pass
+        return tar.offset
+
+
+def append_overlays(romgPath, headerPath, overlays, ownership=None, compress=False, verbose=False):
+    with open(romgPath, 'rb') as f:
+        if f.read(2) == '\x1f\x8b':
+            raise Exception('{} is compressed, overlays can only be appended to a romg built with -X'.format(romgPath))
+    with open(headerPath, 'r') as f:
+        header = json.load(f)
+    if 'index' in header:
+        raise Exception('{} is a seekable romg and its index cannot be updated'.format(romgPath))
+    appender = OverlayAppender(header, ownership)
+    if compress:
+        # copy the existing tar up to the end of archive marker and the new overlays through a single gzip stream
+        endOffset = tar_end_offset(romgPath)
+        tmpPath = romgPath + '.tmp'
+        try:
+            with open(romgPath, 'rb') as romgFile:
+                gz = gzip.GzipFile(tmpPath, 'wb')
+                remaining = endOffset
+                while remaining > 0:
+                    data = romgFile.read(min(READ_SIZE, remaining))
+                    if len(data) == 0:
+                        raise Exception('Truncated romg')
+                    remaining -= len(data)
+                    gz.write(data)
+                with tarfile.open(fileobj=gz, mode='w') as tar:
+                    for overlay in overlays:
+                        overlayInfo = appender.addOverlay(tar, overlay)
+                        if verbose:
+                            print 'appended {name} {version}'.format(**overlayInfo)
+                gz.close()
+            os.rename(tmpPath, romgPath)
+        except Exception:
+            if os.path.exists(tmpPath):
+                os.remove(tmpPath)
+            raise
+    else:
+        with tarfile.open(romgPath, 'a') as tar:
+            for overlay in overlays:
+                overlayInfo = appender.addOverlay(tar, overlay)
+                if verbose:
+                    print 'appended {name} {version}'.format(**overlayInfo)
+    with open(headerPath, 'w') as infoFile:
+        infoFile.write(json.dumps(header, indent=2, separators=(',', ': ')))
+    return header
+
+
+def __make_parser():
+    p = argparse.ArgumentParser(description='This appends overlays to an existing uncompressed romg')
+    p.add_argument('-r', '--romg', type=str, help='the uncompressed romg file', required=True)
+    p.add_argument('-H', '--header', type=str,
+                   help='the romg header json, defaults to <romg>_header.json next to the romg', default=None)
+    p.add_argument('-o', '--overlays', nargs='+', type=str, help='path(s) to the overlays to append', required=True)
+    p.add_argument('-O', '--ownership-info',
+                   help='JSON string specifying the ownership of the appended files, this should match the \
+                         ownership the romg was built with (e.g {"uid": 1000, "gid": 1000, "uname": "bits", \
+                         "gname": "bits"})',
+                   default=None, type=str)
+    p.add_argument('-c', '--compress', action='store_true',
+                   help='compress the romg once the overlays are appended, the romg can not be appended to after')
+    p.add_argument('-v', '--verbose', action='store_true', help='verbose message printing')
+    return p
+
+
+def __main(argv):
+    parser = __make_parser()
+    settings = parser.parse_args(argv[1:])
+
+    if not os.path.isfile(settings.romg):
+        sys.stderr.write('Error romg is not a valid file\n')
+        sys.exit(1)
+    if settings.header is None:
+        settings.header = os.path.splitext(settings.romg)[0] + '_header.json'
+    if not os.path.isfile(settings.header):
+        sys.stderr.write('Error romg header is not a valid file\n')
+        sys.exit(1)
+    for overlay in settings.overlays:
+        if not os.path.isfile(overlay):
+            sys.stderr.write('Error invalid overlay specified {}\n'.format(overlay))
+            sys.exit(1)
+    if settings.ownership_info:
+        try:
+            settings.ownership_info = json.loads(settings.ownership_info)
+        except ValueError:
+            sys.stderr.write('Error could not parse ownership info {}\n'.format(settings.ownership_info))
+            sys.exit(1)
+    try:
+        append_overlays(settings.romg, settings.header, settings.overlays, settings.ownership_info,
+                        settings.compress, settings.verbose)
+    except Exception as e:
+        sys.stderr.write('Error appending overlays: {}\n'.format(e))
+        sys.exit(1)
+    print settings.romg
+
+    sys.exit(0)
@@ -0,0 +1,374 @@
+# This runs the build tools (package-module, package-romg, package-omg,
+# encrypt-data, decrypt-data, ...) through a long running daemon so every job skips the interpreter startup,
+# the imports (pycrypto) and the RSA key parsing.  The daemon loads every
+# tool once and forks a job per request, the jobs inherit the loaded modules
+# and the parsed keys.  Keys named on a job's command line (and the other
+# keys in their directory, -k key dirs included) are parsed by the daemon
+# before the job is forked so the following jobs find them parsed.
+#
+# Start the daemon:
+#   build-tools build-daemon --serve
+# Run a tool, through the daemon if one is listening otherwise in this process:
+#   build-tools build-daemon package-module -m my-module -v 1.2.3
+#
+# The socket defaults to $BUILD_DAEMON_SOCKET, $XDG_RUNTIME_DIR/build-tools.sock
+# or /tmp/build-tools-<uid>/daemon.sock (in a directory only the user can
+# enter).  The client sends its environment to the daemon so it only connects
+# to a socket owned by the user and checks the uid of the daemon process.
+# The protocol is one json object per line, the client sends a single
+# request:
+#
+#   {"tool": "package-module", "args": ["-m", "my-module"], "cwd": "/src", "env": {"PATH": "..."}}
+#
+# and the daemon answers with the output of the job as it is written and its
+# exit status:
+#
+#   {"stdout": "outputting to: my-module-1.2.3.tgz\n"}
+#   {"stderr": "..."}
+#   {"exit": 0}
+
+import sys
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import stat
+import struct
+import threading
+import traceback
+
+import buildtools
+
+TOOLS = sorted(tool for tool in buildtools.SUBCOMMANDS if tool != 'build-daemon')
+KEY_DIR_OPTIONS = ['-k', '--key-dir']
+READ_SIZE = 64 * 1024
+# the socket module of python 2.7 does not name SO_PEERCRED, this is its value on linux
+SO_PEERCRED = getattr(socket, 'SO_PEERCRED', 17)
+
+
+def default_socket_path():
+    if 'BUILD_DAEMON_SOCKET' in os.environ:
+        return os.environ['BUILD_DAEMON_SOCKET']
+    if os.environ.get('XDG_RUNTIME_DIR'):
+        return os.path.join(os.environ['XDG_RUNTIME_DIR'], 'build-tools.sock')
+    return os.path.join('/tmp', 'build-tools-{}'.format(os.getuid()), 'daemon.sock')
+
+
+def make_socket_dir(socketPath):
+    """Create the directory of the socket only the user can enter, an existing one has to be owned by the user."""
+    socketDir = os.path.dirname(os.path.abspath(socketPath))
+    if not os.path.isdir(socketDir):
+        os.makedirs(socketDir, 0700)
+    info = os.lstat(socketDir)
+    if info.st_uid != os.getuid():
+        raise Exception('The socket directory {} is owned by uid {}'.format(socketDir, info.st_uid))
+
+
+def check_socket(socketPath):
+    """Raise an exception unless socketPath is a socket owned by the user."""
+    info = os.lstat(socketPath)
+    if not stat.S_ISSOCK(info.st_mode):
+        raise Exception('{} is not a socket'.format(socketPath))
+    if info.st_uid != os.getuid():
+        raise Exception('{} is owned by uid {}'.format(socketPath, info.st_uid))
+
+
+def check_peer(conn):
+    """Raise an exception unless the process on the other end of conn runs as the user (linux only)."""
+    if not sys.platform.startswith('linux'):
+        return
+    _pid, uid, _gid = struct.unpack('3i', conn.getsockopt(socket.SOL_SOCKET, SO_PEERCRED, struct.calcsize('3i')))
+    if uid != os.getuid():
+        raise Exception('the build daemon runs as uid {}'.format(uid))
+
+
+def load_tool(tool):
+    if tool not in TOOLS:
+        raise Exception('Unknown tool {}'.format(tool))
+    return buildtools.load(tool)
+
+
+def run_tool(tool, args):
+    """Run a tool's main in this process, returns its exit status."""
+    # argparse takes the program name from sys.argv
+    sys.argv = ['build-tools ' + tool] + list(args)
+    try:
+        getattr(load_tool(tool), '__main')(sys.argv)
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        sys.stderr.write('{}\n'.format(e.code))
+        return 1
+    except Exception:
+        traceback.print_exc()
+        return 1
+    return 0
+
+
+def is_key_file(path):
+    try:
+        with open(path, 'r') as f:
+            start = f.read(64)
+    except (IOError, OSError):
+        return False
+    return start.startswith('-----BEGIN') and 'KEY' in start
+
+
+def warm_keys(args, cwd):
+    """Parse the keys a job names (and the keys next to them) so the job and the following jobs inherit them."""
+    keyDirs = set()
+    for index, arg in enumerate(args):
+        path = os.path.join(cwd, arg)
+        if index > 0 and args[index - 1] in KEY_DIR_OPTIONS and os.path.isdir(path):
+            keyDirs.add(os.path.abspath(path))
+        elif os.path.isfile(path) and is_key_file(path):
+            keyDirs.add(os.path.dirname(os.path.abspath(path)))
+    if not keyDirs:
+        return
+    encryptData = load_tool('encrypt-data')
+    for keyDir in keyDirs:
+        for name in os.listdir(keyDir):
+            keyFile = os.path.join(keyDir, name)
+            if os.path.isfile(keyFile) and is_key_file(keyFile):
+                try:
+                    encryptData.load_rsa_key(keyFile)
+                except Exception:
+                    pass
+
+
+class LineWriter(object):
+    """Writes json lines to a socket, shared by the output relays of a job."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.lock = threading.Lock()
+
+    def send(self, message):
+        with self.lock:
+            self.conn.sendall(json.dumps(message) + '\n')
+
+
+def relay(fd, writer, stream):
+    while True:
+        data = os.read(fd, READ_SIZE)
+        if len(data) == 0:
+            break
+        # latin-1 maps every byte to a code point so the client gets the output back byte for byte
+        writer.send({stream: data.decode('latin-1')})
+    os.close(fd)
+
+
+def run_job(conn, request):
+    """Run a request in a forked child, its stdout and stderr (subprocesses included) are relayed to conn."""
+    # the child must not share the daemon's random state or every job would generate the same passwords
+    random.seed()
+    if 'Crypto.Random' in sys.modules:
+        sys.modules['Crypto.Random'].atfork()
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    writer = LineWriter(conn)
+    code = 1
+    try:
+        os.chdir(request.get('cwd', '/'))
+        if 'env' in request:
+            os.environ.clear()
+            os.environ.update(request['env'])
+        relays = []
+        devnull = os.open(os.devnull, os.O_RDWR)
+        os.dup2(devnull, 0)
+        for fd, stream in [(1, 'stdout'), (2, 'stderr')]:
+            readFd, writeFd = os.pipe()
+            os.dup2(writeFd, fd)
+            os.close(writeFd)
+            thread = threading.Thread(target=relay, args=(readFd, writer, stream))
+            thread.daemon = True
+            thread.start()
+            relays.append(thread)
+        try:
+            code = run_tool(request['tool'], request.get('args', []))
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            # close the write ends of the pipes so the relays see the end of the output
+            os.dup2(devnull, 1)
+            os.dup2(devnull, 2)
+            for thread in relays:
+                thread.join()
+        writer.send({'exit': code})
+    except Exception:
+        try:
+            writer.send({'stderr': traceback.format_exc()})
+            writer.send({'exit': 1})
+        except Exception:
+            pass
+    finally:
+        os._exit(0)
+
+
+def read_request(conn):
+    data = ''
+    while '\n' not in data:
+        chunk = conn.recv(READ_SIZE)
+        if len(chunk) == 0:
+            break
+        data += chunk
+    return json.loads(data.split('\n', 1)[0])
+
+
+def serve(socketPath, jobs, keyDirs):
+    for tool in TOOLS:
+        load_tool(tool)
+    for keyDir in keyDirs:
+        warm_keys(['-k', keyDir], os.getcwd())
+
+    make_socket_dir(socketPath)
+    if os.path.exists(socketPath):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socketPath)
+            raise Exception('A daemon is already listening on {}'.format(socketPath))
+        except socket.error:
+            # left behind by a daemon that did not shut down cleanly
+            os.remove(socketPath)
+        finally:
+            probe.close()
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # no other user may connect, not even between the bind and the chmod
+    umask = os.umask(0177)
+    try:
+        server.bind(socketPath)
+    finally:
+        os.umask(umask)
+    os.chmod(socketPath, 0600)
+    server.listen(16)
+    slots = threading.BoundedSemaphore(jobs)
+
+    def reap(pid, conn):
+        try:
+            os.waitpid(pid, 0)
+        finally:
+            conn.close()
+            slots.release()
+
+    def shutdown(_signum, _frame):
+        raise KeyboardInterrupt()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    print 'Listening on ' + socketPath
+    sys.stdout.flush()
+    try:
+        while True:
+            conn, _address = server.accept()
+            try:
+                request = read_request(conn)
+                load_tool(request['tool'])
+                # parse keys in the daemon so they outlive the job
+                warm_keys(request.get('args', []), request.get('cwd', '/'))
+            except Exception as e:
+                try:
+                    LineWriter(conn).send({'stderr': 'Error invalid request: {}\n'.format(e)})
+                    LineWriter(conn).send({'exit': 1})
+                except socket.error:
+                    pass
+                conn.close()
+                continue
+            slots.acquire()
+            pid = os.fork()
+            if pid == 0:
+                server.close()
+                run_job(conn, request)
+            thread = threading.Thread(target=reap, args=(pid, conn))
+            thread.daemon = True
+            thread.start()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        os.remove(socketPath)
+
+
+def run_client(socketPath, tool, args):
+    """
+    Run a tool through the daemon, returns its exit status or None if no daemon is listening.  The request holds the
+    environment so nothing is sent to a socket or a daemon of another user.
+    """
+    if not os.path.lexists(socketPath):
+        return None
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        check_socket(socketPath)
+        conn.connect(socketPath)
+        check_peer(conn)
+    except socket.error:
+        conn.close()
+        return None
+    except Exception as e:
+        conn.close()
+        sys.stderr.write('Error not using the build daemon: {}\n'.format(e))
+        return None
+    request = {'tool': tool, 'args': args, 'cwd': os.getcwd(), 'env': dict(os.environ)}
+    conn.sendall(json.dumps(request) + '\n')
+    code = 1
+    connFile = conn.makefile('r')
+    try:
+        for line in connFile:
+            message = json.loads(line)
+            if 'stdout' in message:
+                sys.stdout.write(message['stdout'].encode('latin-1'))
+                sys.stdout.flush()
+            elif 'stderr' in message:
+                sys.stderr.write(message['stderr'].encode('latin-1'))
+            elif 'exit' in message:
+                code = message['exit']
+                break
+        else:
+            sys.stderr.write('Error the build daemon closed the connection\n')
+    finally:
+        connFile.close()
+        conn.close()
+    return code
+
+
+def __make_parser():
+    p = argparse.ArgumentParser(description='This runs the build tools through a long running daemon',
+                                usage='%(prog)s [-h] [-S SOCKET] [--serve [-j JOBS] [-k KEY_DIR]] [tool [args ...]]')
+    p.add_argument('-S', '--socket', type=str, default=None,
+                   help='the daemon socket (default: $BUILD_DAEMON_SOCKET, $XDG_RUNTIME_DIR/build-tools.sock or '
+                        '/tmp/build-tools-<uid>/daemon.sock)')
+    p.add_argument('--serve', action='store_true', help='run the daemon')
+    p.add_argument('-j', '--jobs', type=int, default=None,
+                   help='number of jobs the daemon runs at the same time (default: cpu count)')
+    p.add_argument('-k', '--key-dir', type=str, action='append', default=[],
+                   help='directory of keys the daemon parses on startup (can be specified multiple times)')
+    p.add_argument('--no-fallback', action='store_true',
+                   help='fail instead of running the tool in this process when no daemon is listening')
+    p.add_argument('tool', nargs='?', choices=TOOLS, help='the tool to run')
+    p.add_argument('args', nargs=argparse.REMAINDER, help='the arguments for the tool')
+    return p
+
+
+def __main(argv):
+    parser = __make_parser()
+    settings = parser.parse_args(argv[1:])
+    socketPath = settings.socket or default_socket_path()
+
+    if settings.serve:
+        try:
+            serve(socketPath, settings.jobs or multiprocessing.cpu_count(), settings.key_dir)
+        except Exception as e:
+            sys.stderr.write('Error running the build daemon: {}\n'.format(e))
+            sys.exit(1)
+        sys.exit(0)
+
+    if settings.tool is None:
+        sys.stderr.write('Error a tool to run is required\n')
+        sys.exit(1)
+    code = run_client(socketPath, settings.tool, settings.args)
+    if code is None:
+        if settings.no_fallback:
+            sys.stderr.write('Error no build daemon is listening on {}\n'.format(socketPath))
+            sys.exit(1)
+        code = run_tool(settings.tool, settings.args)
+    sys.exit(code)
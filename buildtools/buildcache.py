@@ -0,0 +1,117 @@
+"""Utility to cache the output of build steps keyed by a hash of their inputs.
+
+A build step is cached by taking a snapshot of the directory it runs in before and after it runs, the paths that
+were added or changed are stored in a tar under the cache key together with the list of deleted paths.  Restoring
+the entry replays those changes on a directory with the same inputs without running the step again.
+"""
+import hashlib
+import io
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+
+DELETED_MEMBER = '.buildcache-deleted.json'
+
+
+def hash_file(filename):
+    sha256 = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        while True:
+            chunk = f.read(64 * 1024)
+            if len(chunk) == 0:
+                break
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def snapshot(root_dir, exclude_dirs=()):
+    """Return a dict of every path below root_dir with its type, content hash (or link target) and mode.
+
+    Args:
+        root_dir (str): directory to snapshot
+        exclude_dirs (list): relative directories that are left out of the snapshot
+    Returns:
+        dict of relative path to [type, sha256 or link target, mode]
+    """
+    entries = {}
+    for dirpath, dirnames, filenames in os.walk(root_dir):
+        reldir = os.path.relpath(dirpath, root_dir)
+        dirnames[:] = [name for name in dirnames if os.path.normpath(os.path.join(reldir, name)) not in exclude_dirs]
+        for name in dirnames + filenames:
+            path = os.path.join(dirpath, name)
+            relpath = os.path.normpath(os.path.join(reldir, name))
+            mode = os.lstat(path).st_mode & 07777
+            if os.path.islink(path):
+                entries[relpath] = ['symlink', os.readlink(path), mode]
+            elif os.path.isdir(path):
+                entries[relpath] = ['dir', None, mode]
+            else:
+                entries[relpath] = ['file', hash_file(path), mode]
+    return entries
+
+
+def cache_key(entries, extra=None):
+    """Hash a snapshot (and any extra settings the step depends on) into a cache key."""
+    sha256 = hashlib.sha256()
+    sha256.update(json.dumps(sorted(entries.iteritems())))
+    sha256.update(json.dumps(extra, sort_keys=True))
+    return sha256.hexdigest()
+
+
+def changes(before, after):
+    """Return (changed, deleted) sorted lists of relative paths between two snapshots."""
+    changed = sorted(path for path, entry in after.iteritems() if before.get(path) != entry)
+    removed = set(path for path in before if path not in after)
+    # only the top of a deleted tree needs to be recorded
+    deleted = sorted(path for path in removed if os.path.dirname(path) not in removed)
+    return changed, deleted
+
+
+def entry_path(cache_dir, key):
+    return os.path.join(cache_dir, key + '.tar')
+
+
+def store(cache_dir, key, root_dir, changed, deleted):
+    """Store the changed paths of root_dir and the deleted paths in the cache under key."""
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    # write a private file and rename it in place so concurrent builds never read a partial entry
+    fd, tmp_path = tempfile.mkstemp(prefix=key + '-', suffix='.tmp', dir=cache_dir)
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            with tarfile.open(fileobj=tmp_file, mode='w') as tar:
+                for relpath in changed:
+                    tar.add(os.path.join(root_dir, relpath), arcname=relpath, recursive=False)
+                deleted_str = json.dumps(deleted)
+                tarinfo = tarfile.TarInfo(DELETED_MEMBER)
+                tarinfo.size = len(deleted_str)
+                tar.addfile(tarinfo, io.BytesIO(deleted_str))
+        os.rename(tmp_path, entry_path(cache_dir, key))
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def restore(cache_dir, key, root_dir):
+    """Replay the cache entry for key on root_dir, returns False if there is no entry."""
+    if cache_dir is None or not os.path.isfile(entry_path(cache_dir, key)):
+        return False
+    with tarfile.open(entry_path(cache_dir, key), 'r') as tar:
+        deleted = json.load(tar.extractfile(DELETED_MEMBER))
+        members = [member for member in tar.getmembers() if member.name != DELETED_MEMBER]
+        # changed paths are replaced rather than written through, directories are merged
+        replaced = [member.name for member in members
+                    if not (member.isdir() and os.path.isdir(os.path.join(root_dir, member.name)))]
+        for relpath in deleted + replaced:
+            path = os.path.join(root_dir, relpath)
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path)
+            elif os.path.lexists(path):
+                os.remove(path)
+        tar.extractall(root_dir, members)
+    # touch the entry so the least recently used entries can be found
+    os.utime(entry_path(cache_dir, key), None)
+    return True
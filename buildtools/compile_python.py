@@ -0,0 +1,83 @@
+"""
+This script takes an input and ouput directory as arguments and will
+compile all python files in the input directory and place the compiled
+python in the output directory.
+"""
+
+import os
+import sys
+import argparse
+import py_compile
+
+
+def __make_parser():
+    p = argparse.ArgumentParser(
+        description='Given an input and output directory this will compile all .py files in the input direcotry and \
+                     place the compiled outputs in the output direcotry')
+    p.add_argument('-v', '--verbose', action='store_true', help='Verbose output', required=False)
+    p.add_argument('-i', '--input-dir', type=str, help='path to the input direcotry', required=True)
+    p.add_argument('-o', '--output-dir', type=str, help='path the the output directory', required=True)
+    p.add_argument('-c', '--create-output-dir', action='store_true',
+                   help='create the output directory if it does not exist', required=False)
+    return p
+
+
+def get_outdir(dirpath, input_dir, output_dir):
+    outdir = output_dir
+    if (dirpath != input_dir):
+        if (dirpath.startswith(input_dir)):
+            subdir = dirpath[len(input_dir) + len(os.path.sep):]
+            outdir = os.path.join(outdir, subdir)
+            if not os.path.exists(outdir):
+                os.makedirs(outdir)
+        else:
+            raise Exception("Error invalid path {}".format(dirpath))
+
+    return outdir
+
+
+def compile_dir(input_dir, output_dir, verbose=False):
+    """Compile every .py file below input_dir to a .pyc in the same place below output_dir."""
+    input_dir = os.path.abspath(input_dir)
+    output_dir = os.path.abspath(output_dir)
+
+    for (dirpath, _dirnames, filenames) in os.walk(input_dir):
+        for f in filenames:
+            if (f.endswith(os.path.extsep + 'py')):
+                try:
+                    outdir = get_outdir(dirpath, input_dir, output_dir)
+                except Exception:
+                    raise Exception("cannot create output directory")
+                outfile = os.path.join(outdir, f + 'c')
+                infile = os.path.join(dirpath, f)
+                if (verbose):
+                    print 'Compiling file {} to output {}'.format(infile, outfile)
+                try:
+                    py_compile.compile(infile, outfile, doraise=True)
+                except Exception as e:
+                    print e
+                    raise Exception("compiling file {}".format(infile))
+
+
+def __main(argv):
+    parser = __make_parser()
+    settings = parser.parse_args(argv[1:])
+
+    if (not os.path.isdir(settings.input_dir)):
+        sys.stderr.write("Error input directory {} does not exist\n".format(settings.input_dir))
+        sys.exit(1)
+    if (settings.create_output_dir):
+        if not os.path.exists(settings.output_dir):
+            os.makedirs(settings.output_dir)
+    else:
+        if (not os.path.isdir(settings.output_dir)):
+            sys.stderr.write("Error output directory {} does not exist\n".format(settings.output_dir))
+            sys.exit(1)
+
+    try:
+        compile_dir(settings.input_dir, settings.output_dir, settings.verbose)
+    except Exception as e:
+        sys.stderr.write("Error {}\n".format(e))
+        sys.exit(1)
+
+    sys.exit(0)
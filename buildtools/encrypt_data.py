@@ -0,0 +1,376 @@
+# This python script encrypts any file as a .enc.  The .enc file is
+# an encrypted file that is signed with a signing private key.
+# You will have to install the python-crypto package if it is not already installed.
+# Useful resources:
+# https://www.dlitz.net/software/pycrypto/api/current/Crypto.Signature.PKCS1_v1_5-module.html
+# https://www.dlitz.net/software/pycrypto/api/current/Crypto.PublicKey.RSA._RSAobj-class.html#sign
+# https://www.dlitz.net/software/pycrypto/api/current/Crypto.Cipher.PKCS1_OAEP-module.html
+# http://www.laurentluce.com/posts/python-and-cryptography-with-pycrypto/
+#
+# The .enc file has the following format:
+# +------------------------+
+# +       signature        +
+# +      [512 bytes]       +
+# +------------------------+
+# + RSA encrypted password +
+# +      [512 bytes]       +
+# +------------------------+
+# +   RSA encrypted salt   +
+# +      [512 bytes]       +
+# +------------------------+
+# + RSA encrypted filename +
+# +      [512 bytes]       +
+# +------------------------+
+# +      Symmetric Key     +
+# +    encrypted package   +
+# +       [file.pack]      +
+# +------------------------+
+#
+# When more than one encryption key is given the password, salt and filename
+# blocks are repeated once per recipient (a key-wrap table) in the order the
+# keys were given, all of them are covered by the signature and the package
+# itself is only encrypted once.  The key header (-a) then lists the hash of
+# every recipient key in 'encKeys' so the decrypter can pick its entry.
+
+import sys
+import argparse
+import os
+import string
+import random
+import binascii
+from hashlib import md5
+from json import dumps
+
+# pycrypto is imported by the functions that use it, importing it (Crypto.Random in particular) is a large part of
+# the startup time and --help, argument errors and the tools that only need the key helpers do not need it
+SIGNATURE_LEN = 512
+AES_BLOCK_SIZE = 16
+
+# parsed RSA keys keyed by filename, key parsing is expensive and the same keys are used for every file
+_rsa_keys = {}
+
+
+def load_rsa_key(key_filename):
+    """Import an RSA key file, keys are only parsed once per process (again if the file changes)."""
+    key_filename = os.path.abspath(key_filename)
+    st = os.stat(key_filename)
+    if key_filename not in _rsa_keys or _rsa_keys[key_filename][0] != (st.st_mtime, st.st_size):
+        from Crypto.PublicKey import RSA
+        with open(key_filename, 'r') as f:
+            _rsa_keys[key_filename] = ((st.st_mtime, st.st_size), RSA.importKey(f.read()))
+    return _rsa_keys[key_filename][1]
+
+
+def random_password_generator(length):
+    return ''.join([random.choice(string.printable) for _ in xrange(length)]).replace('\n', '')
+
+
+def derive_key_iv(password, salt):
+    KEY_LENGTH = 32
+    IV_LENGTH = AES_BLOCK_SIZE
+    if len(password) > 32:
+        password = password[0:32]
+
+    d = d_i = ''
+    while len(d) < KEY_LENGTH + IV_LENGTH:
+        d_i = md5(d_i + password + salt).digest()
+        d += d_i
+    return d[:KEY_LENGTH], d[KEY_LENGTH:KEY_LENGTH+IV_LENGTH]
+
+
+def as_key_list(public_key):
+    """Encryption keys can be given as a single filename or a list of recipient key filenames."""
+    if isinstance(public_key, basestring):
+        return [public_key]
+    return list(public_key)
+
+
+def encrypt_file(in_filename, public_key, nofilename, outputdir, verbose):
+    if verbose:
+        print 'encrypting ' + in_filename
+        print 'RSA key ' + ', '.join(as_key_list(public_key))
+    from Crypto import Random
+    from Crypto.Cipher import AES, PKCS1_OAEP
+
+    BLOCK_SIZE = AES.block_size
+    MODE = AES.MODE_CBC
+    CHUNK_SIZE = BLOCK_SIZE*1024  # CHUNK_SIZE is the size to read in bytes
+
+    password = random_password_generator(32)
+    if verbose:
+        print 'Random Password (hexlify ASCII binary) ' + binascii.hexlify(password)
+    salt = Random.new().read(BLOCK_SIZE - len('Salted__'))
+    if verbose:
+        print 'Random Salt (hexlify ASCII binary)' + binascii.hexlify(salt)
+
+    key, IV = derive_key_iv(password, salt)
+    if verbose:
+        print 'IV: ' + binascii.hexlify(IV)
+        print 'KEY: ' + binascii.hexlify(key)
+
+    key_wraps = []
+    for recipient_key in as_key_list(public_key):
+        cipher = PKCS1_OAEP.new(load_rsa_key(recipient_key))
+        key_wraps.append((cipher.encrypt(password), cipher.encrypt('Salted__' + salt),
+                          cipher.encrypt(os.path.basename(in_filename))))
+
+    encryptor = AES.new(key, MODE, IV)
+
+    # out_filename = os.path.splitext(in_filename)[0] + '.pack'
+    if outputdir is None:
+        outputdir = os.path.dirname(in_filename)
+    out_filename = os.path.join(outputdir, os.path.splitext(os.path.basename(in_filename))[0] + '.pack')
+
+    with open(in_filename, 'rb') as infile:
+        with open(out_filename, 'wb') as outfile:
+            for enc_pass, enc_salt, enc_filename in key_wraps:
+                outfile.write(enc_pass)
+                outfile.write(enc_salt)
+                if not nofilename:
+                    outfile.write(enc_filename)
+
+            finished = False
+            while not finished:
+                chunk = infile.read(CHUNK_SIZE)
+                if len(chunk) == 0 or len(chunk) % BLOCK_SIZE != 0:
+                    padding_length = (BLOCK_SIZE - len(chunk) % BLOCK_SIZE) or BLOCK_SIZE
+                    chunk += padding_length * chr(padding_length)
+                    finished = True
+                outfile.write(encryptor.encrypt(chunk))
+            outfile.close()
+        infile.close()
+
+    return out_filename
+
+
+class SignedEncryptWriter(object):
+    """
+    File like object that AES encrypts everything written to it straight into outfile and signs the result in the
+    same pass.  The output has the same layout as sign_module(encrypt_file()) but the space for the signature is
+    reserved up front and filled in on close so the encrypted payload is only written once and never read back.
+    outfile must be seekable and is left open.
+    """
+
+    def __init__(self, outfile, public_key, private_key, filename=None, header=None, verbose=False):
+        from Crypto import Random
+        from Crypto.Cipher import AES, PKCS1_OAEP
+        from Crypto.Hash import SHA256
+        from Crypto.Signature import PKCS1_v1_5
+        self.outfile = outfile
+        self.verbose = verbose
+        self.sha256 = SHA256.new()
+        self.signer = PKCS1_v1_5.new(load_rsa_key(private_key))
+        self.pending = ''
+        self.size = 0
+
+        if header:
+            outfile.write(header)
+        self.signature_offset = outfile.tell()
+        outfile.write('\0' * SIGNATURE_LEN)
+
+        password = random_password_generator(32)
+        salt = Random.new().read(AES.block_size - len('Salted__'))
+        key, IV = derive_key_iv(password, salt)
+        if verbose:
+            print 'RSA key ' + ', '.join(as_key_list(public_key))
+            print 'IV: ' + binascii.hexlify(IV)
+            print 'KEY: ' + binascii.hexlify(key)
+
+        if isinstance(filename, unicode):
+            filename = filename.encode('utf-8')
+        # one key-wrap entry per recipient, the payload below is only encrypted once
+        for recipient_key in as_key_list(public_key):
+            cipher = PKCS1_OAEP.new(load_rsa_key(recipient_key))
+            self.__write(cipher.encrypt(password))
+            self.__write(cipher.encrypt('Salted__' + salt))
+            if filename is not None:
+                self.__write(cipher.encrypt(filename))
+        self.encryptor = AES.new(key, AES.MODE_CBC, IV)
+
+    def __write(self, data):
+        self.sha256.update(data)
+        self.outfile.write(data)
+
+    def write(self, data):
+        self.size += len(data)
+        data = self.pending + data
+        usable = len(data) - len(data) % AES_BLOCK_SIZE
+        if usable:
+            self.__write(self.encryptor.encrypt(data[:usable]))
+        self.pending = data[usable:]
+
+    def close(self):
+        padding_length = AES_BLOCK_SIZE - len(self.pending)
+        self.__write(self.encryptor.encrypt(self.pending + padding_length * chr(padding_length)))
+        self.pending = ''
+        signature = self.signer.sign(self.sha256)
+        if len(signature) != SIGNATURE_LEN:
+            raise Exception('Signing key must produce a %d byte signature' % (SIGNATURE_LEN))
+        if self.verbose:
+            print 'sha256 sum of enc file ' + self.sha256.hexdigest()
+        end = self.outfile.tell()
+        self.outfile.seek(self.signature_offset)
+        self.outfile.write(signature)
+        self.outfile.seek(end)
+
+
+def encrypt_sign_file(in_filename, out_filename, public_key, private_key, nofilename=False, header=None,
+                      verbose=False):
+    """Encrypt and sign in_filename into out_filename in a single pass without an intermediate .pack file."""
+    CHUNK_SIZE = AES_BLOCK_SIZE*1024
+    if verbose:
+        print 'encrypting ' + in_filename
+    filename = None if nofilename else os.path.basename(in_filename)
+    try:
+        with open(in_filename, 'rb') as infile:
+            with open(out_filename, 'wb') as outfile:
+                writer = SignedEncryptWriter(outfile, public_key, private_key, filename, header, verbose)
+                while True:
+                    chunk = infile.read(CHUNK_SIZE)
+                    if len(chunk) == 0:
+                        break
+                    writer.write(chunk)
+                writer.close()
+    except Exception:
+        if os.path.exists(out_filename):
+            os.remove(out_filename)
+        raise
+    return out_filename
+
+
+def get_sha256(in_filename):
+    from Crypto.Hash import SHA256
+    CHUNK_SIZE = 16*1024
+    file_sha256_checksum = SHA256.new()
+    with open(in_filename, 'rb') as infile:
+        while True:
+            chunk = infile.read(CHUNK_SIZE)
+            if len(chunk) == 0:
+                break
+            file_sha256_checksum.update(chunk)
+        infile.close()
+    return file_sha256_checksum
+
+
+def build_key_header(public_key, private_key):
+    """Build the length prefixed json header identifying the keys used to encrypt and sign a file."""
+    privatersa_sha256 = get_sha256(private_key)
+    publicrsa_sha256s = [get_sha256(recipient_key).hexdigest() for recipient_key in as_key_list(public_key)]
+    header = {'encKey': publicrsa_sha256s[0],
+              'sigKey': privatersa_sha256.hexdigest()}
+    if len(publicrsa_sha256s) > 1:
+        header['encKeys'] = publicrsa_sha256s
+    headerStr = dumps(header).rstrip('\n')
+    return str(len(headerStr)) + '#' + headerStr
+
+
+def sign_module(in_filename, public_key, private_key, extension, outputdir, addkeyheader, verbose, fileHeader=None):
+    CHUNK_SIZE = 16*1024
+    if verbose:
+        print 'signing ' + in_filename
+        print 'RSA key ' + private_key
+        print '{} {}'.format('encrypted file size', os.path.getsize(in_filename))
+        print 'extension ' + extension
+
+    privatersa_key = load_rsa_key(private_key)
+
+    file_sha256_checksum = get_sha256(in_filename)
+    sha256sum = file_sha256_checksum.hexdigest()
+    if verbose:
+        print 'sha256 sum of enc file ' + sha256sum
+
+    from Crypto.Signature import PKCS1_v1_5
+    signer = PKCS1_v1_5.new(privatersa_key)
+    signature = signer.sign(file_sha256_checksum)
+
+    if outputdir is None:
+        outputdir = os.path.dirname(in_filename)
+    out_filename = os.path.join(outputdir, os.path.splitext(os.path.basename(in_filename))[0] + extension)
+    print out_filename
+
+    with open(in_filename, 'rb') as infile:
+        with open(out_filename, 'wb') as outfile:
+            if addkeyheader:
+                outfile.write(build_key_header(public_key, private_key))
+            elif fileHeader:
+                with open(fileHeader, 'r') as fh:
+                    headerStr = fh.read()
+                    outfile.write(headerStr)
+            outfile.write(signature)
+
+            while True:
+                chunk = infile.read(CHUNK_SIZE)
+                if len(chunk) == 0:
+                    break
+                outfile.write(chunk)
+            outfile.close()
+        infile.close()
+
+    os.remove(in_filename)
+
+
+def __make_parser():
+    p = argparse.ArgumentParser(description='This packages any file into an encrypted enc file')
+    p.add_argument('-t', '--target', type=str, help='path to the file that you would like encrypted', required=True)
+    p.add_argument('-e', '--encryptionkey', type=str, action='append',
+                   help='the public key used to encrypt the module, may be given multiple times to encrypt the file \
+                         once for several recipients', default=None, required=False)
+    p.add_argument('-s', '--signingkey', type=str,
+                   help='the private key used to sign the module', default=None, required=False)
+    p.add_argument('-m', '--module', action='store_true', help='this is a module', required=False)
+    p.add_argument('-n', '--nofilename', action='store_true',
+                   help='do not include the filename in the package', default=False, required=False)
+    p.add_argument('-v', '--verbose', action='store_true',
+                   help='verbose message printing', default=False, required=False)
+    p.add_argument('-d', '--output-directory', type=str,
+                   help='specify an alternate output directory for the encrypted file', default=None, required=False)
+    p.add_argument('-a', '--add-key-header', action='store_true',
+                   help='add a json header indicating the keys used to encrypt', default=False, required=False)
+    p.add_argument('-H', '--add-file-header', type=str,
+                   help='add a json header the specified file', default=None, required=False)
+    return p
+
+
+def __main(argv):
+    parser = __make_parser()
+    settings = parser.parse_args(argv[1:])
+
+    if (not os.path.isfile(settings.target)):
+        sys.stderr.write('Error file you supplied is invalid\n')
+        sys.exit(1)
+
+    settings.target = os.path.abspath(settings.target)
+
+    filename = settings.target
+
+    if settings.module:
+        extension = '.mod'
+    if not settings.module:
+        extension = '.enc'
+
+    if settings.encryptionkey is not None and settings.signingkey is not None:
+        # encrypt and sign in one pass straight to the output file
+        outputdir = settings.output_directory
+        if outputdir is None:
+            outputdir = os.path.dirname(filename)
+        out_filename = os.path.join(outputdir, os.path.splitext(os.path.basename(filename))[0] + extension)
+        header = None
+        if settings.add_key_header:
+            header = build_key_header(settings.encryptionkey, settings.signingkey)
+        elif settings.add_file_header:
+            with open(settings.add_file_header, 'r') as fh:
+                header = fh.read()
+        encrypt_sign_file(filename, out_filename, settings.encryptionkey, settings.signingkey, settings.nofilename,
+                          header, settings.verbose)
+        print out_filename
+        sys.exit(0)
+
+    if (settings.encryptionkey is not None):
+        enc_filename = encrypt_file(filename, settings.encryptionkey, settings.nofilename,
+                                    settings.output_directory, settings.verbose)
+
+    if (settings.signingkey is not None):
+        sign_module(enc_filename, settings.encryptionkey, settings.signingkey, extension,
+                    settings.output_directory, settings.add_key_header, settings.verbose, settings.add_file_header)
+
+    sys.exit(0)
@@ -0,0 +1,173 @@
+# This python script extracts a seekable romg (package-romg.py --seekable).
+# A seekable romg is a regular gzip compressed tar made of several gzip
+# members, each module and the base start a new member.  The header json
+# written next to the romg lists the members:
+#
+#   "index": {"format": "gzip-members",
+#             "members": [{"path": "data/base/modules/modules/mod-a",
+#                          "offset": 1234, "size": 5678,
+#                          "uncompressedOffset": 10240, "uncompressedSize": 40960}, ...]}
+#
+# offset/size are the compressed byte range of the member in the romg,
+# members with the path '.' hold everything outside of a module or the base.
+# Each member only holds whole tar entries so it can be decompressed and
+# extracted on its own, which allows pulling a single module out of a romg
+# without decompressing the rest and decompressing all members in parallel.
+#
+# Extract a single module:
+#   extract-romg.py -r test_1.0.0.romg -p data/base/modules/modules/mod-a -d out
+# Extract everything using all cpus:
+#   extract-romg.py -r test_1.0.0.romg -d out
+
+import sys
+import argparse
+import errno
+import json
+import multiprocessing
+import os
+import tarfile
+import zlib
+
+READ_SIZE = 1024 * 1024
+
+
+class MemberReader(object):
+    """File like object that decompresses a single gzip member of a romg."""
+
+    def __init__(self, romgFile, offset, size):
+        self.romgFile = open(romgFile, 'rb')
+        self.romgFile.seek(offset)
+        self.remaining = size
+        self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self.buf = ''
+
+    def read(self, size=-1):
+        while (size < 0 or len(self.buf) < size) and self.remaining > 0:
+            chunk = self.romgFile.read(min(READ_SIZE, self.remaining))
+            if len(chunk) == 0:
+                raise IOError('Truncated romg')
+            self.remaining -= len(chunk)
+            self.buf += self.decompressor.decompress(chunk)
+        if size < 0:
+            data, self.buf = self.buf, ''
+        else:
+            data, self.buf = self.buf[:size], self.buf[size:]
+        return data
+
+    def close(self):
+        self.romgFile.close()
+
+
+def read_index(headerFile):
+    with open(headerFile, 'r') as f:
+        header = json.load(f)
+    index = header.get('index')
+    if index is None or index.get('format') != 'gzip-members':
+        raise Exception('{} does not describe a seekable romg'.format(headerFile))
+    return index['members']
+
+
+def select_members(members, paths):
+    """Return the members holding any of paths (or all members when no paths are given)."""
+    if not paths:
+        return members
+    selected = []
+    for path in paths:
+        path = os.path.normpath(path)
+        found = [m for m in members if m['path'] == path or m['path'].startswith(path + '/')]
+        if len(found) == 0:
+            raise Exception('{} is not indexed in the romg'.format(path))
+        selected.extend(m for m in found if m not in selected)
+    return selected
+
+
+def extract_member(romgFile, member, outputDir):
+    reader = MemberReader(romgFile, member['offset'], member['size'])
+    try:
+        with tarfile.open(fileobj=reader, mode='r|') as tar:
+            names = set()
+            for tarinfo in tar:
+                # a hardlink to an entry of another member could not be extracted without that member
+                if tarinfo.islnk() and os.path.normpath(tarinfo.linkname) not in names:
+                    raise Exception('{} in member {} links to {} outside of the member'.format(
+                        tarinfo.name, member['path'], tarinfo.linkname))
+                names.add(os.path.normpath(tarinfo.name))
+                tar.extract(tarinfo, outputDir)
+    finally:
+        reader.close()
+    return member['path']
+
+
+def _extract_member_job(args):
+    return extract_member(*args)
+
+
+def extract_romg(romgFile, headerFile, outputDir, paths=None, jobs=None, verbose=False):
+    members = select_members(read_index(headerFile), paths)
+    # the '.' members hold the dirs the modules and the base are in, they are extracted first so the members
+    # extracted in parallel never create the same dirs at the same time (tarfile fails when another process wins)
+    results = [extract_member(romgFile, member, outputDir) for member in members if member['path'] == '.']
+    segments = [member for member in members if member['path'] != '.']
+    for member in segments:
+        parentDir = os.path.join(outputDir, os.path.dirname(member['path']))
+        try:
+            os.makedirs(parentDir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+    jobArgs = [(romgFile, member, outputDir) for member in segments]
+    jobs = min(jobs or multiprocessing.cpu_count(), len(jobArgs))
+    if jobs > 1:
+        pool = multiprocessing.Pool(jobs)
+        try:
+            results.extend(pool.map(_extract_member_job, jobArgs))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results.extend(_extract_member_job(args) for args in jobArgs)
+    if verbose:
+        for path in results:
+            print 'extracted ' + path
+    return results
+
+
+def __make_parser():
+    p = argparse.ArgumentParser(description='This extracts all or part of a seekable romg')
+    p.add_argument('-r', '--romg', type=str, help='the romg file', required=True)
+    p.add_argument('-H', '--header', type=str,
+                   help='the romg header json, defaults to <romg>_header.json next to the romg', default=None)
+    p.add_argument('-p', '--path', type=str, action='append', default=[],
+                   help='only extract this module or base path (can be specified multiple times)')
+    p.add_argument('-d', '--output-directory', type=str, help='the directory to extract to', default='.')
+    p.add_argument('-j', '--jobs', type=int, help='number of members to decompress in parallel (default: cpu count)',
+                   default=None)
+    p.add_argument('-l', '--list', action='store_true', help='list the indexed members instead of extracting')
+    p.add_argument('-v', '--verbose', action='store_true', help='verbose message printing')
+    return p
+
+
+def __main(argv):
+    parser = __make_parser()
+    settings = parser.parse_args(argv[1:])
+
+    if not os.path.isfile(settings.romg):
+        sys.stderr.write('Error romg is not a valid file\n')
+        sys.exit(1)
+    if settings.header is None:
+        settings.header = os.path.splitext(settings.romg)[0] + '_header.json'
+    if not os.path.isfile(settings.header):
+        sys.stderr.write('Error romg header is not a valid file\n')
+        sys.exit(1)
+    try:
+        if settings.list:
+            for member in select_members(read_index(settings.header), settings.path):
+                print '{path} {offset} {size} {uncompressedSize}'.format(**member)
+        else:
+            extract_romg(settings.romg, settings.header, settings.output_directory, settings.path, settings.jobs,
+                         settings.verbose)
+    except Exception as e:
+        sys.stderr.write('Error extracting romg: {}\n'.format(e))
+        sys.exit(1)
+
+    sys.exit(0)
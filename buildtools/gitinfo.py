@@ -0,0 +1,163 @@
+"""Utility to read the HEAD commit and branch of a git checkout without running git.
+
+The git dir is found by walking up from the given path, a .git file (worktrees and submodules) is followed to the
+real git dir and its commondir.  HEAD is resolved through loose refs and packed-refs.  Every function returns None
+when the checkout uses something this does not understand (reftable, an unborn branch, ...) so the caller can fall
+back to running git.
+"""
+import glob
+import os
+import re
+import struct
+
+SHA1_RE = re.compile(r'^[0-9a-f]{40}$')
+MIN_ABBREV = 7
+IDX_V2_MAGIC = '\377tOc'
+MAX_SYMREF_DEPTH = 5
+
+
+def _read(path):
+    try:
+        with open(path, 'r') as f:
+            return f.read().strip()
+    except (IOError, OSError):
+        return None
+
+
+def find_git_dir(path):
+    """Return (git_dir, common_dir) of the checkout holding path, None if it is not in one."""
+    path = os.path.abspath(path)
+    while True:
+        dotgit = os.path.join(path, '.git')
+        if os.path.isdir(dotgit):
+            git_dir = dotgit
+            break
+        if os.path.isfile(dotgit):
+            content = _read(dotgit)
+            if content is None or not content.startswith('gitdir:'):
+                return None
+            git_dir = os.path.normpath(os.path.join(path, content[len('gitdir:'):].strip()))
+            break
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+    common_dir = git_dir
+    commondir = _read(os.path.join(git_dir, 'commondir'))
+    if commondir:
+        common_dir = os.path.normpath(os.path.join(git_dir, commondir))
+    if os.path.exists(os.path.join(common_dir, 'reftable')):
+        return None
+    return git_dir, common_dir
+
+
+def packed_refs(common_dir):
+    refs = {}
+    content = _read(os.path.join(common_dir, 'packed-refs'))
+    for line in (content or '').splitlines():
+        if not line or line[0] in '#^':
+            continue
+        parts = line.split(' ', 1)
+        if len(parts) == 2:
+            refs[parts[1]] = parts[0]
+    return refs
+
+
+def resolve_ref(git_dir, common_dir, ref):
+    """Return the commit a ref (or HEAD) points to, following symbolic refs."""
+    for _depth in range(MAX_SYMREF_DEPTH):
+        # HEAD and the other per worktree refs live in git_dir, shared refs in common_dir
+        value = _read(os.path.join(git_dir, ref))
+        if value is None and common_dir != git_dir:
+            value = _read(os.path.join(common_dir, ref))
+        if value is None:
+            value = packed_refs(common_dir).get(ref)
+        if value is None:
+            return None
+        if value.startswith('ref:'):
+            ref = value[len('ref:'):].strip()
+            continue
+        return value if SHA1_RE.match(value) else None
+    return None
+
+
+def head_hash(path):
+    """Return the full commit hash of HEAD of the checkout holding path."""
+    dirs = find_git_dir(path)
+    if dirs is None:
+        return None
+    return resolve_ref(dirs[0], dirs[1], 'HEAD')
+
+
+def _sets_abbrev(config_file):
+    content = _read(config_file)
+    return content is not None and 'abbrev' in content.lower()
+
+
+def pack_hashes(idx_file, first_byte):
+    """Return (object count, hashes starting with first_byte) of a pack index."""
+    with open(idx_file, 'rb') as f:
+        header = f.read(8)
+        if header[:4] == IDX_V2_MAGIC:
+            fanout_offset, entry_size, sha_offset = 8, 20, 0
+        else:
+            fanout_offset, entry_size, sha_offset = 0, 24, 4
+        f.seek(fanout_offset)
+        fanout = struct.unpack('>256I', f.read(256 * 4))
+        first = fanout[first_byte - 1] if first_byte > 0 else 0
+        f.seek(fanout_offset + 256 * 4 + first * entry_size)
+        data = f.read((fanout[first_byte] - first) * entry_size)
+    hashes = [data[i + sha_offset:i + sha_offset + 20].encode('hex') for i in range(0, len(data), entry_size)]
+    return fanout[255], hashes
+
+
+def short_hash(path):
+    """Return the abbreviated HEAD commit hash, like git rev-parse --short HEAD.
+
+    The length scales with the number of packed objects and grows until the prefix is unique, as git does.
+    """
+    dirs = find_git_dir(path)
+    if dirs is None:
+        return None
+    commit = resolve_ref(dirs[0], dirs[1], 'HEAD')
+    objects_dir = os.path.join(dirs[1], 'objects')
+    # a configured abbrev or objects in another repository are left to git
+    configs = [os.path.join(dirs[1], 'config'), '/etc/gitconfig', os.path.expanduser('~/.gitconfig'),
+               os.path.expanduser('~/.config/git/config')]
+    if commit is None or os.path.exists(os.path.join(objects_dir, 'info', 'alternates')) or \
+            any(_sets_abbrev(config) for config in configs):
+        return None
+    count = 0
+    others = set()
+    for idx_file in glob.glob(os.path.join(objects_dir, 'pack', '*.idx')):
+        try:
+            pack_count, hashes = pack_hashes(idx_file, int(commit[:2], 16))
+        except (IOError, OSError, struct.error):
+            return None
+        count += pack_count
+        others.update(hashes)
+    loose_dir = os.path.join(objects_dir, commit[:2])
+    if os.path.isdir(loose_dir):
+        others.update(commit[:2] + name for name in os.listdir(loose_dir) if len(name) == 38)
+    others.discard(commit)
+    # git expects a collision around 2^(bits/2) objects and uses 4 bits per hex digit
+    length = max(MIN_ABBREV, (count.bit_length() + 1) // 2)
+    while length < len(commit) and any(other.startswith(commit[:length]) for other in others):
+        length += 1
+    return commit[:length]
+
+
+def branch(path):
+    """Return the branch checked out in path, 'HEAD' when detached like git rev-parse --abbrev-ref HEAD."""
+    dirs = find_git_dir(path)
+    if dirs is None:
+        return None
+    head = _read(os.path.join(dirs[0], 'HEAD'))
+    if head is None:
+        return None
+    if not head.startswith('ref:'):
+        return 'HEAD' if SHA1_RE.match(head) else None
+    ref = head[len('ref:'):].strip()
+    if not ref.startswith('refs/heads/') or resolve_ref(dirs[0], dirs[1], ref) is None:
+        return None
+    return ref[len('refs/heads/'):]
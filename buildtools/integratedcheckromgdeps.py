@@ -0,0 +1,292 @@
+"""Utility to Check if all dependencies are met for a set of module tgzs."""
+import argparse
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+import tarfile
+
+logger = logging.Logger('check-romg-deps')
+
+
+def __make_parser():
+    p = argparse.ArgumentParser(description='This extracts module.json files from a set of module tgzs '
+                                            'and checks dependencies')
+    p.add_argument('-b', '--base-path', type=str, help="the path to bits base module tgz", default=None,
+                   required=True)
+    p.add_argument('-m', '--module-path-list', nargs="+", type=str,
+                   help='the list of module tgz locations to be checked for dependencies', default=None, required=True)
+    p.add_argument('-o', '--order-output', type=str, default=None,
+                   help='write the dependency report with the install order/waves as JSON to this file '
+                        '("-" for stdout)')
+    p.add_argument('-v', '--verbose', action='store_true')
+    return p
+
+
+def __check_file_arg(file_name, error_str):
+    if not os.path.exists(file_name):
+        sys.stderr.write(error_str + ' file not found')
+        sys.exit(1)
+    try:
+        return os.path.abspath(file_name)
+    except Exception:
+        sys.stderr.write(error_str + ' invalid path')
+        sys.exit(1)
+
+
+def read_module_json(tgz_path):
+    """Read the module.json out of a module tgz.
+
+    Args:
+        tgz_path (str): path to the module tgz
+    Returns:
+        the parsed module.json dict
+    """
+    with tarfile.open(tgz_path, 'r') as tgz:
+        return json.load(tgz.extractfile('module.json'))
+
+
+def resolve_module_deps(base, module_list, check_versions=True):
+    """Build the dependency graph over a base and a set of modules and resolve it.
+
+    Every unmet, missing or conflicting constraint is collected instead of stopping at the first one,
+    cycles are detected and the modules are grouped into install waves where every module only depends
+    on modules from earlier waves.
+
+    Args:
+        base (dict): parsed module.json of the base
+        module_list (list): list of parsed module.json dicts
+        check_versions (bool): run the semver checks on every edge
+    Returns:
+        dict with 'ok', 'errors', 'warnings', 'cycles', 'waves' and 'order' keys
+    """
+    base_name = base.get('name', 'bits-base')
+    base_version = base.get('version')
+    graph = {base_name: set()}
+    versions = {base_name: base_version}
+    requirements = {}
+    errors = []
+    warnings = []
+    for module_json in module_list:
+        logger.debug('Found %s\n\t%s\n\n', module_json['name'], module_json)
+        graph[module_json['name']] = set()
+        versions[module_json['name']] = module_json.get('version')
+    if check_versions and (base_version == '' or base_version is None):
+        warnings.append('Skipping all version checks for unversioned base')
+    # build the graph and collect every constraint placed on each dependency
+    for module_json in module_list:
+        module = module_json['name']
+        logger.debug('Checking deps for %s', module)
+        for dep, version in sorted(module_json.get('dependencies', {}).iteritems()):
+            if dep == 'bits-base':
+                dep = base_name
+            if dep not in graph:
+                errors.append({'type': 'missing', 'module': module, 'dependency': dep, 'required': version,
+                               'message': 'Module %s does not have required dependency %s' % (module, dep)})
+                continue
+            graph[module].add(dep)
+            requirements.setdefault(dep, []).append((module, version))
+    if check_versions:
+        for dep, required_by in sorted(requirements.iteritems()):
+            found = versions[dep]
+            if found == '' or found is None:
+                for module, version in required_by:
+                    warnings.append('Skipping version check for unversioned %s: %s %s' % (module, dep, version))
+                continue
+            logger.debug('Checking version for %s', dep)
+            unmet = [(module, version) for module, version in required_by if not __check_version(version, found)]
+            conflicting = len(unmet) != len(required_by) and len(set(version for _, version in required_by)) > 1
+            for module, version in unmet:
+                message = 'Module %s: %s %s does not meet required dependency %s' % (module, dep, found, version)
+                error = {'type': 'conflict' if conflicting else 'version', 'module': module, 'dependency': dep,
+                         'required': version, 'found': found, 'message': message}
+                if conflicting:
+                    error['message'] += ' (conflicts with %s)' % (
+                        ', '.join('%s requires %s' % (m, v) for m, v in required_by if (m, v) not in unmet))
+                errors.append(error)
+    cycles = __find_cycles(graph)
+    for cycle in cycles:
+        errors.append({'type': 'cycle', 'modules': cycle,
+                       'message': 'Dependency cycle between %s' % (' -> '.join(cycle + cycle[:1]))})
+    waves = __get_install_waves(graph)
+    ordered = set(name for wave in waves for name in wave)
+    for module in sorted(graph):
+        if module not in ordered:
+            warnings.append('Module %s cannot be ordered because it depends on a cycle' % (module))
+    return {'ok': len(errors) == 0,
+            'errors': errors,
+            'warnings': warnings,
+            'cycles': cycles,
+            'waves': waves,
+            'order': [name for wave in waves for name in wave]}
+
+
+def __find_cycles(graph):
+    """Return every cycle in the graph as a list of module names (Tarjan's strongly connected components)."""
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    cycles = []
+    counter = [0]
+
+    def strongconnect(node):
+        index[node] = lowlink[node] = counter[0]
+        counter[0] += 1
+        stack.append(node)
+        on_stack.add(node)
+        for dep in sorted(graph[node]):
+            if dep not in index:
+                strongconnect(dep)
+                lowlink[node] = min(lowlink[node], lowlink[dep])
+            elif dep in on_stack:
+                lowlink[node] = min(lowlink[node], index[dep])
+        if lowlink[node] == index[node]:
+            component = []
+            while True:
+                member = stack.pop()
+                on_stack.discard(member)
+                component.append(member)
+                if member == node:
+                    break
+            if len(component) > 1 or node in graph[node]:
+                cycles.append(sorted(component))
+
+    for node in sorted(graph):
+        if node not in index:
+            strongconnect(node)
+    return cycles
+
+
+def __get_install_waves(graph):
+    """Group the graph into waves where each module only depends on modules from earlier waves.
+
+    Modules that are part of (or depend on) a cycle are left out.
+    """
+    remaining = dict((node, set(deps)) for node, deps in graph.iteritems())
+    waves = []
+    while remaining:
+        wave = sorted(node for node, deps in remaining.iteritems() if not deps)
+        if not wave:
+            break
+        waves.append(wave)
+        for node in wave:
+            del remaining[node]
+        for deps in remaining.itervalues():
+            deps.difference_update(wave)
+    return waves
+
+
+def check_module_deps(base, module_list):
+    """Check module dependencies for a set of already parsed module.json dicts.
+
+    Args:
+        base (dict): parsed module.json of the base
+        module_list (list): list of parsed module.json dicts
+    Returns:
+        True if all dependencies are met false otherwise
+    """
+    report = resolve_module_deps(base, module_list)
+    __log_report(report)
+    return report['ok']
+
+
+def __log_report(report):
+    for warning in report['warnings']:
+        logger.warn(warning)
+    for error in report['errors']:
+        logger.error(error['message'])
+
+
+def check_module_dep_paths(base_path, module_path_list):
+    """Get and check module dependencies for a list of module tgzs.
+
+    Args:
+        base_path (str): path to base tgz
+        module_path_list (list): list of str paths to module tgz
+    Returns:
+        True if all dependencies are met false otherwise
+    """
+    return check_module_deps(read_module_json(base_path),
+                             [read_module_json(module_path) for module_path in module_path_list])
+
+
+def __check_version(version_req, version_str):
+    if version_str == '' or version_str is None or version_req == '' or version_req is None:
+        return True
+    args = ['semver', '-r', version_req, version_str.split('-')[0]]
+    if tuple(args) not in __version_checks:
+        logger.debug(args)
+        p = subprocess.Popen(args, stdout=subprocess.PIPE)
+        p.wait()
+        __version_checks[tuple(args)] = p.returncode == 0
+    return __version_checks[tuple(args)]
+
+
+def intersect_ranges(version_reqs):
+    """Combine version ranges into one range only met by versions meeting all of them.
+
+    The ranges are joined with spaces (a semver comparator set) after checking with semver that one of the versions
+    they name meets every range, so ^1.2.0 and ^1.3.0 combine to '^1.2.0 ^1.3.0' which 1.3.0 meets.  Only plain
+    comparators can be joined, ranges using || or hyphen ranges, tags and urls only combine with themselves.
+
+    Args:
+        version_reqs (list): version ranges
+    Returns:
+        the combined range or None when no version named by the ranges meets all of them
+    """
+    version_reqs = sorted(set(version_req.strip() for version_req in version_reqs))
+    if len(version_reqs) == 1:
+        return version_reqs[0]
+    candidates = set()
+    for version_req in version_reqs:
+        for comparator in version_req.split():
+            match = __COMPARATOR_RE.match(comparator)
+            if match is None:
+                return None
+            parts = [part if part.isdigit() else '0' for part in match.group(1).split('.')]
+            candidates.add(tuple(int(part) for part in parts + ['0'] * (3 - len(parts))))
+    for candidate in sorted(candidates, reverse=True):
+        version_str = '.'.join(str(part) for part in candidate)
+        if all(__check_version(version_req, version_str) for version_req in version_reqs):
+            return ' '.join(version_reqs)
+    return None
+
+
+# a single semver comparator like ^1.2.0, >=2.0 or 1.x, group 1 is the version without the prerelease
+__COMPARATOR_RE = re.compile(r'^(?:\^|~|[<>]=?|=)?v?(\d+(?:\.(?:\d+|[xX*])){0,2})(?:-[0-9A-Za-z.-]+)?$')
+
+# semver results keyed by the command line, many modules share the same requirement on the base
+__version_checks = {}
+
+
+def __main(argv):
+    parser = __make_parser()
+    settings = parser.parse_args(argv[1:])
+    sh = logging.StreamHandler()
+    if settings.verbose:
+        sh.setLevel(logging.DEBUG)
+    else:
+        sh.setLevel(logging.WARN)
+    logger.addHandler(sh)
+    # get absolute paths and check file inputs for existence
+    settings.base_path = __check_file_arg(settings.base_path, 'Invalid argument for base %s' % settings.base_path)
+    for index, module_path in enumerate(settings.module_path_list):
+        settings.module_path_list[index] = __check_file_arg(module_path,
+                                                            'Error invalid module specified %s' % module_path)
+    report = resolve_module_deps(read_module_json(settings.base_path),
+                                 [read_module_json(module_path) for module_path in settings.module_path_list])
+    __log_report(report)
+    if settings.order_output:
+        output = json.dumps(report, indent=2, separators=(',', ': '), sort_keys=True)
+        if settings.order_output == '-':
+            print output
+        else:
+            with open(settings.order_output, 'w') as output_file:
+                output_file.write(output)
+    if report['ok']:
+        sys.exit(0)
+    else:
+        sys.exit(1)
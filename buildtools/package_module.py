@@ -0,0 +1,705 @@
+# This python script packages a module as a .tgz or a .mod.  The .mod file is
+# an encrypted file that is signed with a signing private key.
+# You will have to install the python-crypto package if it is not already installed.
+# Useful resources:
+# https://www.dlitz.net/software/pycrypto/api/current/Crypto.Signature.PKCS1_v1_5-module.html
+# https://www.dlitz.net/software/pycrypto/api/current/Crypto.PublicKey.RSA._RSAobj-class.html#sign
+# https://www.dlitz.net/software/pycrypto/api/current/Crypto.Cipher.PKCS1_OAEP-module.html
+# http://www.laurentluce.com/posts/python-and-cryptography-with-pycrypto/
+#
+# The arguments package-module.py accepts include:
+# -m the module directory (or directories) to package [REQUIRED unless --manifest is given]
+# --manifest a json file listing the modules to package [OPTIONAL]
+# -J the number of modules packaged at the same time [OPTIONAL]
+# --summary write a json summary of the packaged files [OPTIONAL]
+# -b the build number, replaces the last digit (patch number) of the version in module.json [OPTIONAL]
+# -e the PUBLIC key with which to encrypt the module [OPTIONAL]
+# -s the PRIVATE key with which to sign the module [OPTIONAL]
+# -p include the python source instead of the compiled python (developer only) [OPTIONAL]
+# --base specify that this is a base that is being packaged [OPTIONAL]
+# -l specify that this is a legacy base build (pre v0.10) and to use base.json vice module.json [OPTIONAL]
+#
+# The .mod file has the following format:
+# +------------------------+
+# +       signature        +
+# +      [512 bytes]       +
+# +------------------------+
+# + RSA encrypted password +
+# +      [512 bytes]       +
+# +------------------------+
+# +   RSA encrypted salt   +
+# +      [512 bytes]       +
+# +------------------------+
+# + RSA encrypted filename +
+# +      [512 bytes]       +
+# +------------------------+
+# +      Symmetric Key     +
+# +    encrypted package   +
+# +      [module.pack]     +
+# +------------------------+
+#
+# Several modules can be packaged by one invocation (-m mod-a mod-b or
+# --manifest), the modules are packaged concurrently and share the build,
+# yarn and key caches.  The manifest has the format:
+#
+#   {"modules": ["mod-a", {"module_dir": "mod-b", "version": "1.2.3"}]}
+#
+# module paths are relative to the manifest, an entry may override the
+# version, buildnum and git_branch given on the command line.  The --summary
+# json lists per module the output files with their size and sha256 and how
+# long the module took to package.
+
+import sys
+import argparse
+import os
+import json
+import tarfile
+import subprocess
+import tempfile
+import shutil
+import fnmatch
+import copy
+import multiprocessing
+import multiprocessing.pool
+import Queue
+import threading
+import time
+
+from buildtools import TOOLS_DIR, buildcache, compile_python, gitinfo, yarncache
+
+# files and dirs of a module that are never packaged
+EXCLUDE_FILES = ['.gitignore', 'README', 'README.md', '*.exclude.*', '*.exclude', '.gitlab-ci.yml', 'CHANGELOG.md',
+                 '.editorconfig']
+EXCLUDE_DIRS = ['.git', '.gitlab']
+
+
+def make_tarfile(output_filename, source_dir):
+    with tarfile.open(output_filename, "w:gz") as tar:
+        tar.add(source_dir, arcname=os.path.basename(source_dir))
+
+
+def get_git_hash(module_dir):
+    # read .git directly, git is only run for checkouts gitinfo does not understand
+    git_hash = gitinfo.short_hash(module_dir)
+    if git_hash is not None:
+        return git_hash
+    try:
+        git_hash = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=module_dir)
+        git_hash = git_hash.strip('\n')
+    except Exception:
+        print 'Error not able to get git_hash'
+    return git_hash
+
+
+def get_git_branch(module_dir):
+    git_branch = gitinfo.branch(module_dir)
+    if git_branch is not None:
+        return git_branch
+    try:
+        git_branch = subprocess.check_output(['git', 'rev-parse', '--abbrev-ref', 'HEAD'], cwd=module_dir)
+        git_branch = git_branch.strip('\n')
+    except Exception as e:
+        print 'Error not able to get git_branch'
+        print e
+    return git_branch
+
+
+def get_scripts_dir(module_dir, json_file):
+    m_json = os.path.join(module_dir, json_file)
+    print m_json
+    json_data = open(m_json)
+    data = json.load(json_data)
+    json_data.close()
+
+    if "scriptDir" in data:
+        return data["scriptDir"]
+    elif os.path.isdir(os.path.join(module_dir, 'MATDaemon')):
+        return 'MATDaemon'
+    elif os.path.isdir(os.path.join(module_dir, 'Scripts')):
+        return 'Scripts'
+    else:
+        return None
+
+
+def update_git_info(data, git_hash, git_branch):
+    if git_hash is not None:
+        data["git_short_hash"] = git_hash
+        data["git_branch"] = git_branch
+        return True
+    return False
+
+
+def update_display_name(data):
+    if "displayName" in data:
+        display_name = data["displayName"]
+        data["displayName"] = display_name + " DEV"
+        return True
+    return False
+
+
+def update_build_number(data, build_number):
+    semver = data["version"].split(".")
+    major = semver[0]
+    minor = semver[1]
+
+    data["version"] = major + "." + minor + "." + build_number
+    return True
+
+
+def update_version(data, version, git_hash):
+    data["version"] = version
+    if git_hash is not None:
+        data["git_short_hash"] = git_hash
+    return True
+
+
+def rewrite_module_json(module_dir, json_file, edits):
+    """Load module.json once, apply every edit to it and write it back if any edit changed it.
+
+    Each edit is called with the loaded json data and returns True if it changed it.  Returns the data.
+    """
+    m_json = os.path.join(module_dir, json_file)
+    with open(m_json) as json_data:
+        data = json.load(json_data)
+
+    changed = False
+    for edit in edits:
+        changed = edit(data) or changed
+    if changed:
+        with open(m_json, 'w') as outfile:
+            json.dump(data, outfile, indent=2, separators=(',', ': '))
+    return data
+
+
+def create_build_dir(module_dir):
+    tmpdir = tempfile.mkdtemp()
+    tmpdir = os.path.join(tmpdir, os.path.basename(module_dir))
+    os.makedirs(tmpdir)
+    return tmpdir
+
+
+def remove_build_dir(build_dir):
+    shutil.rmtree(os.path.dirname(build_dir))
+
+
+def copy_module_files(src, dst, exclude_files, exclude_dirs, symlinks=True):
+    for (dirpath, _dirnames, filenames) in os.walk(src):
+        dstdir = dst
+        if (dirpath != src):
+            if (dirpath.startswith(src)):
+                subdir = dirpath[len(src) + len(os.path.sep):]
+                skip = False
+                subdir_folders = subdir.split(os.path.sep)
+                for exclude_dir in exclude_dirs:
+                    if exclude_dir in subdir_folders:
+                        skip = True
+                if skip:
+                    continue
+                dstdir = os.path.join(dstdir, subdir)
+                if not os.path.exists(dstdir):
+                    os.makedirs(dstdir)
+            else:
+                raise Exception("Error invalid path {}".format(dirpath))
+        for filename in filenames:
+            skip = False
+            for exclude_file in exclude_files:
+                if fnmatch.fnmatch(filename, exclude_file):
+                    skip = True
+            if not skip:
+                srcname = os.path.join(dirpath, filename)
+                dstname = os.path.join(dstdir, filename)
+                if symlinks and os.path.islink(srcname):
+                    linkto = os.readlink(srcname)
+                    os.symlink(linkto, dstname)
+                else:
+                    shutil.copy(srcname, dstdir)
+
+
+def get_has_npm_build(buildDir):
+    # Create the package.json filepath
+    packageJsonFilepath = os.path.join(buildDir, 'package.json')
+
+    # Make sure the package.json file exists
+    if not os.path.isfile(packageJsonFilepath):
+        # No package.json therefore no npm build!
+        return False
+
+    # Open the package.json file
+    packageData = open(packageJsonFilepath)
+    # Read the package.json file
+    packageJson = json.load(packageData)
+    # Close the package.json file
+    packageData.close()
+
+    # Check if package.json has a 'scripts' property
+    if 'scripts' not in packageJson:
+        # No 'scripts' property, nothing to run
+        return False
+
+    # Get the 'scripts' property
+    scripts = packageJson['scripts']
+
+    # Check if the scripts property has a 'build' property
+    if 'build' not in scripts:
+        # No 'build' property, nothing to run
+        return False
+
+    # The 'build' property exists!
+    return True
+
+
+def run_npm_build(buildDir, buildCacheDir=None, yarnCacheDir=None, excludeDirs=()):
+    if buildCacheDir is not None:
+        # the key covers every file the build can read, package.json and the lockfile included
+        before = buildcache.snapshot(buildDir, excludeDirs)
+        key = buildcache.cache_key(before, {'step': 'npm-build', 'arch': os.environ.get('ARCH')})
+        if buildcache.restore(buildCacheDir, key, buildDir):
+            print 'Restored npm build output from cache'
+            return
+
+    my_env = os.environ.copy()
+    # Set yarn cache directory for storing later
+    yarnCacheFolder = os.path.join(buildDir, 'support', 'yarn-cache')
+    os.makedirs(yarnCacheFolder)
+    my_env['YARN_CACHE_FOLDER'] = yarnCacheFolder
+    yarnLock = os.path.join(buildDir, 'yarn.lock')
+    if yarnCacheDir is not None:
+        print 'Seeded {} yarn cache entries'.format(yarncache.seed(yarnCacheDir, yarnCacheFolder, yarnLock))
+
+    # Create arguments for running the build command
+    args = ['npm', 'run', 'build']
+    # Create a subprocess to run the build command, wait for it to complete
+    ret = subprocess.call(args, cwd=buildDir, env=my_env)
+    if 0 != ret:
+        print 'Failed to run \'npm run build\''
+        sys.exit(2)
+
+    if yarnCacheDir is not None:
+        # only ship the entries the lockfile needs and keep anything new for the next build
+        yarncache.prune(yarnCacheFolder, yarnLock)
+        yarncache.harvest(yarnCacheDir, yarnCacheFolder)
+
+    if buildCacheDir is not None:
+        changed, deleted = buildcache.changes(before, buildcache.snapshot(buildDir, excludeDirs))
+        buildcache.store(buildCacheDir, key, buildDir, changed, deleted)
+
+
+def run_apt_offline(aptOfflineScript, aptOfflineDir, buildCacheDir=None):
+    if buildCacheDir is not None:
+        # the bundles only depend on the request set and the arch they are fetched for
+        before = buildcache.snapshot(aptOfflineDir)
+        key = buildcache.cache_key(before, {'step': 'apt-offline', 'arch': os.environ.get('ARCH')})
+        if buildcache.restore(buildCacheDir, key, aptOfflineDir):
+            print 'Restored apt-offline bundles from cache'
+            return
+
+    ret = os.system(aptOfflineScript + ' -d ' + aptOfflineDir)
+    if ret != 0:
+        print 'Error generating apt-offline bundles'
+        sys.exit(1)
+
+    if buildCacheDir is not None:
+        changed, deleted = buildcache.changes(before, buildcache.snapshot(aptOfflineDir))
+        buildcache.store(buildCacheDir, key, aptOfflineDir, changed, deleted)
+
+
+def run_pre_package_scripts(scripts, buildDir):
+    print 'Scripts: ', scripts
+    my_env = os.environ.copy()
+
+    for script in scripts:
+        print "Running " + script
+        try:
+            args = script.split(' ')
+            ret = subprocess.call(args, cwd=buildDir, env=my_env)
+            if 0 != ret:
+                print 'Failed to run ', ret
+        except Exception as e:
+            print 'Failed to run script ', e
+
+
+class Stage(object):
+    """A step of the packaging pipeline, it runs once every name in inputs is in the context and adds outputs."""
+
+    def __init__(self, name, func, inputs, outputs):
+        self.name = name
+        self.func = func
+        self.inputs = inputs
+        self.outputs = outputs
+
+
+def run_stages(stages, context, jobs=None):
+    """Run stages as soon as their inputs are available, independent stages run concurrently on threads.
+
+    Each stage function is called with the context and returns a dict with its outputs which are added to the
+    context.  The first stage to fail (including sys.exit) stops new stages from starting and is re-raised once the
+    running stages are done.  Returns a list of (stage name, seconds) in completion order.
+    """
+    produced = set(context)
+    for stage in stages:
+        produced.update(stage.outputs)
+    for stage in stages:
+        missing = [name for name in stage.inputs if name not in produced]
+        if missing:
+            raise Exception('Stage {} needs {} which no stage produces'.format(stage.name, ', '.join(missing)))
+    jobs = jobs or multiprocessing.cpu_count()
+    pending = list(stages)
+    running = set()
+    finished = Queue.Queue()
+    timings = []
+    failure = None
+
+    def run(stage):
+        start = time.time()
+        try:
+            outputs, error = stage.func(context) or {}, None
+        except BaseException:
+            outputs, error = {}, sys.exc_info()
+        finished.put((stage, outputs, error, time.time() - start))
+
+    while pending or running:
+        if failure is None:
+            for stage in [s for s in pending if all(name in context for name in s.inputs)]:
+                if len(running) >= jobs:
+                    break
+                pending.remove(stage)
+                running.add(stage.name)
+                thread = threading.Thread(target=run, args=(stage,), name=stage.name)
+                thread.daemon = True
+                thread.start()
+        if not running:
+            if failure is None:
+                raise Exception('Stages {} can not run'.format(', '.join(s.name for s in pending)))
+            break
+        try:
+            stage, outputs, error, seconds = finished.get(True, 0.5)
+        except Queue.Empty:
+            continue
+        running.discard(stage.name)
+        timings.append((stage.name, seconds))
+        if error is None and set(stage.outputs) - set(outputs):
+            error = (Exception, Exception('Stage {} did not produce {}'.format(
+                stage.name, ', '.join(set(stage.outputs) - set(outputs)))), None)
+        if error is not None:
+            failure = failure or error
+            continue
+        context.update(outputs)
+    if failure is not None:
+        raise failure[0], failure[1], failure[2]
+    return timings
+
+
+def print_stage_timings(timings, total, title='Stage timings:'):
+    print title
+    for name, seconds in timings:
+        print '  {:<30} {:8.2f}s'.format(name, seconds)
+    print '  {:<30} {:8.2f}s'.format('total (wall clock)', total)
+
+
+def pre_package_cleanup(build_dir):
+    nodeModDir = os.path.join(build_dir, 'node_modules')
+    testDir = os.path.join(build_dir, 'test')
+    testCoverageDir = os.path.join(build_dir, 'coverage')
+    if os.path.exists(nodeModDir):
+        shutil.rmtree(nodeModDir)
+    if os.path.exists(testDir):
+        shutil.rmtree(testDir)
+    if os.path.exists(testCoverageDir):
+        shutil.rmtree(testCoverageDir)
+
+
+def __make_parser():
+    p = argparse.ArgumentParser(description='This packages a module (or the base) into a tar file')
+    p.add_argument('-m', '--module-dir', type=str, nargs='+', default=[],
+                   help='path to the module(s) that you would like packaged')
+    p.add_argument('--manifest', type=str, default=None,
+                   help='json file listing the modules to package (see the header of this script for the format)')
+    p.add_argument('-J', '--module-jobs', type=int, default=None,
+                   help='number of modules packaged at the same time (default: cpu count)')
+    p.add_argument('--summary', type=str, default=None,
+                   help='write a json summary with the output files, their size and sha256 and the time taken per \
+                         module to this file')
+    p.add_argument('-a', '--pre-package', action='append', dest='pre_package_scripts', default=[],
+                   help='Optional script(s) that will be run just before the module is packaged into a tgz can be used \
+                         to minifiy, or tweak modules')
+    p.add_argument('-b', '--buildnum', type=str,
+                   help='the build number to be placed in the json package information file, deprecated new builds \
+                         should use version')
+    p.add_argument('-g', '--git-branch',
+                   help='branch name for the current build (needed for gitlab or jenkins builds) deprecated new builds \
+                         should use version')
+    p.add_argument('-e', '--encryptionkey', type=str, help='the public key used to encrypt the module')
+    p.add_argument('-s', '--signingkey', type=str, help='the private key used to sign the module')
+    p.add_argument('-p', '--include-python-source', action='store_true', help='include the python source in the build')
+    p.add_argument('-d', '--dev', action='store_true', help='tag as development build')
+    p.add_argument('--skip-apt-offline-bundles', action='store_true', help='skip generation of apt-offline bundles')
+    p.add_argument('-P', '--python-paths', nargs='+', type=str,
+                   help='path to folder(s) that you would like compiled python code for in addition to Scripts dir')
+    p.add_argument('--build-cache', type=str, default=None,
+                   help='directory to cache the npm build output and the apt-offline bundles in, the npm build is \
+                         skipped when the module files (package.json and lockfile included) are unchanged since a \
+                         cached build and the bundles are reused while the apt-offline requests are unchanged')
+    p.add_argument('--yarn-cache', type=str, default=None,
+                   help='persistent yarn cache dir shared between builds on this host, the entries the yarn.lock \
+                         needs are hardlinked into the build and new entries are added back after the build')
+    p.add_argument('--yarn-cache-size', type=int, default=None,
+                   help='evict the least recently used entries once the --yarn-cache is larger than this (MB), \
+                         checked once all modules are packaged')
+    p.add_argument('-j', '--jobs', type=int, default=None,
+                   help='number of packaging stages that may run at the same time (default: cpu count)')
+    p.add_argument('-v', '--version', type=str,
+                   help='Version number to apply to this build this is the new method of version tracking and replaces \
+                         git-branch and buildnum')
+    return p
+
+
+def package_module(settings, title='Stage timings:'):
+    """Package settings.module_dir, returns the output files (the tgz and the encrypted module)."""
+    json_file = 'module.json'
+
+    build_dir = create_build_dir(settings.module_dir)
+
+    script_dir = get_scripts_dir(settings.module_dir, json_file)
+
+    settings.python_paths = list(settings.python_paths or [])
+    if script_dir:
+        settings.python_paths.append(script_dir)
+
+    # now do any processing necessary to process files or just copy
+
+    # copy files that don't need processing add any files that
+    # need to be compiled/etc to the ignore lists and then process them
+    # after
+    copy_exclude_dirs = list(EXCLUDE_DIRS)
+    if not settings.include_python_source:
+        copy_exclude_dirs.extend(settings.python_paths)
+    build_cache = settings.build_cache and os.path.abspath(settings.build_cache)
+    aptOfflineScript = os.path.abspath(os.path.join(TOOLS_DIR, '..', 'ci-tools', 'misc-tools', 'get-apt-offline.sh'))
+
+    def copy_stage(context):
+        copy_module_files(settings.module_dir, build_dir, EXCLUDE_FILES, copy_exclude_dirs)
+        return {'build_dir': build_dir}
+
+    def compile_stage(script_dir):
+        def run(context):
+            # compile python into build_dir
+            scriptin = os.path.join(settings.module_dir, script_dir)
+            scriptout = os.path.join(build_dir, script_dir)
+            try:
+                if not os.path.exists(scriptout):
+                    os.makedirs(scriptout)
+                compile_python.compile_dir(scriptin, scriptout, True)
+            except Exception as e:
+                sys.stderr.write('Error {}\n'.format(e))
+                sys.stdout.write('Error compiling python scripts')
+                sys.exit(1)
+
+            # copy any non python files from the script dir
+            copy_module_files(scriptin, scriptout, EXCLUDE_FILES + ['*.pyc', '*.py'], copy_exclude_dirs)
+            return {'compiled:' + script_dir: scriptout}
+        return run
+
+    def npm_build_stage(context):
+        if get_has_npm_build(build_dir):
+            # the compile stages write to these dirs while the build runs
+            exclude_dirs = [os.path.normpath(script_dir) for script_dir in settings.python_paths]
+            run_npm_build(build_dir, build_cache, settings.yarn_cache and os.path.abspath(settings.yarn_cache),
+                          exclude_dirs)
+        return {'npm_built': True}
+
+    def pre_package_stage(context):
+        run_pre_package_scripts(settings.pre_package_scripts, build_dir)
+        return {'pre_packaged': True}
+
+    def git_stage(context):
+        git_hash = get_git_hash(settings.module_dir)
+        git_branch = None
+        if not settings.version:
+            if not settings.git_branch:
+                git_branch = get_git_branch(settings.module_dir)
+            else:
+                git_branch = settings.git_branch
+        return {'git_hash': git_hash, 'git_branch': git_branch}
+
+    def version_stage(context):
+        git_hash = context['git_hash']
+        git_branch = context['git_branch']
+        edits = []
+        if not settings.version:
+            edits.append(lambda data: update_git_info(data, git_hash, git_branch))
+            if settings.buildnum:
+                edits.append(lambda data: update_build_number(data, settings.buildnum))
+        else:
+            edits.append(lambda data: update_version(data, settings.version, git_hash))
+        if settings.dev:
+            edits.append(update_display_name)
+        data = rewrite_module_json(build_dir, json_file, edits)
+
+        if git_hash and git_branch:
+            filename = data["name"] + "-" + data["version"] + "-" + git_branch + "-" + git_hash
+        elif git_hash:
+            filename = data["name"] + "-" + data["version"] + "-" + git_hash
+        else:
+            filename = data["name"] + "-" + data["version"]
+
+        if settings.dev and not git_branch:
+            filename = filename + "-dev"
+        return {'filename': filename + ".tgz"}
+
+    def apt_offline_stage(context):
+        # looked up after the pre-package scripts, they may add or tweak the apt-offline requests
+        aptOfflineDir = os.path.join(build_dir, 'apt-offline')
+        if not os.path.exists(aptOfflineDir):
+            aptOfflineDir = os.path.join(build_dir, 'support', 'apt-offline')
+        if os.path.exists(aptOfflineDir) and not settings.skip_apt_offline_bundles and \
+                os.path.exists(aptOfflineScript):
+            run_apt_offline(aptOfflineScript, aptOfflineDir, build_cache)
+        return {'apt_offline_bundles': True}
+
+    def cleanup_stage(context):
+        pre_package_cleanup(build_dir)
+        return {'cleaned': True}
+
+    def tar_stage(context):
+        filename = context['filename']
+        print "outputting to: " + filename
+        make_tarfile(filename, build_dir + os.path.sep)
+
+        remove_build_dir(build_dir)
+        return {'tgz': filename}
+
+    def encrypt_stage(context):
+        filename = context['tgz']
+        if settings.encryptionkey is not None and settings.signingkey is not None:
+            print("Encrypting tgz: " + filename + " with " + settings.encryptionkey + ", signing with " +
+                  settings.signingkey)
+            # in-process so the parsed keys are shared by every module packaged by this run
+            encrypted = os.path.splitext(filename)[0] + '.mod'
+            # imported here so packaging without keys never loads pycrypto
+            from buildtools import encrypt_data
+            encrypt_data.encrypt_sign_file(os.path.abspath(filename), os.path.abspath(encrypted),
+                                           [settings.encryptionkey], settings.signingkey)
+            print os.path.abspath(encrypted)
+            return {'encrypted': [encrypted]}
+        else:
+            print "Not Encrypting, Need to Specify Encryption and Signing keys (-s and -e)"
+        return {'encrypted': []}
+
+    compiled = ['compiled:' + path for path in settings.python_paths]
+    stages = [Stage('copy', copy_stage, [], ['build_dir'])]
+    stages.extend(Stage('compile ' + script_dir, compile_stage(script_dir), ['build_dir'], ['compiled:' + script_dir])
+                  for script_dir in settings.python_paths)
+    stages.extend([
+        Stage('npm build', npm_build_stage, ['build_dir'], ['npm_built']),
+        Stage('pre-package', pre_package_stage, ['npm_built'] + compiled, ['pre_packaged']),
+        Stage('git', git_stage, [], ['git_hash', 'git_branch']),
+        Stage('version', version_stage, ['pre_packaged', 'git_hash', 'git_branch'], ['filename']),
+        Stage('apt-offline', apt_offline_stage, ['pre_packaged'], ['apt_offline_bundles']),
+        Stage('cleanup', cleanup_stage, ['pre_packaged', 'apt_offline_bundles', 'filename'], ['cleaned']),
+        Stage('tar', tar_stage, ['cleaned', 'filename'], ['tgz']),
+        Stage('encrypt', encrypt_stage, ['tgz'], ['encrypted'])])
+    start = time.time()
+    context = {}
+    try:
+        timings = run_stages(stages, context, settings.jobs)
+    except BaseException:
+        # run_stages waits for the running stages so nothing writes to build_dir anymore, tar removes it when done
+        if os.path.exists(build_dir):
+            remove_build_dir(build_dir)
+        raise
+    print_stage_timings(timings, time.time() - start, title)
+    return [context['tgz']] + context['encrypted']
+
+
+def load_manifest(manifest_file, settings):
+    """Read the --manifest file and return the settings for every module in it."""
+    with open(manifest_file, 'r') as f:
+        manifest_json = json.load(f)
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_file))
+
+    modules = []
+    for module_json in manifest_json['modules']:
+        if isinstance(module_json, basestring):
+            module_json = {'module_dir': module_json}
+        module_settings = copy.copy(settings)
+        module_settings.module_dir = os.path.join(manifest_dir, module_json['module_dir'])
+        for key in ['version', 'buildnum', 'git_branch']:
+            if key in module_json:
+                setattr(module_settings, key, module_json[key])
+        modules.append(module_settings)
+    return modules
+
+
+def package_modules(modules, jobs=None):
+    """Package several modules concurrently, returns the summary of every module (with the error if it failed)."""
+    def package(module_settings):
+        start = time.time()
+        summary = {'module_dir': module_settings.module_dir}
+        try:
+            outputs = package_module(module_settings, 'Stage timings for {}:'.format(module_settings.module_dir))
+            summary['outputs'] = [{'filename': output,
+                                   'size': os.path.getsize(output),
+                                   'sha256': buildcache.hash_file(output)} for output in outputs]
+        except SystemExit as e:
+            summary['error'] = 'exited with status {}'.format(e.code)
+        except Exception as e:
+            summary['error'] = str(e) or type(e).__name__
+        if 'error' in summary:
+            sys.stderr.write('Error packaging {}: {}\n'.format(module_settings.module_dir, summary['error']))
+        summary['duration'] = round(time.time() - start, 3)
+        return summary
+
+    if len(modules) == 1:
+        return [package(modules[0])]
+    pool = multiprocessing.pool.ThreadPool(min(jobs or multiprocessing.cpu_count(), len(modules)))
+    try:
+        return pool.map(package, modules)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def __main(argv):
+    parser = __make_parser()
+    settings = parser.parse_args(argv[1:])
+
+    module_dirs = settings.module_dir
+    if settings.manifest is not None:
+        if not os.path.isfile(settings.manifest):
+            sys.stderr.write('Error manifest is not a valid file\n')
+            sys.exit(1)
+        try:
+            modules = load_manifest(settings.manifest, settings)
+        except (ValueError, KeyError, TypeError) as e:
+            sys.stderr.write('Error could not parse manifest {}: {}\n'.format(settings.manifest, e))
+            sys.exit(1)
+    else:
+        modules = []
+    for module_dir in module_dirs:
+        module_settings = copy.copy(settings)
+        module_settings.module_dir = module_dir
+        modules.append(module_settings)
+    if len(modules) == 0:
+        sys.stderr.write('Error a module dir (-m) or a manifest is required\n')
+        sys.exit(1)
+    for module_settings in modules:
+        if (not os.path.isdir(module_settings.module_dir)):
+            sys.stderr.write('Error module dir is not a valid directory {}\n'.format(module_settings.module_dir))
+            sys.exit(1)
+        module_settings.module_dir = os.path.abspath(module_settings.module_dir)
+
+    if len(modules) == 1 and settings.summary is None:
+        package_module(modules[0])
+        failed = False
+    else:
+        summaries = package_modules(modules, settings.module_jobs)
+        failed = any('error' in summary for summary in summaries)
+        if settings.summary is not None:
+            with open(settings.summary, 'w') as summary_file:
+                summary_file.write(json.dumps({'modules': summaries}, indent=2, separators=(',', ': ')))
+
+    if settings.yarn_cache is not None and settings.yarn_cache_size is not None:
+        # evict once all modules are packaged, the other builds may still be seeding from the entries
+        yarncache.evict(settings.yarn_cache, settings.yarn_cache_size * 1024 * 1024)
+
+    sys.exit(1 if failed else 0)
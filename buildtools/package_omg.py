@@ -0,0 +1,217 @@
+# This python script encrypts a romg (*.romg) and a romg header (JSON) to an omg.
+#
+# * This script requires that encrypt-data.py be present in the same directory,
+#   it is loaded and used in-process.
+# * This script currently requires that both public/private keys be present
+#   for the encryption and signing keys.
+# * Multiple romgs can be packaged in one invocation by repeating the
+#   --romg-file/--romg-header pairs, they are encrypted concurrently.
+#
+# The .omg file has the following format:
+# +------------------------+
+# +      ROMG-Header       +
+# +------------------------+
+# +     encrypted ROMG     +
+# +------------------------+
+
+import sys
+import argparse
+import multiprocessing
+import os
+import traceback
+import json
+
+from buildtools import encrypt_data
+
+
+def build_header(romgHeaderFile, encryptionKeyHashes, signatureKeyHash):
+    header = None
+    with open(romgHeaderFile, 'r') as f:
+        header = json.loads(f.read())
+    if header:
+        return add_key_hashes(header, encryptionKeyHashes, signatureKeyHash)
+
+
+def add_key_hashes(header, encryptionKeyHashes, signatureKeyHash):
+    # the decryption key hash that will be used to decrypt this module, when encrypted for several recipients
+    # every hash is listed in key-wrap order
+    header['encryptionKeyHash'] = encryptionKeyHashes[0]
+    if len(encryptionKeyHashes) > 1:
+        header['encryptionKeyHashes'] = encryptionKeyHashes
+    # the signature verification key hash that will be used to verify this module
+    header['signatureKeyHash'] = signatureKeyHash
+    return header
+
+
+def get_sha256(in_filename):
+    from Crypto.Hash import SHA256
+    CHUNK_SIZE = 16*1024
+    file_sha256_checksum = SHA256.new()
+    with open(in_filename, 'rb') as infile:
+        while True:
+            chunk = infile.read(CHUNK_SIZE)
+            if len(chunk) == 0:
+                break
+            file_sha256_checksum.update(chunk)
+        infile.close()
+    return file_sha256_checksum
+
+
+def build_key_index(keyDirs):
+    """
+    Parse every key in the given directories exactly once, returns a list of (rsa key, sha256 hexdigest) tuples
+    """
+    from Crypto.Hash import SHA256
+    keyIndex = []
+    for keyDir in set(keyDirs):
+        for f in sorted(os.listdir(keyDir)):
+            kf = os.path.join(keyDir, f)
+            if not os.path.isfile(kf):
+                continue
+            try:
+                with open(kf, 'r') as keyFile:
+                    keyData = keyFile.read()
+                keyIndex.append((encrypt_data.load_rsa_key(kf), SHA256.new(keyData).hexdigest()))
+            except Exception:
+                pass
+    return keyIndex
+
+
+def get_complementary_key_sha256_hash(keyFile, keyIndex=None):
+    """
+    Given a key it will look in the same directory and find the complementary key and return the sha256 hash of that key
+    The complementary key is the public key if keyFile is a private key or a private key if keyFile is a public key.
+    A prebuilt keyIndex (see build_key_index) can be given to avoid rescanning the key directory.
+    """
+    if keyIndex is None:
+        keyIndex = build_key_index([os.path.dirname(keyFile)])
+    rsaKeyInfo = encrypt_data.load_rsa_key(keyFile)
+    if not rsaKeyInfo:
+        raise Exception("Could not read in rsa key %s" % (keyFile))
+    for rsakey, sha256 in keyIndex:
+        if rsaKeyInfo.has_private() != rsakey.has_private() and rsaKeyInfo.publickey() == rsakey.publickey():
+            return sha256
+    return None
+
+
+def resolve_key_hashes(encryptionKeys, signingKey):
+    """
+    Find the hashes of the keys complementary to the encryption keys and the signing key, the key directories are
+    only scanned once.  Returns the list of encryption key hashes and the signature key hash.
+    """
+    encryptionKeys = encrypt_data.as_key_list(encryptionKeys)
+    keyIndex = build_key_index([os.path.dirname(key) for key in encryptionKeys] + [os.path.dirname(signingKey)])
+    return ([get_complementary_key_sha256_hash(key, keyIndex) for key in encryptionKeys],
+            get_complementary_key_sha256_hash(signingKey, keyIndex))
+
+
+def omg_header_str(header):
+    headerStr = json.dumps(header)
+    return '%d#' % (len(headerStr)) + headerStr
+
+
+def build_omg(romgFile, romgHeader, encryptionKeys, signingKey, encryptionKeyHashes, signatureKeyHash,
+              outputDirectory=None, verbose=False):
+    """
+    Encrypt and sign a romg with its header into an omg file, returns the omg filename
+    """
+    headerStr = omg_header_str(build_header(romgHeader, encryptionKeyHashes, signatureKeyHash))
+    if outputDirectory is None:
+        outputDirectory = os.path.dirname(romgFile)
+    omgFileName = os.path.join(outputDirectory, os.path.splitext(os.path.basename(romgFile))[0] + '.omg')
+    encrypt_data.encrypt_sign_file(romgFile, omgFileName, encryptionKeys, signingKey, header=headerStr,
+                                   verbose=verbose)
+    return omgFileName
+
+
+def _init_worker():
+    from Crypto import Random
+    # forked workers must not share the parent's random state or they would generate the same passwords
+    Random.atfork()
+    encrypt_data.random.seed()
+
+
+def _build_omg_job(args):
+    try:
+        return build_omg(*args), None
+    except Exception:
+        return None, traceback.format_exc()
+
+
+def __make_parser():
+    p = argparse.ArgumentParser(description='This encrypts a romg (*.romg) to create an omg (*.omg)')
+    p.add_argument('-r', '--romg-file', type=str, action='append',
+                   help='the romg file to generate an omg for, may be given multiple times paired in order with \
+                         --romg-header', default=None, required=True)
+    p.add_argument('-H', '--romg-header', type=str, action='append', help='the romg header to use', default=None,
+                   required=True)
+    p.add_argument('-e', '--encryption-key', type=str, action='append',
+                   help='the public key used to encrypt the file, may be given multiple times to encrypt the romg \
+                         once for several recipients', default=None, required=True)
+    p.add_argument('-s', '--signing-key', type=str,
+                   help='the private key used to verify the signature', default=None, required=True)
+    p.add_argument('-v', '--verbose', action='store_true',
+                   help='verbose message printing', default=False, required=False)
+    p.add_argument('-d', '--output-directory', type=str,
+                   help='specify an alternate output directory for the OMG', default=None, required=False)
+    p.add_argument('-j', '--jobs', type=int,
+                   help='number of omgs to build concurrently (default: number of cpus)', default=None, required=False)
+    return p
+
+
+def __main(argv):
+    parser = __make_parser()
+    settings = parser.parse_args(argv[1:])
+
+    if len(settings.romg_file) != len(settings.romg_header):
+        sys.stderr.write('Error each romg file needs a matching romg header\n')
+        sys.exit(1)
+    for romgFile in settings.romg_file:
+        if (not os.path.isfile(romgFile)):
+            sys.stderr.write('Error romg file is not a valid file\n')
+            sys.exit(1)
+    for romgHeader in settings.romg_header:
+        if (not os.path.isfile(romgHeader)):
+            sys.stderr.write('Error romg header is not a valid file\n')
+            sys.exit(1)
+    for encryptionKey in settings.encryption_key:
+        if (not os.path.isfile(encryptionKey)):
+            sys.stderr.write('Error encryption key file is not a valid file\n')
+            sys.exit(1)
+    if (not os.path.isfile(settings.signing_key)):
+        sys.stderr.write('Error signing_key file file is not a valid file\n')
+        sys.exit(1)
+
+    settings.romg_header = [os.path.abspath(romgHeader) for romgHeader in settings.romg_header]
+    settings.romg_file = [os.path.abspath(romgFile) for romgFile in settings.romg_file]
+    settings.encryption_key = [os.path.abspath(encryptionKey) for encryptionKey in settings.encryption_key]
+    settings.signing_key = os.path.abspath(settings.signing_key)
+
+    # resolve the key hashes once for every omg, this also parses the keys before any worker is forked
+    encryptionKeyHashes, signatureKeyHash = resolve_key_hashes(settings.encryption_key, settings.signing_key)
+    for encryptionKey in settings.encryption_key:
+        encrypt_data.load_rsa_key(encryptionKey)
+    encrypt_data.load_rsa_key(settings.signing_key)
+
+    jobs = [(romgFile, romgHeader, settings.encryption_key, settings.signing_key, encryptionKeyHashes,
+             signatureKeyHash, settings.output_directory, settings.verbose)
+            for romgFile, romgHeader in zip(settings.romg_file, settings.romg_header)]
+    if len(jobs) == 1 or settings.jobs == 1:
+        results = [_build_omg_job(job) for job in jobs]
+    else:
+        pool = multiprocessing.Pool(min(settings.jobs or multiprocessing.cpu_count(), len(jobs)), _init_worker)
+        try:
+            results = pool.map(_build_omg_job, jobs)
+        finally:
+            pool.close()
+            pool.join()
+
+    ret = 0
+    for (romgFile, _romgHeader), (omgFileName, error) in zip(zip(settings.romg_file, settings.romg_header), results):
+        if omgFileName is not None:
+            print omgFileName
+        else:
+            sys.stderr.write('Error building omg for %s\n%s' % (romgFile, error))
+            ret = 1
+
+    sys.exit(ret)
@@ -0,0 +1,1266 @@
+import argparse
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import tarfile
+import time
+import zlib
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+from uuid import uuid4
+
+from buildtools import integratedcheckromgdeps, yarncache
+
+
+VARIANTS_HELP = """
+The --variants file holds a list of romgs to build, every key is optional and falls back to the matching command
+line option, paths are relative to the variants file:
+
+{"variants": [{"name": "bits", "version": "1.0.0", "branch": "release", "base": "bits-base.tgz",
+               "modules": ["mod-a.tgz", "mod-b.tgz"], "overlays": ["customer.tgz"],
+               "ownership": {"uid": 0, "uname": "root", "gid": 1000, "gname": "bits"},
+               "arch": "aarch64", "targetArch": "arm64"}]}
+
+arch is written to the header (defaults to $OECORE_TARGET_ARCH), targetArch is the arch node modules are built for
+(defaults to $ARCH).  Every distinct module is extracted and built once into the --module-cache (a temp dir if not
+given) and the variants are then assembled concurrently from the cached modules.
+"""
+
+
+def __make_parser():
+    p = argparse.ArgumentParser(description='This packages up modules and a base into a raw omg file',
+                                epilog=VARIANTS_HELP, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument('-n', '--name', type=str, help='the ROMG name (required unless --variants is used)', default=None)
+    p.add_argument('-V', '--version', type=str, help='the ROMG version (required unless --variants is used)',
+                   default=None)
+    p.add_argument('--branch', type=str, help='the ROMG branch', default=None, required=False)
+    p.add_argument('-b', '--base', type=str,
+                   help='the base packaged for the ROMG (required unless --variants is used)', default=None)
+    p.add_argument('-m', '--modules', nargs='+',
+                   help='path(s) to module packages that should be included in the omg. multiple modules separated by \
+                         spaces (required unless --variants is used)', default=None)
+    p.add_argument('-o', '--overlays', nargs='*',
+                   help='path(s) to overlays that should be overlayed in the omg. multiple overlays separated by \
+                         spaces', default=[], required=False)
+    p.add_argument('-d', '--output-directory', type=str,
+                   help='optional output directory if not given CWD will be used', default='./')
+    p.add_argument('-v', '--verbose', action='store_true')
+    p.add_argument('-a', '--pre-package', action='append', dest='pre_package_scripts', default=[],
+                   help='Optional script(s) that will be run just before the romg is packaged that can be used to \
+                         minifiy or tweak modules')
+    p.add_argument('--build-node-modules', action='store_true',
+                   help='if set, "npm run bits:install" will be run on base and all modules')
+    p.add_argument('--omg-format-version', type=int, help='set the format version (1 or 2)', default=1)
+    p.add_argument('--nested-modules', action='store_true',
+                   help='format version 2 only, embed each module tgz unchanged as modules/<name>.tgz in an \
+                         uncompressed romg instead of extracting and recompressing it (modules are expanded on the \
+                         device, cannot be combined with --build-node-modules)')
+    p.add_argument('--yarn-offline', action='store_true',
+                   help='force the package.json to run yarn with --offline flag (this will edit the file with sed)')
+    p.add_argument('-X', '--no-compression', action='store_true',
+                   help='disable compression for the tar bundle (romg file) this is useful if you plan on adding \
+                         overlays at a later time with append-overlay.py')
+    p.add_argument('-O', '--ownership-info',
+                   help='json object with ownership info to set on the OMG at tar time \
+                        example: {"uid": 0, "uname": "root", "gid": 1000, "gname": "bits"} ',
+                   default=None)
+    p.add_argument('--no-dependencies', help="This flag disables dependency checking", action='store_true')
+    p.add_argument('--virtual-staging', action='store_true',
+                   help='write the romg straight from the base, module and overlay archives without extracting \
+                         them to a temp dir, later layers shadow earlier ones.  Cannot be used with module builds, \
+                         pre-package scripts, --dedupe, --manifest, --delta-from or --seekable and package.json \
+                         files are not combined')
+    p.add_argument('--module-cache', type=str, default=None,
+                   help='keep extracted (and built) modules in this dir and hardlink unchanged modules from it \
+                         instead of extracting and building them again, modules are keyed by the sha256 of the \
+                         module tgz, --build-node-modules, --yarn-offline and $ARCH')
+    p.add_argument('--variants', type=str, default=None,
+                   help='json file with a list of romg variants to build in one run, the format is described below')
+    p.add_argument('-j', '--jobs', type=int, default=None,
+                   help='number of variants (and modules) to build concurrently with --variants (default: cpu count)')
+    p.add_argument('--yarn-cache', type=str, default=None,
+                   help='persistent yarn cache dir shared between builds on this host, used with --build-node-modules')
+    p.add_argument('--yarn-cache-size', type=int, default=None,
+                   help='evict the least recently used entries once the --yarn-cache is larger than this (MB)')
+    p.add_argument('--seekable', action='store_true',
+                   help='compress every module and the base as an independent gzip member and write the member \
+                         offsets to the header, see extract-romg.py')
+    p.add_argument('--dedupe', action='store_true',
+                   help='store byte-identical files only once in the romg using tar hardlinks')
+    p.add_argument('--manifest', action='store_true',
+                   help='also write a manifest of the content hash of every file in the romg, it can be used as \
+                         --delta-from for the next release')
+    p.add_argument('--delta-from', type=str, default=None,
+                   help='previous romg (or its manifest) to build a delta romg against, the delta only contains the \
+                         files that were added or changed plus a list of deleted paths')
+    p.add_argument('--delta-base-version', type=str, default=None,
+                   help='version the delta applies to, defaults to the version from the previous manifest or the \
+                         header json next to the previous romg')
+    p.add_argument('--emit-omg', action='store_true',
+                   help='write the encrypted and signed omg directly instead of a romg and header, requires \
+                         --encryption-key and --signing-key')
+    p.add_argument('-e', '--encryption-key', type=str, action='append', default=None,
+                   help='the public key used to encrypt the omg, may be given multiple times for several recipients')
+    p.add_argument('-s', '--signing-key', type=str, help='the private key used to sign the omg', default=None)
+    return p
+
+
+class romgBuilder(object):
+    def __init__(self, logger, tmpDir, name, version, branch=None, omgFormatVersion=1, ownership=None,
+                 virtualStaging=False, arch=None, targetArch=None):
+        self.tmpDir = tmpDir
+        self.logger = logger
+        self.info = {'name': name,
+                     'version': version,
+                     'modules': [],
+                     'overlays': {},
+                     'arch': 'x86_64'}
+        self.deltaPaths = None
+        self.gzipMembers = None
+        self.segments = set()
+        self.nestedModules = None
+        self.moduleCacheDir = None
+        self.moduleCacheHits = set()
+        self.sharedYarnCacheDir = None
+        self.manifest = None
+        self.dedupe = None
+        self.gid = None
+        self.uid = None
+        self.uname = None
+        self.gname = None
+        if branch is not None:
+            self.info['branch'] = branch
+        self.dataDir = 'data'
+        self.overlayDescriptorDir = None
+        if omgFormatVersion == 1:
+            self.moduleDir = os.path.join(self.dataDir, 'base', 'modules', 'modules')
+            self.baseDir = '.'
+            self.stagingDirs = [self.moduleDir]
+        else:
+            self.moduleDir = 'modules'
+            self.baseDir = 'base'
+            self.overlayDescriptorDir = os.path.abspath(os.path.join(self.tmpDir, 'overlays'))
+            self.stagingDirs = [self.moduleDir, self.dataDir, self.baseDir]
+            self.info['uuid'] = str(uuid4())
+        self.yarnCacheDir = os.path.join(self.tmpDir, 'support', 'yarn-cache')
+        self.layers = None
+        if virtualStaging:
+            # nothing is extracted, the input archives are layered on the fly when the romg is written
+            self.layers = []
+        else:
+            for stagingDir in self.stagingDirs:
+                os.makedirs(os.path.abspath(os.path.join(self.tmpDir, stagingDir)))
+        if 'OECORE_TARGET_ARCH' in os.environ:
+            self.info['arch'] = os.environ['OECORE_TARGET_ARCH']
+        if arch is not None:
+            self.info['arch'] = arch
+        # the arch native node modules are built for
+        self.targetArch = targetArch if targetArch is not None else os.environ.get('ARCH')
+        if ownership is not None:
+            self.uid = ownership['uid']
+            self.uname = str(ownership['uname'])
+            self.gid = ownership['gid']
+            self.gname = str(ownership['gname'])
+
+    def __extractTgz(self, tgzPath, relativeDir='.'):
+        extractDir = os.path.abspath(os.path.join(self.tmpDir, relativeDir))
+        self.logger.debug('Extracting %s to %s', tgzPath, extractDir)
+        with tarfile.open(tgzPath, 'r') as tf:
+            tf.extractall(extractDir)
+        self._cleanExtractedTgz(extractDir)
+
+    def __extractJsonFromTgz(self, tgzPath, filepath):
+        with tarfile.open(tgzPath, 'r') as tf:
+            contents = json.loads(tf.extractfile(filepath).read())
+        return contents
+
+    def __readModuleJson(self, moduleTgzPath, moduleJson=None):
+        if moduleJson is None:
+            moduleJson = integratedcheckromgdeps.read_module_json(moduleTgzPath)
+        if 'dependencies' not in moduleJson:
+            moduleJson['dependencies'] = {}
+        return {'name': moduleJson['name'],
+                'version': moduleJson['version'],
+                'dependencies': moduleJson['dependencies']}
+
+    def __readOverlayJson(self, overlayTgzPath):
+        overlayJson = self.__extractJsonFromTgz(overlayTgzPath, 'overlay.json')
+        return {'name': overlayJson['name'], 'version': overlayJson['version']}
+
+    def __get_bits_install(self, moduleDir):
+        package_filename = os.path.abspath(os.path.join(moduleDir, "package.json"))
+        try:
+            with open(package_filename, 'r') as package_file:
+                package_info = json.load(package_file)
+        except IOError as e:
+            self.logger.warning("%s", e)
+            return False
+        return 'bits:install' in package_info.get('scripts', {})
+
+    def __updateYarnCache(self, moduleDir):
+        """
+        This will update the global omg yarn cache dir (yarn-cache) with the cache dir from the module this is done
+        by rsync command to de-duplicate dependencies across all modules, if the module does not have a yarn cache
+        dir at support/yarn-cache this step will be skipped.  If it does exist it will be deleted after syncing to the
+        global omg yarn-cache dir
+        """
+        moduleCacheDir = os.path.join(os.path.abspath(os.path.join(moduleDir, 'support', 'yarn-cache')))
+        if os.path.isdir(moduleCacheDir):
+            p = subprocess.Popen(['rsync', '-a', moduleCacheDir + '/', self.yarnCacheDir + '/'])
+            p.wait()
+            if p.returncode != 0:
+                raise Exception('Failed to sync yarn cache for %s' % (moduleDir))
+            shutil.rmtree(moduleCacheDir)
+
+    def __buildModule(self, moduleDir, force_yarn_offline):
+        moduleCacheDir = os.path.join(os.path.abspath(os.path.join(moduleDir, 'support', 'yarn-cache')))
+        if os.path.isdir(moduleDir) and os.path.isdir(moduleCacheDir):
+            environment = os.environ.copy()
+            if force_yarn_offline:
+                subprocess.call(['sed', '-i', 's/yarn --prod/yarn --prod, --offline/',
+                                os.path.join(moduleDir, 'package.json')])
+            environment['YARN_CACHE_FOLDER'] = moduleCacheDir
+            if self.sharedYarnCacheDir is not None:
+                yarncache.seed(self.sharedYarnCacheDir, moduleCacheDir, os.path.join(moduleDir, 'yarn.lock'))
+            self.logger.debug('Running "bits:install" for %s', moduleDir)
+            cmd = ['npm', 'run', 'bits:install']
+            if self.targetArch is not None and self.targetArch != 'x86':
+                cmd.append('--target_arch=%s' % (self.targetArch))
+            p = subprocess.Popen(cmd, env=environment, cwd=moduleDir)
+            p.wait()
+            if p.returncode != 0:
+                raise Exception('Failed to build yarn for %s\n' % (moduleDir))
+            if self.sharedYarnCacheDir is not None:
+                yarncache.harvest(self.sharedYarnCacheDir, moduleCacheDir)
+            shutil.rmtree(moduleCacheDir)
+
+    def enableSharedYarnCache(self, cacheDir):
+        """
+        Seed the yarn cache of every module build from a persistent host cache (hardlinking the entries the
+        module's yarn.lock needs) and add newly fetched entries back to it after the build
+        """
+        if not os.path.isdir(cacheDir):
+            os.makedirs(cacheDir)
+        self.sharedYarnCacheDir = cacheDir
+
+    def setInstallWaves(self, waves):
+        """
+        Record the dependency ordered install waves in the header, modules within a wave only depend on modules
+        from earlier waves so an installer can start each wave in parallel
+        """
+        self.info['installWaves'] = waves
+
+    def addBase(self, baseTgzPath, baseJson=None):
+        self.logger.debug("Adding base %s", baseTgzPath)
+        baseInfo = self.__readModuleJson(baseTgzPath, baseJson)
+        self.info['base'] = {'name': baseInfo['name'],
+                             'version': baseInfo['version']}
+        self.info['modules'].append(baseInfo)
+        if self.layers is not None:
+            self.layers.append({'type': 'base', 'path': baseTgzPath, 'dir': self.baseDir})
+            return
+        self.__extractTgz(baseTgzPath, self.baseDir)
+
+    def buildBase(self, build_module=False, force_yarn_offline=False):
+        self.logger.debug("Building base")
+        absBaseDir = os.path.join(self.tmpDir, self.baseDir)
+        if build_module and self.layers is not None:
+            raise Exception('Modules cannot be built with virtual staging')
+        if build_module:
+            if self.__get_bits_install(absBaseDir):
+                self.__buildModule(absBaseDir, force_yarn_offline)
+            else:
+                self.logger.warning("Base doesn't contain a 'bits:install' script")
+
+    def enableNestedModules(self):
+        """
+        Keep module archives as-is inside the romg (modules/<name>.tgz) instead of extracting them, the modules are
+        expanded on the device.  Only available for format version 2 which has a separate modules dir.
+        """
+        if self.overlayDescriptorDir is None:
+            raise Exception('Nested modules require omg format version 2')
+        self.nestedModules = set()
+        self.info['moduleLayout'] = 'nested'
+
+    def addModule(self, moduleTgzPath, moduleJson=None):
+        self.logger.debug("Adding module %s", moduleTgzPath)
+        moduleInfo = self.__readModuleJson(moduleTgzPath, moduleJson)
+        self.info['modules'].append(moduleInfo)
+        if self.nestedModules is not None:
+            self.nestedModules.add(str(moduleInfo['name']))
+            relModulePath = os.path.join(self.moduleDir, str(moduleInfo['name']) + '.tgz')
+            if self.layers is not None:
+                self.layers.append({'type': 'file', 'path': moduleTgzPath, 'dir': relModulePath})
+                return
+            self.__stageFile(moduleTgzPath, relModulePath)
+            return
+        relModuleDir = os.path.join(self.moduleDir, str(moduleInfo['name']))
+        if self.layers is not None:
+            self.layers.append({'type': 'module', 'path': moduleTgzPath, 'dir': relModuleDir})
+            return
+        if self.moduleCacheDir is not None:
+            self.moduleCacheKeys[str(moduleInfo['name'])] = key = self.__moduleCacheKey(moduleTgzPath)
+            cachedModuleDir = os.path.join(self.moduleCacheDir, key)
+            if os.path.isdir(cachedModuleDir):
+                self.logger.debug('Using cached module %s', cachedModuleDir)
+                linkTree(cachedModuleDir, os.path.join(self.tmpDir, relModuleDir))
+                self.moduleCacheHits.add(str(moduleInfo['name']))
+                return
+        self.__extractTgz(moduleTgzPath, relModuleDir)
+        if self.moduleCacheDir is not None and not self.moduleCacheFlags['buildNodeModules']:
+            self.__storeCachedModule(str(moduleInfo['name']))
+
+    def enableModuleCache(self, cacheDir, build_module=False, force_yarn_offline=False):
+        """
+        Reuse extracted (and built) module trees across romg builds.  Modules are cached in cacheDir keyed by the
+        sha256 of the module tgz and the build flags, cached trees are hardlinked into the staging dir so files that
+        are about to be modified in place must be unshared first (see __unshareFile).
+        """
+        if not os.path.isdir(cacheDir):
+            os.makedirs(cacheDir)
+        self.moduleCacheDir = cacheDir
+        self.moduleCacheKeys = {}
+        self.moduleCacheFlags = {'buildNodeModules': bool(build_module),
+                                 'yarnOffline': bool(force_yarn_offline),
+                                 'arch': self.targetArch or ''}
+
+    def __moduleCacheKey(self, moduleTgzPath):
+        with open(moduleTgzPath, 'rb') as f:
+            digest = sha256File(f)
+        flags = hashlib.sha256(json.dumps(self.moduleCacheFlags, sort_keys=True)).hexdigest()
+        return '%s-%s' % (digest, flags[:16])
+
+    def __storeCachedModule(self, moduleName):
+        cachedModuleDir = os.path.join(self.moduleCacheDir, self.moduleCacheKeys[moduleName])
+        if os.path.isdir(cachedModuleDir):
+            return
+        self.logger.debug('Caching module %s in %s', moduleName, cachedModuleDir)
+        # link into a private dir first and rename it in place so other builds never see a partial tree
+        tmpCachedModuleDir = tempfile.mkdtemp(prefix=moduleName + '-', dir=self.moduleCacheDir)
+        try:
+            linkTree(os.path.join(self.tmpDir, self.moduleDir, moduleName), tmpCachedModuleDir)
+            os.rename(tmpCachedModuleDir, cachedModuleDir)
+        except OSError:
+            shutil.rmtree(tmpCachedModuleDir, ignore_errors=True)
+            if not os.path.isdir(cachedModuleDir):
+                raise
+
+    def __unshareFile(self, path):
+        """Replace a hardlinked staging file with a private copy so writing to it does not change the cache."""
+        if os.path.isfile(path) and not os.path.islink(path) and os.lstat(path).st_nlink > 1:
+            tmpPath = path + '.unshare'
+            shutil.copy2(path, tmpPath)
+            os.rename(tmpPath, path)
+
+    def unshareStaging(self):
+        """Unshare every hardlinked file in the staging dir, needed before running scripts on the staged romg."""
+        if self.moduleCacheDir is None and self.nestedModules is None:
+            return
+        for dirpath, dirnames, filenames in os.walk(self.tmpDir):
+            for name in filenames:
+                self.__unshareFile(os.path.join(dirpath, name))
+
+    def __stageFile(self, srcPath, relativePath):
+        """Place a file into the staging dir, hardlinked when possible so the contents are never copied."""
+        dstPath = os.path.abspath(os.path.join(self.tmpDir, relativePath))
+        try:
+            os.link(srcPath, dstPath)
+        except OSError:
+            shutil.copy2(srcPath, dstPath)
+
+    def buildModule(self, moduleName, build_module=False, force_yarn_offline=False):
+        self.logger.debug("Building module %s", moduleName)
+        absModuleDir = os.path.join(self.tmpDir, os.path.join(self.moduleDir, moduleName))
+        if self.nestedModules is not None and moduleName in self.nestedModules:
+            self.logger.debug("Module %s is nested, nothing to build", moduleName)
+            return
+        if self.layers is not None:
+            # the yarn cache of virtually staged modules is moved to the shared cache when the romg is written
+            if build_module:
+                raise Exception('Modules cannot be built with virtual staging')
+            return
+        if build_module and moduleName in self.moduleCacheHits:
+            self.logger.debug("Module %s was built by an earlier romg build", moduleName)
+        elif build_module:
+            if self.__get_bits_install(absModuleDir):
+                self.__buildModule(absModuleDir, force_yarn_offline)
+            else:
+                self.logger.warning("Module %s doesn't contain a 'bits:install' script", moduleName)
+            if self.moduleCacheDir is not None:
+                self.__storeCachedModule(moduleName)
+        else:
+            self.__updateYarnCache(absModuleDir)
+
+    def combineNpmPackages(self, build_module=False, force_yarn_offline=False):
+        if self.layers is not None:
+            if build_module:
+                raise Exception('Modules cannot be built with virtual staging')
+            self.logger.debug('Virtual staging, package.json files are not combined')
+            return
+        self.logger.debug("Building shared package.json at %s", self.tmpDir)
+        # cached module trees are shared with builds that may hoist differently so they keep their dependencies
+        report = self.hoistDependencies(build_module and self.moduleCacheDir is None)
+        try:
+            os.makedirs(os.path.abspath(os.path.join(self.tmpDir, 'support', 'yarn-cache')))
+        except OSError as e:
+            if e.errno != os.errno.EEXIST:
+                raise e
+        if build_module:
+            if self.__get_bits_install(self.tmpDir):
+                self.__buildModule(self.tmpDir, force_yarn_offline)
+            else:
+                self.logger.warning("root level package.json doesn't contain a 'bits:install' script")
+        else:
+            self.__updateYarnCache(self.tmpDir)
+        if report['savedInstalls']:
+            # every saved install would have been a copy of the package installed at the root
+            savedBytes = 0
+            for dep, savedInstalls in report['savedInstalls'].iteritems():
+                depDir = os.path.join(self.tmpDir, 'node_modules', dep)
+                if os.path.isdir(depDir):
+                    savedBytes += yarncache.entry_size(depDir) * savedInstalls
+            self.logger.info('Hoisting saved %d installs (%d bytes)', sum(report['savedInstalls'].values()),
+                             savedBytes)
+
+    def __readPackageJson(self, packageDir):
+        try:
+            with open(os.path.join(packageDir, 'package.json'), 'r') as packageFile:
+                return json.load(packageFile, object_pairs_hook=OrderedDict)
+        except IOError:
+            return None
+        except ValueError as e:
+            self.logger.warning('Skipping invalid %s: %s', os.path.join(packageDir, 'package.json'), e)
+            return None
+
+    def __writePackageJson(self, packageDir, packageJson):
+        with open(os.path.join(packageDir, 'package.json'), 'w') as packageFile:
+            packageFile.write(json.dumps(packageJson, indent=2, separators=(',', ': ')) + '\n')
+
+    def hoistDependencies(self, removeHoisted=False):
+        """
+        Combine the dependencies of the base and every module into the root package.json.  The root (the base for
+        format version 1) keeps the range of anything it already depends on, the ranges requested by the packages
+        are then combined with it (most requested first) while semver finds a version meeting all of them.  Packages
+        requesting a range outside of the combined one are reported as conflicts and keep their own install.
+
+        With removeHoisted the hoisted dependencies are removed from the package.json of every package that is
+        installed with "bits:install" so they are installed once at the root, where node finds them from every
+        package below it.  This only happens when the root package.json has a "bits:install" script as well.
+        """
+        report = {'hoisted': [], 'conflicts': [], 'savedInstalls': {}}
+        packages = [(str(self.info['base']['name']), os.path.join(self.tmpDir, self.baseDir))]
+        for module in self.info['modules'][1:]:
+            if self.nestedModules is None or str(module['name']) not in self.nestedModules:
+                packages.append((str(module['name']), os.path.join(self.tmpDir, self.moduleDir, str(module['name']))))
+        packageJsons = {}
+        requested = {}
+        for packageName, packageDir in packages:
+            packageJson = self.__readPackageJson(packageDir)
+            if packageJson is None:
+                continue
+            packageJsons[packageName] = (packageDir, packageJson)
+            for dep, spec in packageJson.get('dependencies', {}).iteritems():
+                requested.setdefault(dep, {}).setdefault(spec.strip(), []).append(packageName)
+        rootJson = self.__readPackageJson(self.tmpDir)
+        if rootJson is None:
+            if os.path.exists(os.path.join(self.tmpDir, 'package.json')):
+                self.logger.warning('Not hoisting dependencies into an invalid root package.json')
+                return report
+            rootJson = OrderedDict([('name', self.info['name']), ('version', self.info['version']), ('private', True)])
+        rootDeps = rootJson.setdefault('dependencies', OrderedDict())
+        # the root installs the hoisted dependencies, without an install script nothing can be removed from a package
+        removeFrom = set()
+        if removeHoisted and 'bits:install' in rootJson.get('scripts', {}):
+            for packageName, (packageDir, packageJson) in packageJsons.iteritems():
+                if (os.path.normpath(packageDir) != os.path.normpath(self.tmpDir) and
+                        'bits:install' in packageJson.get('scripts', {})):
+                    removeFrom.add(packageName)
+        removed = {}
+        for dep in sorted(requested):
+            specs = requested[dep]
+            inRoot = dep in rootDeps
+            combined = [rootDeps[dep].strip()] if inRoot else []
+            for spec in sorted(specs, key=lambda spec: (-len(specs[spec]), spec)):
+                if len(combined) == 0 or integratedcheckromgdeps.intersect_ranges(combined + [spec]) is not None:
+                    combined.append(spec)
+            chosen = rootDeps[dep] = integratedcheckromgdeps.intersect_ranges(combined)
+            hoistedBy = [packageName for spec in combined for packageName in specs.get(spec, [])]
+            if len(hoistedBy) > 1:
+                report['hoisted'].append(dep)
+            for spec, packageNames in sorted(specs.iteritems()):
+                if spec in combined:
+                    continue
+                for packageName in packageNames:
+                    self.logger.warning('Dependency conflict %s: %s requires %s but %s is hoisted', dep, packageName,
+                                        spec, chosen)
+                    report['conflicts'].append({'dependency': dep, 'module': packageName, 'required': spec,
+                                                'hoisted': chosen})
+            removedFrom = [packageName for packageName in hoistedBy if packageName in removeFrom]
+            for packageName in removedFrom:
+                removed.setdefault(packageName, []).append(dep)
+            # each package stops installing its own copy, the root installs one unless it already did
+            savedInstalls = len(removedFrom) - (0 if inRoot else 1)
+            if savedInstalls > 0:
+                report['savedInstalls'][dep] = savedInstalls
+        self.__writePackageJson(self.tmpDir, rootJson)
+        for packageName, deps in sorted(removed.iteritems()):
+            packageDir, packageJson = packageJsons[packageName]
+            self.logger.debug('Removing hoisted dependencies %s from %s', ', '.join(deps), packageName)
+            for dep in deps:
+                del packageJson['dependencies'][dep]
+            self.__writePackageJson(packageDir, packageJson)
+        self.logger.info('Hoisted %d shared dependencies, %d conflicts', len(report['hoisted']),
+                         len(report['conflicts']))
+        return report
+
+    def addOverlay(self, overlayTgzPath):
+        self.logger.debug("Adding overlay %s", overlayTgzPath)
+        overlayInfo = self.__readOverlayJson(overlayTgzPath)
+        self.info['overlays'][overlayInfo['name']] = {'version': overlayInfo['version']}
+        if self.layers is not None:
+            with tarfile.open(overlayTgzPath, 'r') as tf:
+                if any(os.path.normpath(name).split('/')[0] == 'prepackage_scripts' for name in tf.getnames()):
+                    raise Exception('Overlay %s has prepackage_scripts which need a staged romg' % (overlayTgzPath))
+            self.layers.append({'type': 'overlay', 'path': overlayTgzPath, 'dir': '.', 'info': overlayInfo})
+            return
+        if self.moduleCacheDir is not None or self.nestedModules is not None:
+            # extracting writes through existing files, do not let the overlay modify cached or input files
+            with tarfile.open(overlayTgzPath, 'r') as tf:
+                for name in tf.getnames():
+                    self.__unshareFile(os.path.join(self.tmpDir, name))
+        self.__extractTgz(overlayTgzPath)
+        overlayJson = os.path.abspath(os.path.join(self.tmpDir, 'overlay.json'))
+        if os.path.isfile(overlayJson) and self.overlayDescriptorDir is not None:
+            if not os.path.isdir(self.overlayDescriptorDir):
+                os.makedirs(self.overlayDescriptorDir)
+            os.rename(overlayJson,
+                      os.path.join(self.overlayDescriptorDir,
+                                   overlayInfo['name'] + '_' + overlayInfo['version'] + '.json'))
+
+    def __romgBasename(self):
+        if 'branch' in self.info:
+            basename = '%s_%s_%s' % (self.info['name'], self.info['branch'], self.info['version'])
+        else:
+            basename = '%s_%s' % (self.info['name'], self.info['version'])
+        if 'delta' in self.info:
+            basename += '_delta_%s' % (self.info['delta']['baseVersion'])
+        return basename
+
+    def __tarMode(self, mode):
+        if self.gid is not None and self.uid is not None:
+            # no permissions for other
+            mode &= ~0x07
+        return mode
+
+    def buildManifest(self):
+        """
+        Walk the staged romg and return a manifest of every path, regular files are identified by their sha256
+        """
+        self.manifest = manifest = {}
+        for dirpath, dirnames, filenames in os.walk(self.tmpDir):
+            for name in dirnames + filenames:
+                path = os.path.join(dirpath, name)
+                relpath = os.path.relpath(path, self.tmpDir)
+                st = os.lstat(path)
+                if os.path.islink(path):
+                    manifest[relpath] = {'type': 'symlink', 'target': os.readlink(path)}
+                elif os.path.isdir(path):
+                    manifest[relpath] = {'type': 'dir', 'mode': self.__tarMode(st.st_mode & 07777)}
+                else:
+                    with open(path, 'rb') as f:
+                        manifest[relpath] = {'type': 'file', 'sha256': sha256File(f),
+                                             'mode': self.__tarMode(st.st_mode & 07777)}
+        return manifest
+
+    def writeManifest(self, outputDir, manifest=None):
+        if manifest is None:
+            manifest = self.buildManifest()
+        sManifestFilepath = os.path.join(outputDir, self.__romgBasename() + '_manifest.json')
+        self.logger.debug('Writing manifest %s', sManifestFilepath)
+        with open(sManifestFilepath, 'w') as manifestFile:
+            manifestFile.write(json.dumps({'name': self.info['name'], 'version': self.info['version'],
+                                           'files': manifest}, indent=2, separators=(',', ': '), sort_keys=True))
+
+    def setDelta(self, previousManifest, baseVersion, manifest=None):
+        """
+        Restrict the romg to the paths that were added or changed since previousManifest, deleted paths and the
+        version the delta applies to are recorded in the header and in delta.json at the root of the romg
+        """
+        if manifest is None:
+            manifest = self.buildManifest()
+        self.deltaPaths = sorted(path for path, entry in manifest.iteritems() if previousManifest.get(path) != entry)
+        deleted = sorted(path for path in previousManifest if path not in manifest)
+        self.info['delta'] = {'baseVersion': baseVersion, 'deleted': deleted}
+        with open(os.path.join(self.tmpDir, 'delta.json'), 'w') as deltaFile:
+            deltaFile.write(json.dumps(self.info['delta'], indent=2, separators=(',', ': ')))
+        self.deltaPaths.append('delta.json')
+        self.logger.debug('Delta against %s: %d changed, %d deleted', baseVersion, len(self.deltaPaths) - 1,
+                          len(deleted))
+
+    def enableDedupe(self):
+        """
+        Store byte-identical files only once, later copies are written as tar hardlink members pointing at the
+        first copy
+        """
+        self.dedupe = {}
+        self.dedupeSavedBytes = 0
+        self.dedupeFiles = 0
+
+    def __segmentPaths(self):
+        """The paths that get their own gzip member in a seekable romg, every module and the base."""
+        segments = set()
+        if self.baseDir != '.':
+            segments.add(os.path.normpath(self.baseDir))
+        absModuleDir = os.path.join(self.tmpDir, self.moduleDir)
+        if os.path.isdir(absModuleDir):
+            for name in os.listdir(absModuleDir):
+                segments.add(os.path.normpath(os.path.join(self.moduleDir, name)))
+        return segments
+
+    def __addPath(self, tar, path, arcname, recursive=True):
+        relpath = os.path.normpath(arcname)
+        segment = self.gzipMembers is not None and relpath in self.segments
+        if segment:
+            self.gzipMembers.startMember(relpath)
+        tarinfo = self.__tar_chown(tar.gettarinfo(path, arcname))
+        if tarinfo.isreg():
+            linkname = None
+            if self.dedupe is not None:
+                if self.manifest is not None and relpath in self.manifest:
+                    digest = self.manifest[relpath]['sha256']
+                else:
+                    with open(path, 'rb') as f:
+                        digest = sha256File(f)
+                # links never cross gzip members so each member of a seekable romg can be extracted on its own,
+                # the '.' members before and after the segments share a path so they are told apart by number
+                key = (digest, tarinfo.size, tarinfo.mode, tarinfo.uid, tarinfo.gid,
+                       self.gzipMembers.started if self.gzipMembers is not None else None)
+                linkname = self.dedupe.setdefault(key, tarinfo.name)
+            if linkname is not None and linkname != tarinfo.name:
+                self.dedupeSavedBytes += tarinfo.size
+                self.dedupeFiles += 1
+                tarinfo.type = tarfile.LNKTYPE
+                tarinfo.linkname = linkname
+                tarinfo.size = 0
+                tar.addfile(tarinfo)
+            else:
+                with open(path, 'rb') as f:
+                    tar.addfile(tarinfo, f)
+        else:
+            tar.addfile(tarinfo)
+        if recursive and tarinfo.isdir():
+            for name in sorted(os.listdir(path)):
+                self.__addPath(tar, os.path.join(path, name), os.path.join(arcname, name))
+        if segment:
+            self.gzipMembers.startMember('.')
+
+    def __layerPath(self, layer, name):
+        """
+        Map a member of a layer archive to its path in the romg, this mirrors what extracting the layer and the
+        clean up steps of the staged build do to it.  Returns None for members that do not make it into the romg.
+        """
+        name = os.path.normpath(name)
+        if name == '.gitlab' or name.startswith('.gitlab/'):
+            return None
+        inYarnCache = name == os.path.join('support', 'yarn-cache') or name.startswith('support/yarn-cache/')
+        if layer['type'] == 'module' and inYarnCache:
+            # module yarn caches are merged into the shared yarn cache at the root
+            return name
+        if layer['type'] == 'base' and layer['dir'] == '.' and inYarnCache:
+            # the root yarn cache is replaced by the merged module caches
+            return None
+        if layer['type'] == 'overlay' and name == 'overlay.json' and self.overlayDescriptorDir is not None:
+            return os.path.join('overlays', layer['info']['name'] + '_' + layer['info']['version'] + '.json')
+        return os.path.normpath(os.path.join(layer['dir'], name))
+
+    def __addVirtualDir(self, tar, relpath):
+        tarinfo = tarfile.TarInfo('./' if relpath == '.' else './' + relpath)
+        tarinfo.type = tarfile.DIRTYPE
+        # same modes the staging dirs get from mkdtemp and makedirs
+        tarinfo.mode = 0700 if relpath == '.' else 0755
+        tarinfo.mtime = int(time.time())
+        tarinfo.uid = os.getuid()
+        tarinfo.gid = os.getgid()
+        tar.addfile(self.__tar_chown(tarinfo))
+
+    def __addLayers(self, tar):
+        """
+        Stream the base, modules and overlays straight from their archives into the romg.  The layers are written
+        last to first and only the first copy of a path is kept so later layers shadow earlier ones, exactly like
+        extracting them on top of each other.  Duplicate members within one archive are all written as tar
+        extraction already keeps the last one.
+        """
+        emitted = set()
+        for layer in reversed(self.layers):
+            layerEmitted = set()
+            if layer['type'] == 'file':
+                layerEmitted.add(layer['dir'])
+                tarinfo = self.__tar_chown(tar.gettarinfo(layer['path'], './' + layer['dir']))
+                with open(layer['path'], 'rb') as f:
+                    tar.addfile(tarinfo, f)
+            else:
+                with tarfile.open(layer['path'], 'r|*') as layerTar:
+                    for member in layerTar:
+                        relpath = self.__layerPath(layer, member.name)
+                        if relpath is None or (relpath in emitted and relpath not in layerEmitted):
+                            continue
+                        if member.islnk():
+                            linkPath = self.__layerPath(layer, member.linkname)
+                            if linkPath is None:
+                                continue
+                            member.linkname = './' + linkPath
+                        layerEmitted.add(relpath)
+                        data = layerTar.extractfile(member) if member.isreg() else None
+                        member.name = './' if relpath == '.' else './' + relpath
+                        tar.addfile(self.__tar_chown(member), data)
+            emitted.update(layerEmitted)
+        # add the directories the staged build creates which are not in any of the archives
+        dirs = set(['.', 'support'] + self.stagingDirs)
+        for relpath in emitted.union(dirs):
+            while relpath != '.':
+                relpath = os.path.dirname(relpath) or '.'
+                dirs.add(relpath)
+        for relpath in sorted(dirs.difference(emitted)):
+            self.__addVirtualDir(tar, relpath)
+
+    def __addToTar(self, tar):
+        if self.layers is not None:
+            self.__addLayers(tar)
+        elif self.deltaPaths is None:
+            self.__addPath(tar, self.tmpDir, './')
+        else:
+            for relpath in self.deltaPaths:
+                self.__addPath(tar, os.path.join(self.tmpDir, relpath), './' + relpath, recursive=False)
+        if self.dedupe is not None:
+            self.logger.info('Deduplicated %d files saving %d bytes', self.dedupeFiles, self.dedupeSavedBytes)
+
+    def writeRomg(self, outputDir, disableCompression=False, seekable=False):
+        sRomgFilepath = os.path.join(outputDir, self.__romgBasename() + '.romg')
+        sRomgInfoFilepath = os.path.join(outputDir, self.__romgBasename() + '_header.json')
+        self.logger.debug('Outputing to %s %s', sRomgFilepath, sRomgInfoFilepath)
+        if seekable:
+            # every module and the base are compressed as their own gzip member, the member offsets are written
+            # to the header so a reader can seek straight to a module and decompress only that slice
+            self.segments = self.__segmentPaths()
+            with open(sRomgFilepath, 'wb') as romgFile:
+                self.gzipMembers = gzipMemberWriter(romgFile)
+                with tarfile.open(fileobj=self.gzipMembers, mode='w') as tar:
+                    self.gzipMembers.startMember('.')
+                    self.__addToTar(tar)
+                self.gzipMembers.close()
+            self.info['index'] = {'format': 'gzip-members', 'members': self.gzipMembers.members}
+            self.gzipMembers = None
+        else:
+            tarFlags = "w"
+            if not disableCompression:
+                tarFlags += ":gz"
+            with tarfile.open(sRomgFilepath, tarFlags) as tar:
+                self.__addToTar(tar)
+        with open(sRomgInfoFilepath, 'w') as infoFile:
+            infoFile.write(json.dumps(self.info, indent=2, separators=(',', ': ')))
+
+    def writeOmg(self, outputDir, packageOmg, encryptionKeys, signingKey, disableCompression=False):
+        """
+        Write the signed and encrypted omg directly, the tar stream is compressed, encrypted and hashed on the fly
+        so the unencrypted romg never touches the disk.  packageOmg is the buildtools.package_omg module.
+        """
+        sOmgFilepath = os.path.join(outputDir, self.__romgBasename() + '.omg')
+        self.logger.debug('Outputing to %s', sOmgFilepath)
+        encryptionKeyHashes, signatureKeyHash = packageOmg.resolve_key_hashes(encryptionKeys, signingKey)
+        header = packageOmg.add_key_hashes(dict(self.info), encryptionKeyHashes, signatureKeyHash)
+        tarFlags = "w|"
+        if not disableCompression:
+            tarFlags += "gz"
+        try:
+            with open(sOmgFilepath, 'wb') as omgFile:
+                writer = packageOmg.encrypt_data.SignedEncryptWriter(omgFile, encryptionKeys, signingKey,
+                                                                     self.__romgBasename() + '.romg',
+                                                                     packageOmg.omg_header_str(header))
+                with tarfile.open(fileobj=writer, mode=tarFlags) as tar:
+                    self.__addToTar(tar)
+                writer.close()
+        except Exception:
+            if os.path.exists(sOmgFilepath):
+                os.remove(sOmgFilepath)
+            raise
+        return sOmgFilepath
+
+    def __tar_chown(self, tarinfo):
+        if self.gid is not None and self.uid is not None:
+            tarinfo.uid = self.uid
+            tarinfo.gid = self.gid
+            tarinfo.uname = self.uname
+            tarinfo.gname = self.gname
+            tarinfo.mode = self.__tarMode(tarinfo.mode)
+        return tarinfo
+
+    def runPrepackageScripts(self):
+        if self.layers is not None:
+            # overlays with prepackage scripts are refused when they are added
+            return
+        scriptDir = os.path.abspath(os.path.join(self.tmpDir, 'prepackage_scripts'))
+        if os.path.isdir(scriptDir):
+            self.unshareStaging()
+            scripts = [f for f in os.listdir(scriptDir) if os.path.isfile(os.path.join(scriptDir, f))]
+            for scriptName in scripts:
+                scriptPath = os.path.join(scriptDir, scriptName)
+                self.logger.info("Running %s", scriptPath)
+                ret = subprocess.call([scriptPath], cwd=self.tmpDir)
+                if ret != 0:
+                    self.logger.error('Failed to run %s', ret)
+                    raise Exception('Failed to run prepackage hook %s', scriptPath)
+            shutil.rmtree(scriptDir)
+
+    def _cleanExtractedTgz(self, dir):
+        """
+        This cleans up any files we want to ensure do not make it into the final
+        """
+        gitlabDir = os.path.join(dir, ".gitlab")
+        self.logger.debug("Checking for gitlab dir %s", gitlabDir)
+        if os.path.exists(gitlabDir):
+            self.logger.debug("Removing gitlab dir %s", gitlabDir)
+            shutil.rmtree(gitlabDir)
+
+
+class gzipMemberWriter(object):
+    """
+    File like object that writes a gzip file made of independently compressed members (like BGZF).  A new member
+    can be started at any point, the compressed and uncompressed offset and size of every member is recorded in
+    members so readers can seek to a member and decompress just that slice.  The result is still a regular gzip
+    file for any reader that decompresses the whole thing.
+    """
+
+    def __init__(self, fileobj, compresslevel=9):
+        self.fileobj = fileobj
+        self.compresslevel = compresslevel
+        self.offset = 0
+        self.uncompressedOffset = 0
+        self.members = []
+        self.current = None
+        # number of members started, a member started without data is never written but still counts
+        self.started = 0
+        self.compressor = None
+
+    def startMember(self, name):
+        self.__endMember()
+        self.current = name
+        self.started += 1
+
+    def __endMember(self):
+        if self.compressor is None:
+            return
+        self.__out(self.compressor.flush())
+        self.__out(struct.pack('<II', self.crc & 0xffffffff, self.size & 0xffffffff))
+        self.members[-1]['size'] = self.offset - self.members[-1]['offset']
+        self.members[-1]['uncompressedSize'] = self.size
+        self.compressor = None
+
+    def __out(self, data):
+        self.fileobj.write(data)
+        self.offset += len(data)
+
+    def write(self, data):
+        if len(data) == 0:
+            return
+        if self.compressor is None:
+            # members are only started once there is data so empty segments do not produce empty members
+            self.members.append({'path': self.current, 'offset': self.offset,
+                                 'uncompressedOffset': self.uncompressedOffset})
+            self.__out('\037\213\010\000' + struct.pack('<I', 0) + '\002\377')
+            self.compressor = zlib.compressobj(self.compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL,
+                                               0)
+            self.crc = zlib.crc32('')
+            self.size = 0
+        self.crc = zlib.crc32(data, self.crc)
+        self.size += len(data)
+        self.uncompressedOffset += len(data)
+        self.__out(self.compressor.compress(data))
+
+    def tell(self):
+        return self.uncompressedOffset
+
+    def close(self):
+        self.__endMember()
+
+
+def sha256File(f):
+    sha256 = hashlib.sha256()
+    while True:
+        chunk = f.read(64 * 1024)
+        if len(chunk) == 0:
+            break
+        sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def linkTree(srcDir, dstDir):
+    """Recreate the directory tree srcDir at dstDir with every file hardlinked (copied across filesystems)."""
+    for dirpath, dirnames, filenames in os.walk(srcDir):
+        dstPath = os.path.join(dstDir, os.path.relpath(dirpath, srcDir))
+        if not os.path.isdir(dstPath):
+            os.makedirs(dstPath)
+        for name in dirnames + filenames:
+            srcPath = os.path.join(dirpath, name)
+            if os.path.islink(srcPath):
+                os.symlink(os.readlink(srcPath), os.path.join(dstPath, name))
+            elif name in filenames:
+                try:
+                    os.link(srcPath, os.path.join(dstPath, name))
+                except OSError:
+                    shutil.copy2(srcPath, os.path.join(dstPath, name))
+    # directory attributes are set last as adding entries changes the mtime
+    for dirpath, dirnames, filenames in os.walk(srcDir):
+        shutil.copystat(dirpath, os.path.join(dstDir, os.path.relpath(dirpath, srcDir)))
+
+
+def readRomgManifest(romgPath):
+    """
+    Build the manifest of an existing romg from its tar members, in the same form as romgBuilder.buildManifest
+    """
+    manifest = {}
+    with tarfile.open(romgPath, 'r|*') as tar:
+        for member in tar:
+            relpath = os.path.normpath(member.name)
+            if relpath == '.':
+                continue
+            if member.issym():
+                manifest[relpath] = {'type': 'symlink', 'target': member.linkname}
+            elif member.isdir():
+                manifest[relpath] = {'type': 'dir', 'mode': member.mode}
+            elif member.islnk():
+                manifest[relpath] = dict(manifest[os.path.normpath(member.linkname)], mode=member.mode)
+            elif member.isfile():
+                manifest[relpath] = {'type': 'file', 'sha256': sha256File(tar.extractfile(member)),
+                                     'mode': member.mode}
+    return manifest
+
+
+def loadPreviousManifest(path, baseVersion=None):
+    """
+    Load the manifest of a previous release from a manifest json or a romg, returns the manifest and the version
+    the delta will apply to
+    """
+    if path.endswith('.json'):
+        with open(path, 'r') as manifestFile:
+            previous = json.load(manifestFile)
+        return previous['files'], baseVersion or previous['version']
+    if baseVersion is None:
+        headerPath = os.path.splitext(path)[0] + '_header.json'
+        if not os.path.isfile(headerPath):
+            raise Exception('Cannot determine the version of %s, specify --delta-base-version' % (path))
+        with open(headerPath, 'r') as headerFile:
+            baseVersion = json.load(headerFile)['version']
+    return readRomgManifest(path), baseVersion
+
+
+def checkFileArg(fileName, errorStr):
+    if not os.path.exists(fileName):
+        sys.stderr.write(errorStr + ' file not found')
+        sys.exit(1)
+    try:
+        return os.path.abspath(fileName)
+    except Exception:
+        sys.stderr.write(errorStr + ' invlid path')
+        sys.exit(1)
+
+
+def run_pre_package_scripts(scripts, buildDir):
+    print 'Scripts: ', scripts
+    my_env = os.environ.copy()
+
+    for script in scripts:
+        print "Running " + script
+        try:
+            args = script.split(' ')
+            ret = subprocess.call(args, cwd=buildDir, env=my_env)
+            if ret != 0:
+                print 'Failed to run ', ret
+        except Exception as e:
+            print 'Failed to run script ', e
+
+
+def loadVariants(variantsFile, settings):
+    """Read the --variants file and fill in every variant from the command line settings."""
+    with open(variantsFile, 'r') as f:
+        variantsJson = json.load(f)
+    variantsDir = os.path.dirname(os.path.abspath(variantsFile))
+
+    def variantPath(path, errorStr):
+        return checkFileArg(os.path.join(variantsDir, path), errorStr % (path))
+
+    variants = []
+    for variantJson in variantsJson['variants']:
+        variant = {'name': variantJson.get('name', settings.name),
+                   'version': variantJson.get('version', settings.version),
+                   'branch': variantJson.get('branch', settings.branch),
+                   'base': settings.base,
+                   'modules': settings.modules,
+                   'overlays': settings.overlays,
+                   'ownership': variantJson.get('ownership', settings.ownership_info),
+                   'arch': variantJson.get('arch'),
+                   'targetArch': variantJson.get('targetArch')}
+        if 'base' in variantJson:
+            variant['base'] = variantPath(variantJson['base'], 'Invalid argument for base %s')
+        if 'modules' in variantJson:
+            variant['modules'] = [variantPath(modulePath, 'Error invalid module specified %s')
+                                  for modulePath in variantJson['modules']]
+        if 'overlays' in variantJson:
+            variant['overlays'] = [variantPath(overlayPath, 'Error invalid overlay specified %s')
+                                   for overlayPath in variantJson['overlays']]
+        if variant['name'] is None or variant['version'] is None or variant['base'] is None or \
+                variant['modules'] is None:
+            raise Exception('Variant %s needs a name, version, base and modules' % (json.dumps(variantJson)))
+        variants.append(variant)
+    names = [(v['name'], v['branch'], v['version']) for v in variants]
+    if len(set(names)) != len(names):
+        raise Exception('Every variant needs a distinct name, branch and version')
+    return variants
+
+
+def cacheModule(settings, logger, modulePath, targetArch):
+    """Extract (and build) a single module into the module cache."""
+    tmpDir = tempfile.mkdtemp(prefix='romg-module-')
+    try:
+        romg = romgBuilder(logger, tmpDir, 'module-cache', '0', None, settings.omg_format_version,
+                           targetArch=targetArch)
+        romg.enableModuleCache(settings.module_cache, settings.build_node_modules, settings.yarn_offline)
+        if settings.yarn_cache:
+            romg.enableSharedYarnCache(settings.yarn_cache)
+        romg.addModule(modulePath)
+        if settings.build_node_modules:
+            romg.buildModule(str(romg.info['modules'][-1]['name']), settings.build_node_modules,
+                             settings.yarn_offline)
+    finally:
+        shutil.rmtree(tmpDir)
+
+
+def buildRomg(settings, logger, variant, packageOmg=None):
+    """Build a single romg, variant holds the name, version, branch, base, modules, overlays, ownership and arch."""
+    logger.debug("Base: %s Modules: %s Overlays: %s", variant['base'], variant['modules'], variant['overlays'])
+    # read each module.json exactly once and share it between the dependency check and the builder
+    baseJson = integratedcheckromgdeps.read_module_json(variant['base'])
+    moduleJsons = [integratedcheckromgdeps.read_module_json(module) for module in variant['modules']]
+    if settings.no_dependencies:
+        logger.debug("Skipping dependency check...")
+        dependencyReport = integratedcheckromgdeps.resolve_module_deps(baseJson, moduleJsons, check_versions=False)
+    else:
+        logger.debug("Checking module dependencies...")
+        dependencyReport = integratedcheckromgdeps.resolve_module_deps(baseJson, moduleJsons)
+        # logged like the standalone check, its warnings are shown without -v
+        for warning in dependencyReport['warnings']:
+            integratedcheckromgdeps.logger.warning(warning)
+        for error in dependencyReport['errors']:
+            integratedcheckromgdeps.logger.error(error['message'])
+        if not dependencyReport['ok']:
+            raise Exception("ERROR: Module dependencies not properly met. "
+                            "If this is intentional rerun with --no-dependencies.")
+    tmpDir = tempfile.mkdtemp(prefix='romg-')
+    logger.debug('Using temp dir %s', tmpDir)
+    try:
+        romg = romgBuilder(logger, tmpDir, variant['name'], variant['version'], variant['branch'],
+                           settings.omg_format_version, variant['ownership'], settings.virtual_staging, variant['arch'],
+                           variant['targetArch'])
+        if not dependencyReport['cycles']:
+            romg.setInstallWaves(dependencyReport['waves'])
+        if settings.nested_modules:
+            romg.enableNestedModules()
+        if settings.module_cache:
+            romg.enableModuleCache(settings.module_cache, settings.build_node_modules, settings.yarn_offline)
+        if settings.yarn_cache:
+            romg.enableSharedYarnCache(settings.yarn_cache)
+        romg.addBase(variant['base'], baseJson)
+        for module, moduleJson in zip(variant['modules'], moduleJsons):
+            romg.addModule(module, moduleJson)
+        romg.combineNpmPackages(settings.build_node_modules, settings.yarn_offline)
+        romg.buildBase(settings.build_node_modules, settings.yarn_offline)
+        for module in romg.info['modules']:
+            if(str(module['name']) != 'bits-base'):
+                romg.buildModule(str(module['name']), settings.build_node_modules, settings.yarn_offline)
+        for overlay in variant['overlays']:
+            romg.addOverlay(overlay)
+        # run pre-package scripts specified by the command line
+        if settings.pre_package_scripts:
+            romg.unshareStaging()
+        run_pre_package_scripts(settings.pre_package_scripts, tmpDir)
+        # run any pre-package scripts in overlays
+        romg.runPrepackageScripts()
+        if settings.dedupe:
+            romg.enableDedupe()
+        if settings.manifest or settings.delta_from:
+            manifest = romg.buildManifest()
+            if settings.manifest:
+                romg.writeManifest(settings.output_directory, manifest)
+            if settings.delta_from:
+                previousManifest, baseVersion = loadPreviousManifest(settings.delta_from, settings.delta_base_version)
+                romg.setDelta(previousManifest, baseVersion, manifest)
+        if packageOmg is not None:
+            print romg.writeOmg(settings.output_directory, packageOmg, settings.encryption_key, settings.signing_key,
+                                settings.no_compression)
+        else:
+            romg.writeRomg(settings.output_directory, settings.no_compression, settings.seekable)
+    finally:
+        # clean up temp dir
+        shutil.rmtree(tmpDir)
+
+
+def evictSharedYarnCache(settings):
+    if settings.yarn_cache and settings.yarn_cache_size is not None:
+        yarncache.evict(settings.yarn_cache, settings.yarn_cache_size * 1024 * 1024)
+
+
+def runJob(func, *args):
+    """
+    Run func in a pool worker, a SystemExit is turned into an exception because the python 2.7 ThreadPool only passes
+    on an Exception to result.get(), any other exception kills the worker and the result is never set
+    """
+    try:
+        return func(*args)
+    except SystemExit as e:
+        raise Exception('%s exited with %s' % (func.__name__, e.code))
+
+
+def buildVariants(settings, logger, variants, packageOmg=None):
+    """Build every distinct module of the variants once then build the variants concurrently, returns the failures."""
+    jobs = settings.jobs or multiprocessing.cpu_count()
+    # modules are staged from the cache which is filled first so no module is built twice
+    distinctModules = sorted(set((module, variant['targetArch'] if variant['targetArch'] is not None
+                                  else os.environ.get('ARCH'))
+                                 for variant in variants for module in variant['modules']))
+    pool = ThreadPool(jobs)
+    failures = []
+    try:
+        failedModules = set()
+        if not settings.nested_modules:
+            results = [(module, pool.apply_async(runJob, (cacheModule, settings, logger, module, targetArch)))
+                       for module, targetArch in distinctModules]
+            for module, result in results:
+                try:
+                    result.get()
+                except Exception as e:
+                    logger.error('Failed to build module %s: %s', module, e)
+                    failedModules.add(module)
+        results = []
+        for variant in variants:
+            if failedModules.intersection(variant['modules']):
+                logger.error('Skipping variant %s %s, one of its modules failed to build', variant['name'],
+                             variant['version'])
+                failures.append(variant)
+            else:
+                results.append((variant, pool.apply_async(runJob, (buildRomg, settings, logger, variant, packageOmg))))
+        for variant, result in results:
+            try:
+                result.get()
+            except Exception as e:
+                logger.error('Failed to build variant %s %s: %s', variant['name'], variant['version'], e)
+                failures.append(variant)
+    finally:
+        pool.close()
+        pool.join()
+    return failures
+
+
+def __main(argv):
+    parser = __make_parser()
+    settings = parser.parse_args(argv[1:])
+    logger = logging.Logger('package-romg')
+    sh = logging.StreamHandler()
+    if settings.verbose:
+        sh.setLevel(logging.DEBUG)
+    else:
+        sh.setLevel(logging.ERROR)
+    logger.addHandler(sh)
+    # the dependency check reports at WARN like the standalone integratedcheckromgdeps
+    checkHandler = logging.StreamHandler()
+    checkHandler.setLevel(logging.DEBUG if settings.verbose else logging.WARN)
+    integratedcheckromgdeps.logger.addHandler(checkHandler)
+    if settings.variants is None and (settings.name is None or settings.version is None or settings.base is None or
+                                      settings.modules is None):
+        logger.error('--name, --version, --base and --modules are required unless --variants is used\n\n')
+        parser.print_help()
+        sys.exit(1)
+    if settings.variants is not None and (settings.delta_from or settings.virtual_staging):
+        logger.error('--variants cannot be used with --delta-from or --virtual-staging\n\n')
+        parser.print_help()
+        sys.exit(1)
+    # get absolute paths and check file inputs for existence
+    if settings.base is not None:
+        settings.base = checkFileArg(settings.base, 'Invalid argument for base %s' % (settings.base))
+    if settings.modules is not None:
+        settings.modules = [checkFileArg(modulePath, 'Error invalid module specified %s' %
+                                         modulePath) for modulePath in settings.modules]
+    settings.overlays = [checkFileArg(overlayPath, 'Error invalid overlay specified %s' %
+                                      (overlayPath)) for overlayPath in settings.overlays]
+    settings.output_directory = checkFileArg(settings.output_directory, 'Error invalid output dir')
+    if settings.nested_modules:
+        if settings.omg_format_version != 2 or settings.build_node_modules:
+            logger.error('--nested-modules requires --omg-format-version 2 and cannot be used with '
+                         '--build-node-modules\n\n')
+            parser.print_help()
+            sys.exit(1)
+        # the module archives are already compressed, compressing them again only costs time
+        settings.no_compression = True
+    # a delta romg adds changed files one by one so a module would never start a gzip member of its own
+    if settings.seekable and (settings.no_compression or settings.emit_omg or settings.delta_from):
+        logger.error('--seekable cannot be used with an uncompressed romg, --emit-omg or --delta-from\n\n')
+        parser.print_help()
+        sys.exit(1)
+    if settings.virtual_staging and (settings.build_node_modules or settings.pre_package_scripts or settings.dedupe or
+                                     settings.manifest or settings.delta_from or settings.seekable or
+                                     settings.module_cache):
+        logger.error('--virtual-staging cannot be used with --build-node-modules, --pre-package, --dedupe, '
+                     '--manifest, --delta-from, --seekable or --module-cache\n\n')
+        parser.print_help()
+        sys.exit(1)
+    if settings.module_cache:
+        settings.module_cache = os.path.abspath(settings.module_cache)
+    if settings.yarn_cache:
+        settings.yarn_cache = os.path.abspath(settings.yarn_cache)
+    if settings.delta_from:
+        settings.delta_from = checkFileArg(settings.delta_from, 'Error invalid previous romg or manifest')
+    packageOmg = None
+    if settings.emit_omg:
+        if settings.encryption_key is None or settings.signing_key is None:
+            logger.error('--emit-omg requires --encryption-key and --signing-key\n\n')
+            parser.print_help()
+            sys.exit(1)
+        settings.encryption_key = [checkFileArg(encryptionKey, 'Error invalid encryption key')
+                                   for encryptionKey in settings.encryption_key]
+        settings.signing_key = checkFileArg(settings.signing_key, 'Error invalid signing key')
+        # only --emit-omg needs package-omg and pycrypto
+        from buildtools import package_omg as packageOmg
+    if settings.ownership_info:
+        try:
+            settings.ownership_info = json.loads(settings.ownership_info)
+        except ValueError:
+            logger.error('Could not parse ownership info: %s\n\n', settings.ownership_info)
+            parser.print_help()
+            sys.exit(1)
+    if settings.variants:
+        variantsTmpDir = None
+        if settings.module_cache is None:
+            variantsTmpDir = settings.module_cache = tempfile.mkdtemp(prefix='romg-modules-')
+        try:
+            failures = buildVariants(settings, logger, loadVariants(settings.variants, settings), packageOmg)
+        finally:
+            if variantsTmpDir is not None:
+                shutil.rmtree(variantsTmpDir)
+        evictSharedYarnCache(settings)
+        sys.exit(1 if failures else 0)
+    buildRomg(settings, logger, {'name': settings.name,
+                                 'version': settings.version,
+                                 'branch': settings.branch,
+                                 'base': settings.base,
+                                 'modules': settings.modules,
+                                 'overlays': settings.overlays,
+                                 'ownership': settings.ownership_info,
+                                 'arch': None,
+                                 'targetArch': None}, packageOmg)
+    evictSharedYarnCache(settings)
+    sys.exit(0)
@@ -0,0 +1,152 @@
+"""Utility to share a persistent yarn cache between module builds on the same host.
+
+The host cache holds yarn cache entries (the per package directories in the yarn cache folder).  Before a build the
+entries referenced by the yarn.lock of the module are hardlinked into the build's yarn cache, after the build the
+build's yarn cache is pruned to the entries the yarn.lock references and any newly fetched entries are added to the
+host cache.  The host cache is kept below a size limit by removing the least recently used entries.
+"""
+import os
+import re
+import shutil
+import tempfile
+
+RESOLVED_HASH_RE = re.compile(r'#([0-9a-f]{40})"?\s*$')
+ENTRY_HASH_RE = re.compile(r'-([0-9a-f]{40})(-integrity)?$')
+VERSION_DIR_RE = re.compile(r'^v\d+$')
+
+
+def lockfile_hashes(lockfile):
+    """Return the set of package hashes (from the resolved urls) referenced by a yarn.lock, None without one."""
+    if lockfile is None or not os.path.isfile(lockfile):
+        return None
+    hashes = set()
+    with open(lockfile, 'r') as f:
+        for line in f:
+            if line.strip().startswith('resolved'):
+                match = RESOLVED_HASH_RE.search(line)
+                if match is not None:
+                    hashes.add(match.group(1))
+    return hashes
+
+
+def entries(cache_dir):
+    """Return a dict of relative path to absolute path of every entry in a yarn cache folder."""
+    found = {}
+    if not os.path.isdir(cache_dir):
+        return found
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.startswith('.'):
+            continue
+        if VERSION_DIR_RE.match(name) and os.path.isdir(path):
+            for entry in os.listdir(path):
+                if not entry.startswith('.'):
+                    found[os.path.join(name, entry)] = os.path.join(path, entry)
+        else:
+            found[name] = path
+    return found
+
+
+def entry_hash(relpath):
+    match = ENTRY_HASH_RE.search(os.path.basename(relpath))
+    return match.group(1) if match is not None else None
+
+
+def link_entry(src, dst):
+    """Hardlink an entry (a directory tree or a single file) to dst, copying across filesystems."""
+    if os.path.isdir(src):
+        for dirpath, dirnames, filenames in os.walk(src):
+            dstdir = os.path.join(dst, os.path.relpath(dirpath, src))
+            if not os.path.isdir(dstdir):
+                os.makedirs(dstdir)
+            for name in filenames:
+                link_entry(os.path.join(dirpath, name), os.path.join(dstdir, name))
+    else:
+        if not os.path.isdir(os.path.dirname(dst)):
+            os.makedirs(os.path.dirname(dst))
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy2(src, dst)
+
+
+def seed(host_cache_dir, build_cache_dir, lockfile):
+    """Link the host cache entries referenced by lockfile into build_cache_dir, returns the number of entries."""
+    hashes = lockfile_hashes(lockfile)
+    if not hashes:
+        return 0
+    existing = entries(build_cache_dir)
+    seeded = 0
+    for relpath, path in entries(host_cache_dir).iteritems():
+        if relpath not in existing and entry_hash(relpath) in hashes:
+            link_entry(path, os.path.join(build_cache_dir, relpath))
+            # mark the entry as recently used for eviction
+            os.utime(path, None)
+            seeded += 1
+    return seeded
+
+
+def prune(build_cache_dir, lockfile):
+    """Remove the entries yarn.lock does not reference from build_cache_dir, returns the number removed."""
+    hashes = lockfile_hashes(lockfile)
+    if hashes is None:
+        return 0
+    removed = 0
+    for relpath, path in entries(build_cache_dir).iteritems():
+        if entry_hash(relpath) is not None and entry_hash(relpath) not in hashes:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+            removed += 1
+    return removed
+
+
+def harvest(host_cache_dir, build_cache_dir):
+    """Add the entries of build_cache_dir that the host cache does not have yet, returns the number added."""
+    existing = entries(host_cache_dir)
+    added = 0
+    for relpath, path in entries(build_cache_dir).iteritems():
+        if relpath in existing:
+            continue
+        dst = os.path.join(host_cache_dir, relpath)
+        if not os.path.isdir(os.path.dirname(dst)):
+            os.makedirs(os.path.dirname(dst))
+        # link into a private path and rename it in place so concurrent builds never seed a partial entry
+        tmp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=host_cache_dir)
+        try:
+            link_entry(path, os.path.join(tmp_dir, 'entry'))
+            os.rename(os.path.join(tmp_dir, 'entry'), dst)
+            added += 1
+        except OSError:
+            if not os.path.exists(dst):
+                raise
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    return added
+
+
+def entry_size(path):
+    if not os.path.isdir(path):
+        return os.lstat(path).st_size
+    size = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        for name in filenames:
+            size += os.lstat(os.path.join(dirpath, name)).st_size
+    return size
+
+
+def evict(host_cache_dir, max_size):
+    """Remove the least recently used entries until the host cache is at most max_size bytes, returns bytes freed."""
+    found = [(os.stat(path).st_mtime, entry_size(path), path) for path in entries(host_cache_dir).itervalues()]
+    total = sum(size for _mtime, size, _path in found)
+    freed = 0
+    for _mtime, size, path in sorted(found):
+        if total - freed <= max_size:
+            break
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+        freed += size
+    return freed
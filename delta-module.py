@@ -0,0 +1,14 @@
+#!/usr/bin/python
+# delta-module.py is kept for existing callers, the tool is buildtools/delta_module.py
+# and is also run as:
+#   build-tools delta-module [args ...]
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+import buildtools  # noqa: E402
+
+if __name__ == "__main__":
+    buildtools.run('delta-module', sys.argv)
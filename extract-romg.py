@@ -0,0 +1,14 @@
+#!/usr/bin/python
+# extract-romg.py is kept for existing callers, the tool is buildtools/extract_romg.py
+# and is also run as:
+#   build-tools extract-romg [args ...]
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+import buildtools  # noqa: E402
+
+if __name__ == "__main__":
+    buildtools.run('extract-romg', sys.argv)